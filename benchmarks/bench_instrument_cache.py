@@ -0,0 +1,68 @@
+"""Benchmark of the memory the instrument cache holds for conversions of an instrument, and the cost of a cache hit.
+
+Several target versions of one instrument usually convert to the same body, and are cached once. The benchmark caches
+conversions to several versions, half of them identical, with and without compression, and reports the memory held
+and the time to read and parse a cached conversion.
+
+Run with ``make benchmark`` or ``python -m benchmarks.bench_instrument_cache``.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+from eq_cir_proxy_service.config.settings import load_settings
+from eq_cir_proxy_service.services.instrument.cache import InstrumentCache
+
+ITERATIONS = 50
+SECTION_COUNT = 2_000
+TARGET_VERSIONS = ("2.0.0", "2.1.0", "2.2.0", "3.0.0")
+
+
+def build_body(version: str) -> bytes:
+    """Builds a large converted instrument body, roughly the size of a big CIR instrument."""
+    sections = [
+        {"id": f"section-{i}", "questions": [{"id": f"question-{i}-{j}", "text": "q" * 100} for j in range(5)]}
+        for i in range(SECTION_COUNT)
+    ]
+    return json.dumps({"validator_version": version, "title": "Benchmark", "sections": sections}).encode()
+
+
+async def measure(*, compression_enabled: bool) -> tuple[int, int, float]:
+    """Caches the conversions and returns the bytes they would take as received, the bytes held, and seconds per hit."""
+    settings = load_settings(
+        {
+            "CIR_API_BASE_URL": os.getenv("CIR_API_BASE_URL", "http://localhost"),
+            "CONVERTER_SERVICE_API_BASE_URL": os.getenv("CONVERTER_SERVICE_API_BASE_URL", "http://localhost"),
+            "CACHE_COMPRESSION_ENABLED": str(compression_enabled),
+        },
+    )
+    instrument_cache = InstrumentCache(settings)
+    received = 0
+    for target_version in TARGET_VERSIONS:
+        # Minor versions convert to the same body as the major version they belong to.
+        body = build_body(f"{target_version.partition('.')[0]}.0.0")
+        received += len(body)
+        instrument_cache.store_conversion("instrument", f"hash:{target_version}", body)
+
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        json.loads(await instrument_cache.get_conversion("instrument", f"hash:{TARGET_VERSIONS[0]}") or b"")
+    return received, instrument_cache.conversions.size, (time.perf_counter() - started) / ITERATIONS
+
+
+def main() -> None:
+    """Run the benchmark and write the memory held and cost per hit, with and without compression, to stdout."""
+    for compression_enabled in (False, True):
+        received, held, seconds = asyncio.run(measure(compression_enabled=compression_enabled))
+        label = "compressed" if compression_enabled else "uncompressed"
+        sys.stdout.write(
+            f"{label:>13}: {received / 1024 / 1024:.1f} MiB received, {held / 1024 / 1024:.2f} MiB held, "
+            f"{seconds * 1000:.1f} ms/hit\n",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark of answering a metadata request from the index, compared with parsing the cached instrument.
+
+Run with ``make benchmark`` or ``python -m benchmarks.bench_instrument_metadata``.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import timeit
+from uuid import uuid4
+
+from eq_cir_proxy_service.config.settings import load_settings
+from eq_cir_proxy_service.services.instrument import retrieval
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+
+ITERATIONS = 1_000
+SECTION_COUNT = 2_000
+
+
+def build_body() -> bytes:
+    """Builds a large instrument body, roughly the size of a big CIR instrument."""
+    sections = [
+        {"id": f"section-{i}", "questions": [{"id": f"question-{i}-{j}", "text": "q" * 100} for j in range(5)]}
+        for i in range(SECTION_COUNT)
+    ]
+    return json.dumps({"validator_version": "1.0.0", "title": "Benchmark", "sections": sections}).encode()
+
+
+def main() -> None:
+    """Run the benchmark and write the per-request cost of each path to stdout."""
+    settings = load_settings(
+        {
+            "CIR_API_BASE_URL": os.getenv("CIR_API_BASE_URL", "http://localhost"),
+            "CONVERTER_SERVICE_API_BASE_URL": os.getenv("CONVERTER_SERVICE_API_BASE_URL", "http://localhost"),
+        },
+    )
+    instrument_id = uuid4()
+    body = build_body()
+    get_instrument_cache(settings).store(str(instrument_id), json.loads(body), body)
+
+    # cached_metadata is a coroutine function, so each iteration runs it to completion on the same event loop.
+    with asyncio.Runner() as runner:
+        results = {
+            "parse body": timeit.timeit(lambda: json.loads(body)["validator_version"], number=ITERATIONS),
+            "metadata": timeit.timeit(
+                lambda: runner.run(retrieval.cached_metadata(instrument_id, settings)),
+                number=ITERATIONS,
+            ),
+        }
+    sys.stdout.write(f"instrument size: {len(body) / 1024 / 1024:.1f} MiB\n")
+    for name, seconds in results.items():
+        sys.stdout.write(f"{name:>15}: {seconds / ITERATIONS * 1_000_000:.1f} µs/request\n")
+    sys.stdout.write(f"{'speedup':>15}: {results['parse body'] / results['metadata']:.0f}x\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark of serving a stream of invalid requests, as a scanner or broken client would send.
+
+Drives ``main.app`` in process with bad versions (400), unknown routes (404) and bad instrument IDs (422), first with
+every error event logged and every error body rendered, then with the rate-limited error log and precomputed error
+bodies. Log output is written to os.devnull, so the difference is the cost of formatting rather than of the terminal.
+
+Run with ``make benchmark`` or ``python -m benchmarks.bench_invalid_requests``.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from uuid import uuid4
+
+import httpx
+
+os.environ.setdefault("CIR_API_BASE_URL", "http://localhost")
+os.environ.setdefault("CONVERTER_SERVICE_API_BASE_URL", "http://localhost")
+
+# pylint: disable=wrong-import-position,protected-access
+from eq_cir_proxy_service.exceptions import error_responses
+from eq_cir_proxy_service.main import app
+from eq_cir_proxy_service.utils import error_log
+
+REQUESTS = 3_000
+CONCURRENCY = 32
+INVALID_PATHS = (
+    f"/instrument/{uuid4()}?version=not-a-version",
+    "/instrument",
+    "/instrument/not-a-uuid?version=1.0.0",
+)
+
+
+@contextmanager
+def unlimited_error_handling() -> Iterator[None]:
+    """Logs every error event and renders every error body, as the service did before either was optimised."""
+    max_events, bodies = error_log.MAX_EVENTS_PER_WINDOW, error_responses._PRECOMPUTED_BODIES  # noqa: SLF001
+    error_log.MAX_EVENTS_PER_WINDOW = sys.maxsize
+    error_responses._PRECOMPUTED_BODIES = {}  # noqa: SLF001
+    try:
+        yield
+    finally:
+        error_log.MAX_EVENTS_PER_WINDOW = max_events
+        error_responses._PRECOMPUTED_BODIES = bodies  # noqa: SLF001
+
+
+async def drive() -> float:
+    """Sends REQUESTS invalid requests from CONCURRENCY clients, returning the requests served per second."""
+    error_log.reset()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(REQUESTS))
+
+        async def worker() -> None:
+            for index in remaining:
+                await client.get(INVALID_PATHS[index % len(INVALID_PATHS)])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        return REQUESTS / (time.perf_counter() - started)
+
+
+def main() -> None:
+    """Run both configurations and write their throughput to stdout."""
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(devnull)
+        with unlimited_error_handling():
+            unlimited = asyncio.run(drive())
+        limited = asyncio.run(drive())
+
+    sys.stdout.write(f"{'every error logged':>30}: {unlimited:>8.0f} req/s\n")
+    sys.stdout.write(f"{'rate-limited, precomputed':>30}: {limited:>8.0f} req/s\n")
+    sys.stdout.write(f"{'speedup':>30}: {limited / unlimited:>8.2f}x\n")
+
+
+if __name__ == "__main__":
+    main()
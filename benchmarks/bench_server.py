@@ -0,0 +1,107 @@
+"""Benchmark comparing production server configurations.
+
+Starts the service under each configuration with ``python -m eq_cir_proxy_service.server``, drives it with
+concurrent requests to ``/status`` and reports throughput and latency percentiles. The tuned configuration only
+differs from the baseline when uvloop and httptools are installed and more than one CPU is available.
+
+Run with ``make benchmark`` or ``python -m benchmarks.bench_server``.
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import closing
+
+import httpx
+
+DURATION_SECONDS = 5.0
+CONCURRENCY = 64
+STARTUP_TIMEOUT_SECONDS = 30.0
+
+CONFIGURATIONS = {
+    "baseline (1 worker, asyncio, h11)": ["--workers", "1", "--loop", "asyncio", "--http", "h11"],
+    "tuned (CPU workers, auto loop/parser)": ["--workers", str(os.cpu_count() or 1)],
+}
+
+
+def free_port() -> int:
+    """Returns a free local TCP port."""
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+async def wait_until_ready(client: httpx.AsyncClient) -> None:
+    """Polls /status until the server responds."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/status")
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+        else:
+            return
+    error_message = "Server did not start in time"
+    raise RuntimeError(error_message)
+
+
+async def drive(base_url: str) -> list[float]:
+    """Sends requests from CONCURRENCY clients for DURATION_SECONDS, returning every request's latency."""
+    latencies: list[float] = []
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        await wait_until_ready(client)
+        stop_at = time.monotonic() + DURATION_SECONDS
+
+        async def worker() -> None:
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                await client.get("/status")
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return latencies
+
+
+def run_configuration(flags: list[str]) -> list[float]:
+    """Runs one server configuration and returns the observed latencies."""
+    port = free_port()
+    env = os.environ | {
+        "CIR_API_BASE_URL": os.getenv("CIR_API_BASE_URL", "http://localhost"),
+        "CONVERTER_SERVICE_API_BASE_URL": os.getenv("CONVERTER_SERVICE_API_BASE_URL", "http://localhost"),
+        # More than one worker is refused while conversion jobs, which are kept per process, are enabled.
+        "CONVERSION_JOBS_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    command = [sys.executable, "-m", "eq_cir_proxy_service.server", "--host", "127.0.0.1", "--port", str(port)]
+    with subprocess.Popen(  # noqa: S603 - fixed command built from sys.executable
+        [*command, *flags],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as process:
+        try:
+            return asyncio.run(drive(f"http://127.0.0.1:{port}"))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main() -> None:
+    """Run every configuration and write a comparison to stdout."""
+    for name, flags in CONFIGURATIONS.items():
+        latencies = sorted(run_configuration(flags))
+        p99 = latencies[int(len(latencies) * 0.99)]
+        sys.stdout.write(
+            f"{name:<40} {len(latencies) / DURATION_SECONDS:>9.0f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:6.2f} ms  p99 {p99 * 1000:6.2f} ms\n",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Benchmark of per-request version parsing, comparing plain semver parsing with the memoized parser.
+
+Run with ``make benchmark`` or ``python -m benchmarks.bench_version_parsing``.
+"""
+
+import sys
+import timeit
+
+from semver import Version
+
+from eq_cir_proxy_service.utils.version import is_valid_version, parse_version
+
+ITERATIONS = 100_000
+TARGET_VERSION = "2.1.0"
+INSTRUMENT_VERSION = "1.0.0"
+
+
+def uncached_request() -> None:
+    """The pre-memoization hot path: validate the target, then parse both versions again."""
+    Version.is_valid(TARGET_VERSION)
+    Version.parse(INSTRUMENT_VERSION)
+    Version.parse(TARGET_VERSION)
+
+
+def cached_request() -> None:
+    """The memoized hot path shared by the validator and the conversion service."""
+    is_valid_version(TARGET_VERSION)
+    parse_version(INSTRUMENT_VERSION)
+    parse_version(TARGET_VERSION)
+
+
+def main() -> None:
+    """Run the benchmark and write the per-request cost of each path to stdout."""
+    results = {
+        "uncached": timeit.timeit(uncached_request, number=ITERATIONS),
+        "cached": timeit.timeit(cached_request, number=ITERATIONS),
+    }
+    for name, seconds in results.items():
+        sys.stdout.write(f"{name:>9}: {seconds / ITERATIONS * 1_000_000:.3f} µs/request\n")
+    sys.stdout.write(f"  speedup: {results['uncached'] / results['cached']:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
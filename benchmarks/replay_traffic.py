@@ -0,0 +1,236 @@
+"""Replays recorded traffic against ``main.app``, with local stand-ins for CIR and the Converter Service.
+
+Record traffic by setting TRAFFIC_RECORDING_DIR, then replay one of the files written there:
+
+    python -m benchmarks.replay_traffic traffic-1234-abcd.jsonl --speed 2
+
+Requests are sent to the application in process, at their recorded arrival times divided by the speed. The
+application calls the stand-ins over local HTTP connections, so its connection pools, limiters and caches work as they
+do in production. The stand-in CIR answers every anonymous instrument ID with a synthetic instrument, at the lowest
+version the recording asked for it at, or with a 404 if CIR did not find it when the traffic was recorded. The
+stand-in Converter Service sets the requested version. Each answers after a fixed delay.
+
+The report compares latency percentiles with the recorded ones, counts statuses that differ from the recording, and
+gives the caches' hit ratios and the number of upstream calls. The service's configuration is read from the
+environment, apart from the upstream URLs, so caching and pooling settings can be compared by replaying the same
+recording with different settings.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from benchmarks.bench_server import free_port
+from eq_cir_proxy_service.config.settings import Settings, get_settings
+from eq_cir_proxy_service.main import app
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.traffic_recording import RecordedRequest, read_recording
+from eq_cir_proxy_service.utils.version import parse_version
+
+# Sent in place of instrument IDs that were not valid UUIDs when recorded, so they are rejected again.
+INVALID_INSTRUMENT_ID = "not-a-uuid"
+DEFAULT_SOURCE_VERSION = "1.0.0"
+CACHES = ("instrument", "instrument_metadata", "instrument_not_found", "conversion")
+PERCENTILES = (0.5, 0.9, 0.99)
+# Long enough for requests queued behind an overloaded service to be answered rather than abandoned.
+REQUEST_TIMEOUT_SECONDS = 300.0
+
+
+def source_versions(recording: list[RecordedRequest]) -> dict[str, str]:
+    """Returns the lowest valid version each instrument was requested at, which the stand-in CIR serves it at."""
+    versions: dict[str, list[str]] = defaultdict(list)
+    for request in recording:
+        if request.instrument_id is not None and request.version is not None:
+            try:
+                parse_version(request.version)
+            except ValueError:
+                continue
+            versions[request.instrument_id].append(request.version)
+    return {instrument_id: min(requested, key=parse_version) for instrument_id, requested in versions.items()}
+
+
+def missing_instruments(recording: list[RecordedRequest]) -> set[str]:
+    """Returns the instruments every recorded request for which was answered with a 404."""
+    statuses: dict[str, set[int]] = defaultdict(set)
+    for request in recording:
+        if request.instrument_id is not None:
+            statuses[request.instrument_id].add(request.status)
+    return {instrument_id for instrument_id, seen in statuses.items() if seen == {404}}
+
+
+class StandIns:  # pylint: disable=too-few-public-methods
+    """Stand-ins for CIR and the Converter Service, serving the recording's instruments and counting their calls."""
+
+    def __init__(self, recording: list[RecordedRequest], settings: Settings, arguments: argparse.Namespace) -> None:
+        """Initialise the stand-ins' applications."""
+        self.versions = source_versions(recording)
+        self.missing = missing_instruments(recording)
+        self.sections = [
+            {"id": f"section-{i}", "questions": [{"id": f"question-{i}-{j}", "text": "q" * 100} for j in range(5)]}
+            for i in range(arguments.sections)
+        ]
+        self.calls: Counter[str] = Counter()
+        self.cir = FastAPI()
+        self.converter_service = FastAPI()
+
+        @self.cir.get(settings.cir.endpoint)
+        async def retrieve(guid: str) -> Response:
+            self.calls["cir"] += 1
+            await asyncio.sleep(arguments.cir_latency)
+            if guid in self.missing:
+                return Response(status_code=404)
+            version = self.versions.get(guid, DEFAULT_SOURCE_VERSION)
+            instrument = {"id": guid, "validator_version": version, "title": "Replay", "sections": self.sections}
+            return Response(json.dumps(instrument), media_type="application/json")
+
+        @self.converter_service.post(settings.converter_service.endpoint)
+        async def convert(request: Request, target_version: str) -> Response:
+            self.calls["converter_service"] += 1
+            instrument = json.loads(await request.body())["instrument"]
+            instrument["validator_version"] = target_version
+            await asyncio.sleep(arguments.converter_latency)
+            return Response(json.dumps(instrument), media_type="application/json")
+
+
+def start_server(standin_app: FastAPI, port: int) -> tuple[uvicorn.Server, threading.Thread]:
+    """Serves a stand-in on a local port from a thread with its own event loop, returning once it is serving."""
+    server = uvicorn.Server(
+        uvicorn.Config(standin_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"),
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+
+async def replay(recording: list[RecordedRequest], speed: float) -> list[tuple[RecordedRequest, int, float]]:
+    """Sends the recorded requests to the application at their recorded arrival times, divided by the speed.
+
+    Returns every request with the status and latency of its replay.
+    """
+    results: list[tuple[RecordedRequest, int, float]] = []
+    transport = httpx.ASGITransport(app=app)
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=REQUEST_TIMEOUT_SECONDS) as client,
+    ):
+
+        async def send(request: RecordedRequest) -> None:
+            path = request.route.replace("{instrument_id}", request.instrument_id or INVALID_INSTRUMENT_ID)
+            params = {} if request.version is None else {"version": request.version}
+            started = time.perf_counter()
+            response = await client.request(request.method, path, params=params)
+            results.append((request, response.status_code, time.perf_counter() - started))
+
+        loop = asyncio.get_running_loop()
+        start, first_offset = loop.time(), recording[0].offset_ms
+        async with asyncio.TaskGroup() as group:
+            for request in recording:
+                delay = start + (request.offset_ms - first_offset) / 1000 / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                group.create_task(send(request))
+    return results
+
+
+def percentiles(latencies_ms: list[float]) -> str:
+    """Formats the latency percentiles and maximum of a list of latencies."""
+    ordered = sorted(latencies_ms)
+    values = [ordered[min(int(len(ordered) * quantile), len(ordered) - 1)] for quantile in PERCENTILES]
+    return "".join(f"{value:>10.1f}" for value in [*values, ordered[-1]])
+
+
+def report_latencies(results: list[tuple[RecordedRequest, int, float]]) -> None:
+    """Writes the recorded and replayed latency percentiles, overall and per route, to stdout."""
+    sys.stdout.write(f"\n{'latency (ms)':<45}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}\n")
+    sys.stdout.write(f"{'recorded':<45}{percentiles([request.duration_ms for request, _, _ in results])}\n")
+    sys.stdout.write(f"{'replayed':<45}{percentiles([latency * 1000 for _, _, latency in results])}\n")
+    by_route: dict[str, list[float]] = defaultdict(list)
+    for request, _, latency in results:
+        by_route[f"  {request.method} {request.route}"].append(latency * 1000)
+    for route, latencies in sorted(by_route.items()):
+        sys.stdout.write(f"{route:<45}{percentiles(latencies)}\n")
+
+
+def report_caches() -> None:
+    """Writes the caches' hit ratios and how conversions were reused to stdout."""
+    counters = metrics.snapshot()["counters"]
+    sys.stdout.write("\ncache hit ratios:\n")
+    for cache in CACHES:
+        hits = counters.get(f'cache_hits_total{{cache="{cache}"}}', 0)
+        lookups = hits + counters.get(f'cache_misses_total{{cache="{cache}"}}', 0)
+        ratio = f"{hits / lookups:.1%}" if lookups else "-"
+        sys.stdout.write(f"  {cache:<22}{ratio:>8} of {lookups:.0f} lookups\n")
+    reuse = {
+        result: counters.get(f'conversion_reuse_total{{result="{result}"}}', 0)
+        for result in ("exact", "intermediate", "miss")
+    }
+    sys.stdout.write(f"  conversion reuse: {', '.join(f'{result} {count:.0f}' for result, count in reuse.items())}\n")
+
+
+def report(results: list[tuple[RecordedRequest, int, float]], stand_ins: StandIns, elapsed: float) -> None:
+    """Writes the replay's latencies, statuses, cache hit ratios and upstream calls to stdout."""
+    offsets = [request.offset_ms for request, _, _ in results]
+    recorded_seconds = (max(offsets) - min(offsets)) / 1000
+    sys.stdout.write(f"{len(results)} requests replayed in {elapsed:.1f} s, recorded over {recorded_seconds:.1f} s\n")
+    report_latencies(results)
+
+    statuses = Counter(status for _, status, _ in results)
+    changed = sum(request.status != status for request, status, _ in results)
+    sys.stdout.write(f"\nstatuses: {dict(sorted(statuses.items()))}, {changed} different from the recording\n")
+
+    report_caches()
+    calls = ", ".join(f"{name} {count}" for name, count in sorted(stand_ins.calls.items()))
+    sys.stdout.write(f"\nupstream calls: {calls or 'none'}\n")
+
+
+def main() -> None:
+    """Replay the recording named on the command line and write a report to stdout."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("recording", type=Path, help="A traffic recording file written by the service.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor to speed up arrivals by (default: 1).")
+    parser.add_argument("--cir-latency", type=float, default=0.05, help="Seconds CIR takes to answer.")
+    parser.add_argument("--converter-latency", type=float, default=0.2, help="Seconds a conversion takes.")
+    parser.add_argument("--sections", type=int, default=500, help="Number of sections in each instrument.")
+    arguments = parser.parse_args()
+    recording = read_recording(arguments.recording)
+    if not recording:
+        parser.error(f"{arguments.recording} has no recorded requests")
+
+    ports = free_port(), free_port()
+    os.environ["CIR_API_BASE_URL"] = f"http://127.0.0.1:{ports[0]}"
+    os.environ["CONVERTER_SERVICE_API_BASE_URL"] = f"http://127.0.0.1:{ports[1]}"
+    os.environ.pop("TRAFFIC_RECORDING_DIR", None)
+    get_settings.cache_clear()
+    stand_ins = StandIns(recording, get_settings(), arguments)
+    servers = [start_server(stand_ins.cir, ports[0]), start_server(stand_ins.converter_service, ports[1])]
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(devnull)
+        metrics.reset()
+        started = time.perf_counter()
+        try:
+            results = asyncio.run(replay(recording, arguments.speed))
+        finally:
+            for server, thread in servers:
+                server.should_exit = True
+                thread.join()
+    report(results, stand_ins, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""Typed application settings, read from the environment once and validated at startup."""
+
+import math
+import os
+import secrets
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from functools import cache
+from typing import TypeVar
+
+DEFAULT_CIR_RETRIEVE_CI_ENDPOINT = "/v2/retrieve_collection_instrument"
+DEFAULT_CONVERTER_SERVICE_CONVERT_CI_ENDPOINT = "/schema"
+
+DEFAULT_MAX_IN_FLIGHT_REQUESTS = 32
+DEFAULT_MAX_QUEUED_REQUESTS = 64
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 5.0
+DEFAULT_RETRY_AFTER_SECONDS = 1
+DEFAULT_UPSTREAM_MAX_CONCURRENCY = 16
+
+DEFAULT_REQUEST_DEADLINE_SECONDS = 30.0
+DEFAULT_MAX_REQUEST_DEADLINE_SECONDS = 60.0
+
+DEFAULT_MAX_INSTRUMENT_SIZE_BYTES = 20 * 1024 * 1024
+
+DEFAULT_RETRIEVAL_CACHE_TTL_SECONDS = 300.0
+DEFAULT_RETRIEVAL_CACHE_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_METADATA_INDEX_MAX_ENTRIES = 10_000
+DEFAULT_CONVERSION_CACHE_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_NEGATIVE_CACHE_TTL_SECONDS = 30.0
+DEFAULT_NEGATIVE_CACHE_MAX_ENTRIES = 10_000
+
+DEFAULT_DISK_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_DISK_CACHE_TTL_SECONDS = 24 * 60 * 60.0
+DEFAULT_DISK_CACHE_MMAP_THRESHOLD_BYTES = 1024 * 1024
+
+DEFAULT_CLIENT_ID_HEADER = "X-Client-Id"
+DEFAULT_RATE_LIMIT_MAX_CLIENTS = 10_000
+
+DEFAULT_READINESS_CHECK_INTERVAL_SECONDS = 5.0
+
+DEFAULT_ACCESS_LOG_SAMPLE_RATE = 1.0
+DEFAULT_ACCESS_LOG_SLOW_REQUEST_SECONDS = 1.0
+
+DEFAULT_TRAFFIC_RECORDING_MAX_REQUESTS = 100_000
+
+DEFAULT_PROFILING_SAMPLE_INTERVAL_SECONDS = 0.01
+DEFAULT_PROFILING_MAX_SECONDS = 60.0
+
+DEFAULT_CONVERSION_JOB_WORKERS = 2
+DEFAULT_CONVERSION_JOB_MAX_QUEUED = 32
+DEFAULT_CONVERSION_JOB_TIMEOUT_SECONDS = 600.0
+DEFAULT_CONVERSION_JOB_MAX_KEPT = 1_000
+
+DEFAULT_UPSTREAM_MAX_CONNECTIONS = 100
+DEFAULT_UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_UPSTREAM_KEEPALIVE_EXPIRY_SECONDS = 30.0
+DEFAULT_UPSTREAM_EJECTION_FAILURES = 5
+DEFAULT_UPSTREAM_EJECTION_SECONDS = 30.0
+
+_Number = TypeVar("_Number", int, float)
+
+
+class SettingsError(ValueError):
+    """Raised when the environment does not describe a valid configuration."""
+
+    def __init__(self, errors: list[str]) -> None:
+        """Initialise the error with every problem found, so they can all be fixed at once."""
+        super().__init__("Invalid configuration: " + "; ".join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    """Connection pool limits applied to each upstream HTTP client."""
+
+    max_connections: int = DEFAULT_UPSTREAM_MAX_CONNECTIONS
+    max_keepalive_connections: int = DEFAULT_UPSTREAM_MAX_KEEPALIVE_CONNECTIONS
+    keepalive_expiry_seconds: float = DEFAULT_UPSTREAM_KEEPALIVE_EXPIRY_SECONDS
+
+
+@dataclass(frozen=True)
+class EjectionSettings:
+    """When a replica of an upstream service is taken out of rotation after failing, and for how long."""
+
+    consecutive_failures: int = DEFAULT_UPSTREAM_EJECTION_FAILURES
+    seconds: float = DEFAULT_UPSTREAM_EJECTION_SECONDS
+
+
+@dataclass(frozen=True)
+class RateLimitQuota:
+    """Token bucket quota of one client: a sustained request rate and the burst allowed above it."""
+
+    requests_per_second: float
+    burst: int
+
+    @classmethod
+    def parse(cls, requests_per_second: str, burst: str = "") -> "RateLimitQuota":
+        """Parses a quota, with a burst of one second's worth of requests unless given.
+
+        Raises:
+        - ValueError: If the rate is not positive or the burst is not a positive integer.
+        """
+        rate = float(requests_per_second)
+        if not (math.isfinite(rate) and rate > 0):
+            error_message = f"rate must be a positive number, got {requests_per_second!r}"
+            raise ValueError(error_message)
+        quota = cls(rate, int(burst) if burst else max(1, math.ceil(rate)))
+        if quota.burst <= 0:
+            error_message = f"burst must be a positive integer, got {burst!r}"
+            raise ValueError(error_message)
+        return quota
+
+
+@dataclass(frozen=True)
+class UpstreamSettings:
+    """Connection details for an upstream service, which may run as several replicas with their own base URLs."""
+
+    name: str
+    base_urls: tuple[str, ...]
+    endpoint: str
+    iap_client_id: str | None = None
+    max_concurrency: int = DEFAULT_UPSTREAM_MAX_CONCURRENCY
+    pool: PoolSettings = PoolSettings()
+    ejection: EjectionSettings = EjectionSettings()
+
+
+@dataclass(frozen=True)
+class Settings:  # pylint: disable=too-many-instance-attributes
+    """Settings for the whole application."""
+
+    cir: UpstreamSettings
+    converter_service: UpstreamSettings
+    max_in_flight_requests: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS
+    max_queued_requests: int = DEFAULT_MAX_QUEUED_REQUESTS
+    request_queue_timeout_seconds: float = DEFAULT_QUEUE_TIMEOUT_SECONDS
+    retry_after_seconds: int = DEFAULT_RETRY_AFTER_SECONDS
+    request_deadline_seconds: float = DEFAULT_REQUEST_DEADLINE_SECONDS
+    max_request_deadline_seconds: float = DEFAULT_MAX_REQUEST_DEADLINE_SECONDS
+    max_instrument_size_bytes: int = DEFAULT_MAX_INSTRUMENT_SIZE_BYTES
+    validate_upstream_instruments: bool = True
+    retrieval_cache_ttl_seconds: float = DEFAULT_RETRIEVAL_CACHE_TTL_SECONDS
+    retrieval_cache_max_bytes: int = DEFAULT_RETRIEVAL_CACHE_MAX_BYTES
+    metadata_index_max_entries: int = DEFAULT_METADATA_INDEX_MAX_ENTRIES
+    conversion_cache_max_bytes: int = DEFAULT_CONVERSION_CACHE_MAX_BYTES
+    negative_cache_ttl_seconds: float = DEFAULT_NEGATIVE_CACHE_TTL_SECONDS
+    negative_cache_max_entries: int = DEFAULT_NEGATIVE_CACHE_MAX_ENTRIES
+    cache_compression_enabled: bool = True
+    disk_cache_dir: str | None = None
+    disk_cache_max_bytes: int = DEFAULT_DISK_CACHE_MAX_BYTES
+    disk_cache_ttl_seconds: float = DEFAULT_DISK_CACHE_TTL_SECONDS
+    disk_cache_mmap_threshold_bytes: int = DEFAULT_DISK_CACHE_MMAP_THRESHOLD_BYTES
+    # Kept out of the repr so the token never appears in logs.
+    admin_token: str | None = field(default=None, repr=False)
+    publish_event_audience: str | None = None
+    publish_event_service_account: str | None = None
+    client_id_header: str = DEFAULT_CLIENT_ID_HEADER
+    client_id_trusted_principals: tuple[str, ...] = ()
+    rate_limit: RateLimitQuota | None = None
+    client_rate_limits: tuple[tuple[str, RateLimitQuota], ...] = ()
+    rate_limit_max_clients: int = DEFAULT_RATE_LIMIT_MAX_CLIENTS
+    rate_limit_redis_url: str | None = field(default=None, repr=False)
+    readiness_check_interval_seconds: float = DEFAULT_READINESS_CHECK_INTERVAL_SECONDS
+    access_log_sample_rate: float = DEFAULT_ACCESS_LOG_SAMPLE_RATE
+    access_log_slow_request_seconds: float = DEFAULT_ACCESS_LOG_SLOW_REQUEST_SECONDS
+    traffic_recording_dir: str | None = None
+    traffic_recording_max_requests: int = DEFAULT_TRAFFIC_RECORDING_MAX_REQUESTS
+    profiling_enabled: bool = False
+    profiling_sample_interval_seconds: float = DEFAULT_PROFILING_SAMPLE_INTERVAL_SECONDS
+    profiling_max_seconds: float = DEFAULT_PROFILING_MAX_SECONDS
+    conversion_jobs_enabled: bool = True
+    conversion_job_workers: int = DEFAULT_CONVERSION_JOB_WORKERS
+    conversion_job_max_queued: int = DEFAULT_CONVERSION_JOB_MAX_QUEUED
+    conversion_job_timeout_seconds: float = DEFAULT_CONVERSION_JOB_TIMEOUT_SECONDS
+    conversion_job_max_kept: int = DEFAULT_CONVERSION_JOB_MAX_KEPT
+
+    @property
+    def iap_client_ids(self) -> tuple[str, ...]:
+        """The IAP client IDs configured for the upstream services."""
+        return tuple(
+            upstream.iap_client_id for upstream in (self.cir, self.converter_service) if upstream.iap_client_id
+        )
+
+    def admin_token_matches(self, token: str | None) -> bool:
+        """Whether an admin token is configured and the supplied token matches it, compared in constant time."""
+        return bool(self.admin_token and token and secrets.compare_digest(token.encode(), self.admin_token.encode()))
+
+
+class _EnvironmentReader:
+    """Reads typed values from an environment mapping, collecting every problem instead of stopping at the first."""
+
+    def __init__(self, environ: Mapping[str, str]) -> None:
+        self.environ = environ
+        self.errors: list[str] = []
+
+    def string(self, name: str, default: str | None = None) -> str:
+        """Reads a required string; an unset variable takes the default, an empty one is an error."""
+        value = self.environ.get(name, default)
+        if not value:
+            self.errors.append(f"{name} must be set")
+            return ""
+        return value
+
+    def string_list(self, name: str, *, required: bool = True) -> tuple[str, ...]:
+        """Reads a comma-separated list of strings, ignoring empty items; required lists must have at least one."""
+        values = tuple(item.strip() for item in self.environ.get(name, "").split(",") if item.strip())
+        if required and not values:
+            self.errors.append(f"{name} must be set")
+        return values
+
+    def optional_string(self, name: str) -> str | None:
+        """Reads an optional string, treating an empty value as unset."""
+        return self.environ.get(name) or None
+
+    def number(self, name: str, default: _Number, convert: Callable[[str], _Number]) -> _Number:
+        """Reads a positive number, falling back to the default when unset or empty."""
+        raw = self.environ.get(name)
+        if not raw:
+            return default
+        try:
+            value = convert(raw)
+        except ValueError:
+            self.errors.append(f"{name} must be a number, got {raw!r}")
+            return default
+        if value <= 0:
+            self.errors.append(f"{name} must be greater than zero, got {raw!r}")
+            return default
+        return value
+
+    def fraction(self, name: str, default: float) -> float:
+        """Reads a number from 0 to 1, falling back to the default when unset or empty."""
+        raw = self.environ.get(name)
+        if not raw:
+            return default
+        try:
+            value = float(raw)
+        except ValueError:
+            value = math.nan
+        if not 0 <= value <= 1:
+            self.errors.append(f"{name} must be a number from 0 to 1, got {raw!r}")
+            return default
+        return value
+
+    def boolean(self, name: str, *, default: bool) -> bool:
+        """Reads a true/false flag, falling back to the default when unset or empty."""
+        raw = self.environ.get(name, "").strip().lower()
+        if not raw:
+            return default
+        if raw in {"true", "1", "yes"}:
+            return True
+        if raw in {"false", "0", "no"}:
+            return False
+        self.errors.append(f"{name} must be true or false, got {raw!r}")
+        return default
+
+    def rate_limit(self, rate_name: str, burst_name: str) -> RateLimitQuota | None:
+        """Reads an optional rate limit quota from a rate and a burst variable; no rate means no limit."""
+        rate = self.environ.get(rate_name)
+        if not rate:
+            return None
+        burst = self.environ.get(burst_name, "")
+        try:
+            return RateLimitQuota.parse(rate, burst)
+        except ValueError:
+            self.errors.append(f"{rate_name} and {burst_name} must be positive numbers, got {rate!r} and {burst!r}")
+            return None
+
+    def client_rate_limits(self, name: str) -> tuple[tuple[str, RateLimitQuota], ...]:
+        """Reads comma-separated ``client=requests_per_second[:burst]`` quotas."""
+        quotas = []
+        for item in self.environ.get(name, "").split(","):
+            if not item.strip():
+                continue
+            client, _, quota = item.partition("=")
+            try:
+                parsed_quota = RateLimitQuota.parse(*quota.strip().split(":", 1))
+            except (TypeError, ValueError):
+                parsed_quota = None
+            if client.strip() and parsed_quota:
+                quotas.append((client.strip(), parsed_quota))
+            else:
+                self.errors.append(f"{name} entries must look like client=requests_per_second[:burst], got {item!r}")
+        return tuple(quotas)
+
+
+def load_settings(environ: Mapping[str, str] | None = None) -> Settings:
+    """Builds the settings from environment variables.
+
+    Parameters:
+    - environ: The environment to read, defaulting to the process environment.
+
+    Returns:
+    - Settings: The validated settings.
+
+    Raises:
+    - SettingsError: If any variable is missing or invalid.
+    """
+    env = _EnvironmentReader(os.environ if environ is None else environ)
+
+    pool = PoolSettings(
+        max_connections=env.number("UPSTREAM_MAX_CONNECTIONS", DEFAULT_UPSTREAM_MAX_CONNECTIONS, int),
+        max_keepalive_connections=env.number(
+            "UPSTREAM_MAX_KEEPALIVE_CONNECTIONS",
+            DEFAULT_UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            int,
+        ),
+        keepalive_expiry_seconds=env.number(
+            "UPSTREAM_KEEPALIVE_EXPIRY_SECONDS",
+            DEFAULT_UPSTREAM_KEEPALIVE_EXPIRY_SECONDS,
+            float,
+        ),
+    )
+    ejection = EjectionSettings(
+        consecutive_failures=env.number("UPSTREAM_EJECTION_FAILURES", DEFAULT_UPSTREAM_EJECTION_FAILURES, int),
+        seconds=env.number("UPSTREAM_EJECTION_SECONDS", DEFAULT_UPSTREAM_EJECTION_SECONDS, float),
+    )
+    settings = Settings(
+        cir=UpstreamSettings(
+            name="cir",
+            base_urls=env.string_list("CIR_API_BASE_URL"),
+            endpoint=env.string("CIR_RETRIEVE_CI_ENDPOINT", DEFAULT_CIR_RETRIEVE_CI_ENDPOINT),
+            iap_client_id=env.optional_string("CIR_IAP_CLIENT_ID"),
+            max_concurrency=env.number("CIR_MAX_CONCURRENCY", DEFAULT_UPSTREAM_MAX_CONCURRENCY, int),
+            pool=pool,
+            ejection=ejection,
+        ),
+        converter_service=UpstreamSettings(
+            name="converter_service",
+            base_urls=env.string_list("CONVERTER_SERVICE_API_BASE_URL"),
+            endpoint=env.string(
+                "CONVERTER_SERVICE_CONVERT_CI_ENDPOINT",
+                DEFAULT_CONVERTER_SERVICE_CONVERT_CI_ENDPOINT,
+            ),
+            iap_client_id=env.optional_string("CONVERTER_SERVICE_IAP_CLIENT_ID"),
+            max_concurrency=env.number("CONVERTER_SERVICE_MAX_CONCURRENCY", DEFAULT_UPSTREAM_MAX_CONCURRENCY, int),
+            pool=pool,
+            ejection=ejection,
+        ),
+        max_in_flight_requests=env.number("MAX_IN_FLIGHT_REQUESTS", DEFAULT_MAX_IN_FLIGHT_REQUESTS, int),
+        max_queued_requests=env.number("MAX_QUEUED_REQUESTS", DEFAULT_MAX_QUEUED_REQUESTS, int),
+        request_queue_timeout_seconds=env.number(
+            "REQUEST_QUEUE_TIMEOUT_SECONDS",
+            DEFAULT_QUEUE_TIMEOUT_SECONDS,
+            float,
+        ),
+        retry_after_seconds=env.number("RETRY_AFTER_SECONDS", DEFAULT_RETRY_AFTER_SECONDS, int),
+        request_deadline_seconds=env.number("REQUEST_DEADLINE_SECONDS", DEFAULT_REQUEST_DEADLINE_SECONDS, float),
+        max_request_deadline_seconds=env.number(
+            "MAX_REQUEST_DEADLINE_SECONDS",
+            DEFAULT_MAX_REQUEST_DEADLINE_SECONDS,
+            float,
+        ),
+        max_instrument_size_bytes=env.number("MAX_INSTRUMENT_SIZE_BYTES", DEFAULT_MAX_INSTRUMENT_SIZE_BYTES, int),
+        validate_upstream_instruments=env.boolean("VALIDATE_UPSTREAM_INSTRUMENTS", default=True),
+        retrieval_cache_ttl_seconds=env.number(
+            "RETRIEVAL_CACHE_TTL_SECONDS",
+            DEFAULT_RETRIEVAL_CACHE_TTL_SECONDS,
+            float,
+        ),
+        retrieval_cache_max_bytes=env.number("RETRIEVAL_CACHE_MAX_BYTES", DEFAULT_RETRIEVAL_CACHE_MAX_BYTES, int),
+        metadata_index_max_entries=env.number(
+            "METADATA_INDEX_MAX_ENTRIES",
+            DEFAULT_METADATA_INDEX_MAX_ENTRIES,
+            int,
+        ),
+        conversion_cache_max_bytes=env.number(
+            "CONVERSION_CACHE_MAX_BYTES",
+            DEFAULT_CONVERSION_CACHE_MAX_BYTES,
+            int,
+        ),
+        negative_cache_ttl_seconds=env.number(
+            "NEGATIVE_CACHE_TTL_SECONDS",
+            DEFAULT_NEGATIVE_CACHE_TTL_SECONDS,
+            float,
+        ),
+        negative_cache_max_entries=env.number(
+            "NEGATIVE_CACHE_MAX_ENTRIES",
+            DEFAULT_NEGATIVE_CACHE_MAX_ENTRIES,
+            int,
+        ),
+        cache_compression_enabled=env.boolean("CACHE_COMPRESSION_ENABLED", default=True),
+        disk_cache_dir=env.optional_string("DISK_CACHE_DIR"),
+        disk_cache_max_bytes=env.number("DISK_CACHE_MAX_BYTES", DEFAULT_DISK_CACHE_MAX_BYTES, int),
+        disk_cache_ttl_seconds=env.number("DISK_CACHE_TTL_SECONDS", DEFAULT_DISK_CACHE_TTL_SECONDS, float),
+        disk_cache_mmap_threshold_bytes=env.number(
+            "DISK_CACHE_MMAP_THRESHOLD_BYTES",
+            DEFAULT_DISK_CACHE_MMAP_THRESHOLD_BYTES,
+            int,
+        ),
+        admin_token=env.optional_string("ADMIN_TOKEN"),
+        publish_event_audience=env.optional_string("PUBLISH_EVENT_AUDIENCE"),
+        publish_event_service_account=env.optional_string("PUBLISH_EVENT_SERVICE_ACCOUNT"),
+        client_id_header=env.string("CLIENT_ID_HEADER", DEFAULT_CLIENT_ID_HEADER),
+        client_id_trusted_principals=env.string_list("CLIENT_ID_TRUSTED_PRINCIPALS", required=False),
+        rate_limit=env.rate_limit("RATE_LIMIT_REQUESTS_PER_SECOND", "RATE_LIMIT_BURST"),
+        client_rate_limits=env.client_rate_limits("RATE_LIMIT_CLIENT_QUOTAS"),
+        rate_limit_max_clients=env.number("RATE_LIMIT_MAX_CLIENTS", DEFAULT_RATE_LIMIT_MAX_CLIENTS, int),
+        rate_limit_redis_url=env.optional_string("RATE_LIMIT_REDIS_URL"),
+        readiness_check_interval_seconds=env.number(
+            "READINESS_CHECK_INTERVAL_SECONDS",
+            DEFAULT_READINESS_CHECK_INTERVAL_SECONDS,
+            float,
+        ),
+        access_log_sample_rate=env.fraction("ACCESS_LOG_SAMPLE_RATE", DEFAULT_ACCESS_LOG_SAMPLE_RATE),
+        access_log_slow_request_seconds=env.number(
+            "ACCESS_LOG_SLOW_REQUEST_SECONDS",
+            DEFAULT_ACCESS_LOG_SLOW_REQUEST_SECONDS,
+            float,
+        ),
+        traffic_recording_dir=env.optional_string("TRAFFIC_RECORDING_DIR"),
+        traffic_recording_max_requests=env.number(
+            "TRAFFIC_RECORDING_MAX_REQUESTS",
+            DEFAULT_TRAFFIC_RECORDING_MAX_REQUESTS,
+            int,
+        ),
+        profiling_enabled=env.boolean("PROFILING_ENABLED", default=False),
+        profiling_sample_interval_seconds=env.number(
+            "PROFILING_SAMPLE_INTERVAL_SECONDS",
+            DEFAULT_PROFILING_SAMPLE_INTERVAL_SECONDS,
+            float,
+        ),
+        profiling_max_seconds=env.number("PROFILING_MAX_SECONDS", DEFAULT_PROFILING_MAX_SECONDS, float),
+        conversion_jobs_enabled=env.boolean("CONVERSION_JOBS_ENABLED", default=True),
+        conversion_job_workers=env.number("CONVERSION_JOB_WORKERS", DEFAULT_CONVERSION_JOB_WORKERS, int),
+        conversion_job_max_queued=env.number("CONVERSION_JOB_MAX_QUEUED", DEFAULT_CONVERSION_JOB_MAX_QUEUED, int),
+        conversion_job_timeout_seconds=env.number(
+            "CONVERSION_JOB_TIMEOUT_SECONDS",
+            DEFAULT_CONVERSION_JOB_TIMEOUT_SECONDS,
+            float,
+        ),
+        conversion_job_max_kept=env.number("CONVERSION_JOB_MAX_KEPT", DEFAULT_CONVERSION_JOB_MAX_KEPT, int),
+    )
+
+    if pool.max_keepalive_connections > pool.max_connections:
+        env.errors.append("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS must not exceed UPSTREAM_MAX_CONNECTIONS")
+    if settings.request_deadline_seconds > settings.max_request_deadline_seconds:
+        env.errors.append("REQUEST_DEADLINE_SECONDS must not exceed MAX_REQUEST_DEADLINE_SECONDS")
+    if bool(settings.publish_event_audience) != bool(settings.publish_event_service_account):
+        env.errors.append("PUBLISH_EVENT_AUDIENCE and PUBLISH_EVENT_SERVICE_ACCOUNT must be set together")
+
+    if env.errors:
+        raise SettingsError(env.errors)
+    return settings
+
+
+@cache
+def get_settings() -> Settings:
+    """Returns the application settings, loading them from the environment on first use.
+
+    The application calls this during startup, so an invalid configuration stops the service from starting
+    rather than failing requests. Tests that change the environment should call ``get_settings.cache_clear()``.
+    """
+    return load_settings()
@@ -0,0 +1,52 @@
+"""This module holds the rendered bodies of the most common error responses, so they are not serialised per request."""
+
+from collections.abc import Mapping
+from typing import Any
+
+from fastapi.responses import JSONResponse, Response
+
+from eq_cir_proxy_service.exceptions import exception_messages
+
+# Messages of the errors that invalid or unknown requests produce most often, by status code. Their bodies are
+# rendered by JSONResponse once, so they are byte-for-byte what it would render for each request.
+_COMMON_ERRORS = (
+    (400, exception_messages.EXCEPTION_400_INVALID_VERSION),
+    (400, exception_messages.EXCEPTION_400_INVALID_FIELDS),
+    (404, exception_messages.EXCEPTION_404_INSTRUMENT_NOT_FOUND),
+)
+# Starlette's detail for requests to unknown routes.
+_ROUTE_NOT_FOUND = (404, "Not Found")
+
+_PRECOMPUTED_BODIES: dict[tuple[int, str], bytes] = {
+    (status_code, message): bytes(JSONResponse(content={"detail": {"status": "error", "message": message}}).body)
+    for status_code, message in _COMMON_ERRORS
+} | {_ROUTE_NOT_FOUND: bytes(JSONResponse(content={"detail": _ROUTE_NOT_FOUND[1]}).body)}
+
+
+def _key(status_code: int, detail: Any) -> tuple[int, str] | None:
+    """Returns the key of an error's precomputed body, or None if the detail is not of a precomputable form."""
+    if isinstance(detail, str):
+        return status_code, detail
+    if isinstance(detail, dict) and len(detail) == 2 and detail.get("status") == "error":
+        message = detail.get("message")
+        if isinstance(message, str):
+            return status_code, message
+    return None
+
+
+def error_response(status_code: int, detail: Any, headers: Mapping[str, str] | None = None) -> Response:
+    """Returns the JSON response for an HTTP error, using a precomputed body for the most common errors.
+
+    Parameters:
+    - status_code: The HTTP status code.
+    - detail: The error detail, returned as the response's ``detail`` field.
+    - headers: Headers of the response, such as Retry-After.
+
+    Returns:
+    - Response: The error response.
+    """
+    key = _key(status_code, detail)
+    body = None if key is None else _PRECOMPUTED_BODIES.get(key)
+    if body is None:
+        return JSONResponse(status_code=status_code, content={"detail": detail}, headers=headers)
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
@@ -1,9 +1,11 @@
 """This module contains the exception messages for the EQ CIR Proxy Service."""
 
-import typing
-
 EXCEPTION_500_INSTRUMENT_PROCESSING = "Error encountered while processing the instrument_id."
 
+EXCEPTION_500_INSTRUMENT_TOO_LARGE = "Instrument exceeds the maximum supported size."
+
+EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT = "An upstream service returned an invalid instrument."
+
 EXCEPTION_400_INVALID_VERSION = (
     "Invalid version format. The version must be in the format x.y.z where x, y, z are numbers."
 )
@@ -14,12 +16,27 @@ EXCEPTION_400_INVALID_CONVERSION = "Target version is lower than instrument vers
 
 EXCEPTION_400_INVALID_INSTRUMENT = "Received instrument is not valid."
 
+EXCEPTION_400_INVALID_FIELDS = "The fields parameter must be a comma-separated list of top-level instrument fields."
+
+EXCEPTION_400_INVALID_PUBLISH_EVENT = "The publish event does not identify an instrument."
+
+EXCEPTION_400_INVALID_PROFILE_DURATION = "The profile duration must be greater than zero and within the maximum."
+
+EXCEPTION_403_ADMIN_FORBIDDEN = "A valid admin token is required."
+EXCEPTION_403_PUBLISHER_FORBIDDEN = "A Pub/Sub push ID token or a valid admin token is required."
+
+EXCEPTION_404_PROFILING_DISABLED = "Profiling is not enabled."
+
+EXCEPTION_404_PROFILE_NOT_FOUND = "No request profile was found for the provided profile_id."
+
+EXCEPTION_404_JOB_NOT_FOUND = "No conversion job was found for the provided job_id."
+
+EXCEPTION_404_JOBS_DISABLED = "Conversion jobs are not enabled."
+
+EXCEPTION_409_PROFILER_BUSY = "A profile is already being captured."
 
-def exception_404_missing_instrument_id(path: str) -> str:
-    """Returns the exception message for a missing instrument_id."""
-    return f"404 - instrument_id not provided or route not found: {path}"
+EXCEPTION_429_RATE_LIMITED = "Too many requests from this client. Retry the request later."
 
+EXCEPTION_503_SERVICE_OVERLOADED = "The service is at capacity. Retry the request later."
 
-def exception_422_invalid_instrument_id(instrument_id: typing.Any) -> typing.Any:
-    """Returns the exception message for an invalid instrument_id."""
-    return f"Invalid UUID received for instrument_id: {instrument_id}"
+EXCEPTION_504_DEADLINE_EXCEEDED = "The request did not complete within its deadline."
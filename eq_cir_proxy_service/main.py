@@ -1,28 +1,78 @@
 """Entry point for the FastAPI application."""
 
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import structlog
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from eq_cir_proxy_service.config.logging_config import setup_logging
-from eq_cir_proxy_service.exceptions.exception_messages import (
-    exception_404_missing_instrument_id,
-    exception_422_invalid_instrument_id,
-)
-from eq_cir_proxy_service.routers import instrument
+from eq_cir_proxy_service.config.settings import get_settings
+from eq_cir_proxy_service.exceptions.error_responses import error_response
+from eq_cir_proxy_service.routers import admin, instrument
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+from eq_cir_proxy_service.services.instrument.jobs import get_conversion_jobs
+from eq_cir_proxy_service.services.readiness import get_readiness_checker
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.access_log import AccessLogMiddleware
+from eq_cir_proxy_service.utils.error_log import log_error_event
+from eq_cir_proxy_service.utils.iap import close_api_clients, preload_iap_dependencies
+from eq_cir_proxy_service.utils.profiling import ProfilingMiddleware
+from eq_cir_proxy_service.utils.rate_limit import get_rate_limiter
+from eq_cir_proxy_service.utils.traffic_recording import TrafficRecordingMiddleware, get_traffic_recorder
 
 # Load .env file
 load_dotenv(".env")
 
 setup_logging()
 
-app = FastAPI()
 logger = structlog.get_logger()
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """Application lifespan: loads settings and warms IAP on startup, and closes the upstream clients on shutdown.
+
+    Loading the settings here means a missing or invalid environment variable stops the service from starting,
+    rather than failing requests. Creating the instrument cache here loads any disk cache index at startup, and the
+    readiness checker reports ready once startup is complete. If traffic is recorded, the recording file is created
+    here too, and any requests not yet written to it are written on shutdown. The shutdown step runs once the server
+    has drained in-flight requests; conversion jobs still running then are abandoned.
+    """
+    settings = get_settings()
+    instrument_cache = await asyncio.to_thread(get_instrument_cache, settings)
+    rate_limiter = get_rate_limiter(settings)
+    traffic_recorder = await asyncio.to_thread(get_traffic_recorder, settings)
+    await preload_iap_dependencies(settings)
+    readiness_checker = get_readiness_checker(settings)
+    readiness_checker.start()
+    # CPU time used by the process so far is dominated by imports, so it tracks cold-start cost.
+    logger.info("Application started.", startup_cpu_seconds=round(time.process_time(), 3))
+    yield
+    logger.info("Shutting down. Closing upstream API clients.")
+    await readiness_checker.aclose()
+    await get_conversion_jobs(settings).aclose()
+    await instrument_cache.aclose()
+    await rate_limiter.aclose()
+    if traffic_recorder is not None:
+        await traffic_recorder.aclose()
+    await close_api_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TrafficRecordingMiddleware)
+# Added last so that it is outermost, and its record covers the whole request.
+app.add_middleware(AccessLogMiddleware)
+
+
 @app.get("/")
 async def root() -> dict:
     """Root endpoint returning JSON response."""
@@ -31,42 +81,67 @@ async def root() -> dict:
 
 @app.get("/status")
 async def health_check() -> dict:
-    """Health check endpoint for Cloud Run.
+    """Liveness endpoint for Cloud Run, answered without logging as it is probed frequently.
 
     Returns:
         dict: A JSON object indicating the service is running.
         Example: {"status": "OK"}
     """
-    logger.info("Health check endpoint.")
     return {"status": "OK"}
 
 
+@app.get("/status/ready")
+async def readiness_check() -> JSONResponse:
+    """Readiness endpoint, returning the readiness report last computed by the background checker.
+
+    Returns:
+        JSONResponse: The report, with status 200 if the service is ready, else 503.
+        Example: {"status": "ready", "admission": {...}, "upstreams": {...}, "cache": {...}}
+    """
+    checker = get_readiness_checker(get_settings())
+    return JSONResponse(status_code=200 if checker.ready else 503, content=checker.report or {"status": "starting"})
+
+
+@app.get("/metrics")
+async def get_metrics() -> dict:
+    """Metrics endpoint returning the service's in-process counters and gauges.
+
+    Returns:
+        dict: A JSON object of counters and gauges keyed by metric name and labels.
+        Example: {"counters": {}, "gauges": {"concurrency_in_flight": 0}}
+    """
+    return metrics.snapshot()
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
-    """Custom exception handler for validation errors, to allow logging of any errors."""
-    for error in exc.errors():
-        loc = error.get("loc", [])
-        if "path" in loc and "instrument_id" in loc:
-            invalid_instrument_id = request.path_params.get("instrument_id")
-            logger.warning(exception_422_invalid_instrument_id(invalid_instrument_id))
-
-    logger.error("Validation error details: ", error=exc.errors())
+    """Custom exception handler for validation errors, logging them at a limited rate.
 
+    Only the location and type of the first error are logged, as the full errors echo the client's input.
+    """
+    errors = exc.errors()
+    log_error_event(
+        "request_validation",
+        "Request validation failed.",
+        level=logging.WARNING,
+        path=request.url.path,
+        error_count=len(errors),
+        loc=errors[0].get("loc") if errors else None,
+        error_type=errors[0].get("type") if errors else None,
+    )
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors()},
+        content={"detail": errors},
     )
 
 
 @app.exception_handler(StarletteHTTPException)
-async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> JSONResponse:
-    """Custom exception handler for HTTP exceptions, to log /instrument 404 errors."""
+async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> Response:
+    """Custom exception handler for HTTP exceptions, logging /instrument 404 errors at a limited rate."""
     if exc.status_code == 404 and request.url.path.startswith("/instrument"):
-        logger.error(exception_404_missing_instrument_id(request.url.path))
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={"detail": exc.detail},
-    )
+        log_error_event("route_not_found", "Route not found.", path=request.url.path)
+    return error_response(exc.status_code, exc.detail, headers=exc.headers)
 
 
 app.include_router(instrument.router)
+app.include_router(admin.router)
@@ -0,0 +1,196 @@
+"""Module defines the admin router for cache invalidation, including on CIR publish events, and for profiling."""
+
+import asyncio
+import base64
+import json
+from typing import Any, Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Path, Query, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import Settings, get_settings
+from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+from eq_cir_proxy_service.utils import iap, profiling
+
+router = APIRouter(prefix="/admin")
+logger = get_logger()
+INSTRUMENT_ID_PATH = Path(..., description="UUIDv4 of the instrument")
+PUBLISH_EVENT_BODY = Body(description="Pub/Sub push envelope of a CIR publish event")
+SETTINGS = Depends(get_settings)
+
+
+async def require_admin_token(
+    token: str | None = Header(default=None, alias="X-Admin-Token"),
+    settings: Settings = SETTINGS,
+) -> None:
+    """Dependency requiring the admin token in the X-Admin-Token header, rejecting every request if none is set."""
+    if not settings.admin_token_matches(token):
+        logger.warning("Rejected admin request with a missing or invalid token.")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_403_ADMIN_FORBIDDEN},
+        )
+
+
+ADMIN_TOKEN = Depends(require_admin_token)
+
+
+async def _is_authenticated_push(authorization: str | None, settings: Settings) -> bool:
+    """Whether the Authorization header carries an ID token from the configured Pub/Sub push subscription.
+
+    The token must be signed by Google for PUBLISH_EVENT_AUDIENCE and issued to PUBLISH_EVENT_SERVICE_ACCOUNT, as
+    anyone with a Google account can get a token for any audience.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if not (settings.publish_event_audience and scheme.lower() == "bearer" and token):
+        return False
+    try:
+        claims = await asyncio.to_thread(iap.verify_id_token, token, settings.publish_event_audience)
+    except ValueError:
+        logger.warning("Rejected publish event with an invalid ID token.")
+        return False
+    return bool(claims.get("email_verified")) and claims.get("email") == settings.publish_event_service_account
+
+
+async def require_publisher(
+    authorization: str | None = Header(default=None),
+    admin_token: str | None = Header(default=None, alias="X-Admin-Token"),
+    settings: Settings = SETTINGS,
+) -> None:
+    """Dependency requiring a Pub/Sub authenticated push, or the admin token in the X-Admin-Token header.
+
+    Pub/Sub cannot set custom headers, so pushes are authenticated by the ID token it sends. Other publishers, such
+    as a local fake one, send the admin token.
+    """
+    if settings.admin_token_matches(admin_token) or await _is_authenticated_push(authorization, settings):
+        return
+    logger.warning("Rejected publish event from an unauthenticated publisher.")
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail={"status": "error", "message": exception_messages.EXCEPTION_403_PUBLISHER_FORBIDDEN},
+    )
+
+
+def _published_instrument_id(envelope: dict[str, Any]) -> UUID:
+    """Returns the ID of the instrument in a Pub/Sub push envelope carrying a CIR publish event.
+
+    The message data is the base64-encoded JSON metadata of the published instrument, whose ``id`` is its UUID.
+    """
+    try:
+        data = json.loads(base64.b64decode(envelope["message"]["data"], validate=True))
+        return UUID(str(data["id"]))
+    except (KeyError, TypeError, ValueError) as exc:
+        logger.warning("Received an invalid publish event.")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_400_INVALID_PUBLISH_EVENT},
+        ) from exc
+
+
+@router.delete("/cache/instrument/{instrument_id}", dependencies=[ADMIN_TOKEN])
+async def invalidate_instrument(instrument_id: UUID = INSTRUMENT_ID_PATH, settings: Settings = SETTINGS) -> dict:
+    """Evict an instrument, its metadata and its conversions from every cache tier."""
+    evicted = await get_instrument_cache(settings).invalidate(str(instrument_id))
+    logger.info("Invalidated cached instrument.", instrument_id=instrument_id, evicted=evicted)
+    return {"status": "success", "instrument_id": str(instrument_id), "evicted": evicted}
+
+
+@router.delete("/cache/instrument/{instrument_id}/conversions", dependencies=[ADMIN_TOKEN])
+async def invalidate_conversions(instrument_id: UUID = INSTRUMENT_ID_PATH, settings: Settings = SETTINGS) -> dict:
+    """Evict every conversion of an instrument from every cache tier, keeping the retrieved instrument."""
+    evicted = await get_instrument_cache(settings).invalidate_conversions(str(instrument_id))
+    logger.info("Invalidated cached conversions.", instrument_id=instrument_id, evicted=evicted)
+    return {"status": "success", "instrument_id": str(instrument_id), "evicted": evicted}
+
+
+@router.delete("/cache", dependencies=[ADMIN_TOKEN])
+async def invalidate_all(settings: Settings = SETTINGS) -> dict:
+    """Evict every entry from every cache tier."""
+    evicted = await get_instrument_cache(settings).clear()
+    logger.info("Invalidated all cached instruments.", evicted=evicted)
+    return {"status": "success", "evicted": evicted}
+
+
+@router.post("/events/cir-publish", dependencies=[Depends(require_publisher)])
+async def receive_publish_event(envelope: dict[str, Any] = PUBLISH_EVENT_BODY, settings: Settings = SETTINGS) -> dict:
+    """Evict a newly published instrument from every cache tier, on a push from CIR's publish subscription."""
+    instrument_id = _published_instrument_id(envelope)
+    evicted = await get_instrument_cache(settings).invalidate(str(instrument_id))
+    logger.info(
+        "Invalidated cached instrument on publish event.",
+        instrument_id=instrument_id,
+        message_id=envelope["message"].get("messageId"),
+        evicted=evicted,
+    )
+    return {"status": "success", "instrument_id": str(instrument_id), "evicted": evicted}
+
+
+def _require_profiling(settings: Settings) -> None:
+    """Rejects the request unless profiling is enabled."""
+    if not settings.profiling_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_404_PROFILING_DISABLED},
+        )
+
+
+@router.get("/profile", dependencies=[ADMIN_TOKEN])
+async def capture_profile(
+    seconds: float = Query(default=10.0, description="Seconds to sample for, up to PROFILING_MAX_SECONDS"),
+    output_format: Literal["speedscope", "collapsed"] = Query(
+        default="speedscope",
+        alias="format",
+        description="speedscope JSON, or collapsed stacks for flame graph tools",
+    ),
+    settings: Settings = SETTINGS,
+) -> Response:
+    """Sample the stacks of every thread for a number of seconds and return the profile."""
+    _require_profiling(settings)
+    if not 0 < seconds <= settings.profiling_max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_400_INVALID_PROFILE_DURATION},
+        )
+    try:
+        profile = await profiling.capture_sampled_profile(seconds, settings.profiling_sample_interval_seconds)
+    except profiling.ProfilerBusyError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_409_PROFILER_BUSY},
+        ) from exc
+    if output_format == "collapsed":
+        return PlainTextResponse(profile.to_collapsed())
+    return JSONResponse(
+        profile.to_speedscope(),
+        headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'},
+    )
+
+
+@router.get("/profile/requests/{profile_id}", dependencies=[ADMIN_TOKEN])
+async def download_request_profile(
+    profile_id: str = Path(..., description="ID returned in the X-Profile-Id header of the profiled request"),
+    output_format: Literal["pstats", "text"] = Query(
+        default="pstats",
+        alias="format",
+        description="pstats file, or a text report of the functions with the highest cumulative time",
+    ),
+    settings: Settings = SETTINGS,
+) -> Response:
+    """Download the profile of a request made with the X-Profile header."""
+    _require_profiling(settings)
+    profile = profiling.get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_404_PROFILE_NOT_FOUND},
+        )
+    if output_format == "text":
+        return PlainTextResponse(profiling.format_request_profile(profile))
+    return Response(
+        profiling.dump_request_profile(profile),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
+    )
@@ -1,52 +1,225 @@
 """Module defines the instrument router for handling requests related to instruments in the EQ CIR Proxy Service."""
 
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request
+from fastapi.responses import JSONResponse
 from structlog import get_logger
 
+from eq_cir_proxy_service.config.settings import Settings, get_settings
 from eq_cir_proxy_service.exceptions import exception_messages
 from eq_cir_proxy_service.services.instrument import (
     conversion,
     retrieval,
 )
+from eq_cir_proxy_service.services.instrument.jobs import get_conversion_jobs
+from eq_cir_proxy_service.services.instrument.projection import project_fields
 from eq_cir_proxy_service.services.validators.request import (
+    parse_fields,
     validate_version,
 )
 from eq_cir_proxy_service.types.custom_types import Instrument
+from eq_cir_proxy_service.utils import access_log
+from eq_cir_proxy_service.utils.concurrency import (
+    ConcurrencyLimitExceededError,
+    get_request_limiter,
+)
+from eq_cir_proxy_service.utils.deadline import (
+    REQUEST_TIMEOUT_HEADER,
+    DeadlineExceededError,
+    request_deadline,
+    resolve_deadline_seconds,
+)
+from eq_cir_proxy_service.utils.rate_limit import (
+    RateLimitExceededError,
+    client_identity,
+    get_rate_limiter,
+)
 
 router = APIRouter()
 logger = get_logger()
 INSTRUMENT_ID_PATH = Path(..., description="UUIDv4 of the instrument")
+SETTINGS = Depends(get_settings)
+
+
+@contextmanager
+def _translate_errors(instrument_id: UUID) -> Iterator[None]:
+    """Translates errors raised while serving an instrument request into HTTP responses."""
+    try:
+        yield
+    except HTTPException:
+        raise  # re-raise so FastAPI handles it properly
+    except RateLimitExceededError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "status": "error",
+                "message": exception_messages.EXCEPTION_429_RATE_LIMITED,
+            },
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except ConcurrencyLimitExceededError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "status": "error",
+                "message": exception_messages.EXCEPTION_503_SERVICE_OVERLOADED,
+            },
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except DeadlineExceededError as exc:
+        logger.warning("Request deadline exceeded.", instrument_id=instrument_id, stage=exc.stage)
+        raise HTTPException(
+            status_code=504,
+            detail={
+                "status": "error",
+                "message": exception_messages.EXCEPTION_504_DEADLINE_EXCEEDED,
+            },
+        ) from exc
+    except Exception as exc:
+        logger.exception("An exception occurred while processing the instrument")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING,
+            },
+        ) from exc
+
 
+def _require_conversion_jobs(settings: Settings) -> None:
+    """Rejects the request unless conversion jobs are enabled."""
+    if not settings.conversion_jobs_enabled:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "status": "error",
+                "message": exception_messages.EXCEPTION_404_JOBS_DISABLED,
+            },
+        )
 
-@router.get("/instrument/{instrument_id}")
+
+@router.get("/instrument/{instrument_id}", response_model=Instrument)
 async def get_instrument_by_uuid(
+    request: Request,
     instrument_id: UUID = INSTRUMENT_ID_PATH,
     version: str = Query(description="Validator version of the instrument required"),
-) -> Instrument:
+    fields: str | None = Query(
+        default=None,
+        description="Comma-separated top-level fields of the instrument to return, e.g. title,metadata",
+    ),
+    request_timeout: float | None = Header(
+        default=None,
+        alias=REQUEST_TIMEOUT_HEADER,
+        gt=0,
+        description="Seconds the caller will wait for the instrument, capped by the service",
+    ),
+    settings: Settings = SETTINGS,
+) -> JSONResponse:
     """Retrieve an instrument by its UUID and version."""
-    logger.debug("Receiving the instrument id...", instrument_id=instrument_id)
-    logger.info("Instrument received successfully.")
+    access_log.annotate(instrument_id=str(instrument_id), version=version)
 
-    try:
-        logger.debug("Received version.", version=version)
-        logger.debug("Validating the version...")
+    with _translate_errors(instrument_id):
         validate_version(version)
         target_version = version
+        field_names = parse_fields(fields)
 
-        instrument = await retrieval.retrieve_instrument(instrument_id)
+        client = client_identity(request.headers, settings)
+        await get_rate_limiter(settings).check(client)
+        # Unknown instruments are rejected before waiting for admission, so retries of them cannot fill the queue.
+        retrieval.reject_if_not_found(instrument_id, settings)
+        with request_deadline(resolve_deadline_seconds(request_timeout, settings)):
+            queued_at = time.perf_counter()
+            async with get_request_limiter(settings).slot(client):
+                access_log.record_stage("admission", time.perf_counter() - queued_at)
+                # The retrieved instrument is passed straight through so that only the conversion service holds
+                # a reference to it, letting it be freed once the conversion request has been serialised.
+                converted_instrument = await conversion.convert_instrument(
+                    await retrieval.retrieve_instrument(instrument_id, settings),
+                    target_version,
+                    settings,
+                    instrument_id=instrument_id,
+                )
 
-        return await conversion.convert_instrument(instrument, target_version)
+        # Returning a response directly skips FastAPI's response model validation, which would deep-copy
+        # the instrument before serialising it.
+        return JSONResponse(content=project_fields(converted_instrument, field_names))
 
-    except HTTPException:
-        raise  # re-raise so FastAPI handles it properly
-    except Exception as exc:
-        logger.exception("An exception occurred while processing the instrument")
+
+@router.get("/instrument/{instrument_id}/metadata")
+async def get_instrument_metadata(
+    request: Request,
+    instrument_id: UUID = INSTRUMENT_ID_PATH,
+    settings: Settings = SETTINGS,
+) -> JSONResponse:
+    """Retrieve the version, size, content hash and header fields of an instrument, from cache where possible."""
+    access_log.annotate(instrument_id=str(instrument_id))
+    with _translate_errors(instrument_id):
+        client = client_identity(request.headers, settings)
+        await get_rate_limiter(settings).check(client)
+        metadata = await retrieval.cached_metadata(instrument_id, settings)
+        cache_status = "hit"
+        if metadata is None:
+            cache_status = "miss"
+            retrieval.reject_if_not_found(instrument_id, settings)
+            with request_deadline(resolve_deadline_seconds(None, settings)):
+                queued_at = time.perf_counter()
+                async with get_request_limiter(settings).slot(client):
+                    access_log.record_stage("admission", time.perf_counter() - queued_at)
+                    metadata = await retrieval.retrieve_instrument_metadata(instrument_id, settings)
+
+        access_log.annotate(metadata_cache=cache_status)
+        return JSONResponse(
+            content={"instrument_id": str(instrument_id), **metadata.to_dict(), "cache_status": cache_status},
+        )
+
+
+@router.post("/instrument/{instrument_id}/jobs", status_code=202)
+async def submit_conversion_job(
+    request: Request,
+    instrument_id: UUID = INSTRUMENT_ID_PATH,
+    version: str = Query(description="Validator version of the instrument required"),
+    settings: Settings = SETTINGS,
+) -> JSONResponse:
+    """Start retrieving and converting an instrument in the background, for instruments too slow to convert in time.
+
+    The response points to the job's status, which points to the converted instrument once the job has succeeded.
+    """
+    _require_conversion_jobs(settings)
+    access_log.annotate(instrument_id=str(instrument_id), version=version)
+    with _translate_errors(instrument_id):
+        validate_version(version)
+        client = client_identity(request.headers, settings)
+        await get_rate_limiter(settings).check(client)
+        retrieval.reject_if_not_found(instrument_id, settings)
+        job = get_conversion_jobs(settings).submit(instrument_id, version)
+        access_log.annotate(job_id=job.job_id)
+
+        status_url = f"/instrument/jobs/{job.job_id}"
+        return JSONResponse(
+            status_code=202,
+            content={**job.to_dict(), "status_url": status_url},
+            headers={"Location": status_url},
+        )
+
+
+@router.get("/instrument/jobs/{job_id}")
+async def get_conversion_job(
+    job_id: str = Path(..., description="ID of the conversion job"),
+    settings: Settings = SETTINGS,
+) -> JSONResponse:
+    """Retrieve the status of a conversion job, with the URL of the converted instrument once it has succeeded."""
+    _require_conversion_jobs(settings)
+    job = get_conversion_jobs(settings).get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=500,
+            status_code=404,
             detail={
                 "status": "error",
-                "message": exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING,
+                "message": exception_messages.EXCEPTION_404_JOB_NOT_FOUND,
             },
-        ) from exc
+        )
+    return JSONResponse(content=job.to_dict())
@@ -0,0 +1,137 @@
+"""Production server entry point for the EQ CIR Proxy Service.
+
+Runs the application under uvicorn with one worker process, or WEB_CONCURRENCY of them, the fastest available event
+loop and HTTP parser, and graceful shutdown. Start it with ``python -m eq_cir_proxy_service.server``.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+from collections.abc import Sequence
+from typing import Any
+
+import uvicorn
+from dotenv import load_dotenv
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.logging_config import setup_logging
+from eq_cir_proxy_service.config.settings import get_settings
+from eq_cir_proxy_service.utils.startup import format_startup_report, measure_import_times
+
+logger = get_logger()
+
+APP = "eq_cir_proxy_service.main:app"
+
+DEFAULT_HOST = "0.0.0.0"  # noqa: S104 - the service runs in a container behind Cloud Run's front end
+DEFAULT_PORT = 5050
+DEFAULT_BACKLOG = 2048
+# One process per instance: the CPU count seen in a container is the host's rather than its CPU limit, and caches,
+# limiters, metrics, jobs and profiles are kept in each process, so more workers must be asked for explicitly.
+DEFAULT_WORKERS = 1
+DEFAULT_KEEP_ALIVE_SECONDS = 75
+# Cloud Run allows 10 seconds between SIGTERM and SIGKILL, so in-flight requests get most of that to drain.
+DEFAULT_GRACEFUL_SHUTDOWN_SECONDS = 8
+
+
+def _is_installed(module: str) -> bool:
+    """Checks whether an optional module can be imported, without importing it."""
+    return importlib.util.find_spec(module) is not None
+
+
+def default_workers() -> int:
+    """Returns the default worker count: WEB_CONCURRENCY if set, otherwise a single worker."""
+    return int(os.getenv("WEB_CONCURRENCY") or DEFAULT_WORKERS)
+
+
+def resolve_loop(loop: str) -> str:
+    """Resolves ``auto`` to uvloop when it is installed, otherwise the default asyncio loop."""
+    if loop != "auto":
+        return loop
+    return "uvloop" if _is_installed("uvloop") else "asyncio"
+
+
+def resolve_http(http: str) -> str:
+    """Resolves ``auto`` to the httptools parser when it is installed, otherwise h11."""
+    if http != "auto":
+        return http
+    return "httptools" if _is_installed("httptools") else "h11"
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    """Parses the command line, defaulting each option from its environment variable.
+
+    Exits with a usage error if more than one worker is asked for while conversion jobs are enabled.
+    """
+    parser = argparse.ArgumentParser(prog="python -m eq_cir_proxy_service.server", description=__doc__)
+    parser.add_argument("--host", default=os.getenv("HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT") or DEFAULT_PORT))
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Number of worker processes.")
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default=os.getenv("SERVER_LOOP", "auto"))
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], default=os.getenv("SERVER_HTTP", "auto"))
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=int(os.getenv("SERVER_BACKLOG") or DEFAULT_BACKLOG),
+        help="Maximum number of pending connections.",
+    )
+    parser.add_argument(
+        "--timeout-keep-alive",
+        type=int,
+        default=int(os.getenv("SERVER_KEEP_ALIVE_SECONDS") or DEFAULT_KEEP_ALIVE_SECONDS),
+        help="Seconds to keep idle client connections open.",
+    )
+    parser.add_argument(
+        "--timeout-graceful-shutdown",
+        type=int,
+        default=int(os.getenv("SERVER_GRACEFUL_SHUTDOWN_SECONDS") or DEFAULT_GRACEFUL_SHUTDOWN_SECONDS),
+        help="Seconds to wait for in-flight requests to finish on shutdown.",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="Print a breakdown of the application's import time by package, then exit.",
+    )
+    args = parser.parse_args(argv)
+    # Conversion jobs live in the process that accepted them, so another worker would not find them.
+    if args.workers > 1 and not args.startup_report and get_settings().conversion_jobs_enabled:
+        parser.error("more than one worker needs CONVERSION_JOBS_ENABLED=false, as jobs are kept per process")
+    return args
+
+
+def build_server_options(args: argparse.Namespace) -> dict[str, Any]:
+    """Builds the uvicorn.run keyword arguments for the parsed command line."""
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": resolve_loop(args.loop),
+        "http": resolve_http(args.http),
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.timeout_keep_alive,
+        "timeout_graceful_shutdown": args.timeout_graceful_shutdown,
+        # Cloud Run terminates TLS and forwards the client address.
+        "proxy_headers": True,
+        "forwarded_allow_ips": "*",
+        # The application logs its own access log records, sampled and with the request ID.
+        "access_log": False,
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Starts the production server."""
+    # Load .env as the application does, before the command line defaults and settings are read from the environment.
+    load_dotenv(".env")
+    args = parse_args(argv)
+    if args.startup_report:
+        sys.stdout.write(format_startup_report(measure_import_times()))
+        return
+
+    setup_logging()
+    options = build_server_options(args)
+    logger.info("Starting server.", **options)
+    uvicorn.run(APP, **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""This module caches retrieved and converted instruments, with an index of the retrieved instruments' metadata."""
+
+import asyncio
+import hashlib
+import time
+from dataclasses import asdict, dataclass
+from functools import cache
+from pathlib import Path
+
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import Settings
+from eq_cir_proxy_service.types.custom_types import Instrument
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.blob_cache import BlobCache
+from eq_cir_proxy_service.utils.cache import LRUCache
+from eq_cir_proxy_service.utils.disk_cache import DiskCache
+
+logger = get_logger()
+
+# Top-level instrument fields copied into the metadata index, for callers that only need an instrument's header.
+METADATA_FIELDS = ("survey_id", "form_type", "title", "language", "data_version")
+
+
+@dataclass(frozen=True)
+class InstrumentMetadata:
+    """Metadata of a retrieved instrument, small enough to keep for many more instruments than their bodies."""
+
+    validator_version: str | None
+    size_bytes: int
+    content_hash: str
+    retrieved_at: float
+    fields: dict[str, str]
+
+    @classmethod
+    def from_instrument(cls, instrument: Instrument, body: bytes | bytearray) -> "InstrumentMetadata":
+        """Builds the metadata of an instrument from its parsed form and the response body it was parsed from."""
+        validator_version = instrument.get("validator_version")
+        return cls(
+            validator_version=None if validator_version is None else str(validator_version),
+            size_bytes=len(body),
+            content_hash=f"sha256:{hashlib.sha256(body).hexdigest()}",
+            retrieved_at=time.time(),
+            fields={field: str(instrument[field]) for field in METADATA_FIELDS if field in instrument},
+        )
+
+    def to_dict(self) -> dict:
+        """Returns the metadata as a JSON-serialisable dictionary."""
+        return asdict(self)
+
+
+class InstrumentCache:
+    """Caches CIR and Converter Service response bodies, and keeps an index of the metadata of retrieved instruments.
+
+    Bodies are cached in memory as received, without being re-serialised, and only parsed when a request needs them.
+    Each distinct body is stored once, compressed, however many instruments or conversions it is cached for, so the
+    variants of an instrument that do not differ share their memory, and the cache's byte budget counts the
+    compressed bytes it really holds. With CACHE_COMPRESSION_ENABLED off, bodies are stored as received without being
+    copied. The metadata index is bounded by its number of entries and usually
+    outlives the bodies, so metadata requests can be answered for instruments whose bodies have been evicted.
+
+    When DISK_CACHE_DIR is set, bodies are also written to a persistent disk cache below the memory cache, shared by
+    the worker processes, so a restarted or newly started worker on the same node starts warm. Disk writes happen in
+    the background, off the request path; disk reads happen in a worker thread and promote the body back into memory.
+
+    Conversions are cached under the ID of the instrument they were converted from, so that they can be invalidated
+    along with it when CIR publishes a new version.
+
+    IDs that CIR did not find are remembered for a short time, in memory only, so that clients retrying an unknown
+    instrument are answered without a round trip to CIR. Only exact IDs are kept, so a known instrument is never
+    mistaken for a missing one.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        """Initialise the memory caches, metadata index and, if configured, the disk cache."""
+        self.bodies = BlobCache(
+            "instrument",
+            max_bytes=settings.retrieval_cache_max_bytes,
+            ttl_seconds=settings.retrieval_cache_ttl_seconds,
+            compress=settings.cache_compression_enabled,
+        )
+        self.conversions = BlobCache(
+            "conversion",
+            max_bytes=settings.conversion_cache_max_bytes,
+            ttl_seconds=settings.retrieval_cache_ttl_seconds,
+            compress=settings.cache_compression_enabled,
+        )
+        self.metadata: LRUCache[InstrumentMetadata] = LRUCache(
+            "instrument_metadata",
+            max_entries=settings.metadata_index_max_entries,
+            ttl_seconds=settings.retrieval_cache_ttl_seconds,
+        )
+        self.not_found: LRUCache[bool] = LRUCache(
+            "instrument_not_found",
+            max_entries=settings.negative_cache_max_entries,
+            ttl_seconds=settings.negative_cache_ttl_seconds,
+        )
+        self.disk = (
+            DiskCache(
+                Path(settings.disk_cache_dir),
+                max_bytes=settings.disk_cache_max_bytes,
+                ttl_seconds=settings.disk_cache_ttl_seconds,
+                mmap_threshold=settings.disk_cache_mmap_threshold_bytes,
+            )
+            if settings.disk_cache_dir
+            else None
+        )
+        self._disk_writes: set[asyncio.Task[None]] = set()
+
+    async def get_body(self, key: str) -> bytes | bytearray | None:
+        """Returns the cached CIR response body for an instrument ID, or None if it is not cached."""
+        return await self._get(self.bodies, "instrument", key)
+
+    async def get_conversion(self, instrument_id: str, key: str) -> bytes | bytearray | None:
+        """Returns the cached Converter Service response body for a conversion of an instrument, or None."""
+        return await self._get(self.conversions, "conversion", f"{instrument_id}/{key}")
+
+    async def conversion_keys(self, instrument_id: str, prefix: str) -> set[str]:
+        """Returns the keys of an instrument's cached conversions that start with the prefix, from every tier.
+
+        The keys may include entries that have expired, for which get_conversion returns None.
+        """
+        memory_prefix = f"{instrument_id}/"
+        disk_prefix = f"conversion/{memory_prefix}"
+        keys = {key.removeprefix(memory_prefix) for key in self.conversions.keys_with_prefix(memory_prefix + prefix)}
+        if self.disk is not None:
+            disk_keys = await asyncio.to_thread(self.disk.keys_with_prefix, disk_prefix + prefix)
+            keys.update(key.removeprefix(disk_prefix) for key in disk_keys)
+        return keys
+
+    def is_not_found(self, key: str) -> bool:
+        """Whether CIR recently reported that it has no instrument with the ID."""
+        return self.not_found.get(key) is not None
+
+    def store_not_found(self, key: str) -> None:
+        """Remembers that CIR has no instrument with the ID."""
+        self.not_found.set(key, value=True)
+
+    def store(self, key: str, instrument: Instrument, body: bytes | bytearray) -> InstrumentMetadata:
+        """Caches a retrieved instrument's body and indexes its metadata.
+
+        The body must not be modified afterwards, as it is cached without being copied.
+        """
+        metadata = InstrumentMetadata.from_instrument(instrument, body)
+        self._set(self.bodies, "instrument", key, body, digest=metadata.content_hash.removeprefix("sha256:"))
+        self.metadata.set(key, metadata)
+        return metadata
+
+    def store_conversion(self, instrument_id: str, key: str, body: bytes | bytearray) -> None:
+        """Caches a converted instrument's body. The body must not be modified afterwards."""
+        self._set(self.conversions, "conversion", f"{instrument_id}/{key}", body)
+
+    async def invalidate(self, instrument_id: str) -> int:
+        """Evicts an instrument's body, metadata and conversions from every tier, and forgets that it was not found.
+
+        Returns the number of entries evicted, counting each tier separately.
+        """
+        metrics.increment("cache_invalidations_total", labels={"scope": "instrument"})
+        evicted = sum(int(cache.delete(instrument_id)) for cache in (self.bodies, self.metadata, self.not_found))
+        if self.disk is not None:
+            await self._flush_disk_writes()
+            evicted += int(await asyncio.to_thread(self.disk.delete, f"instrument/{instrument_id}"))
+        return evicted + await self._invalidate_conversions(instrument_id)
+
+    async def invalidate_conversions(self, instrument_id: str) -> int:
+        """Evicts every conversion of an instrument from every tier, returning the number of entries evicted."""
+        metrics.increment("cache_invalidations_total", labels={"scope": "conversions"})
+        return await self._invalidate_conversions(instrument_id)
+
+    async def clear(self) -> int:
+        """Evicts every entry from every tier, returning the number of entries evicted."""
+        metrics.increment("cache_invalidations_total", labels={"scope": "all"})
+        evicted = self.bodies.clear() + self.conversions.clear() + self.metadata.clear() + self.not_found.clear()
+        if self.disk is not None:
+            await self._flush_disk_writes()
+            evicted += await asyncio.to_thread(self.disk.delete_prefix, "")
+        return evicted
+
+    async def aclose(self) -> None:
+        """Waits for background disk writes to finish."""
+        await self._flush_disk_writes()
+
+    async def _invalidate_conversions(self, instrument_id: str) -> int:
+        """Evicts every conversion of an instrument from every tier."""
+        evicted = self.conversions.delete_prefix(f"{instrument_id}/")
+        if self.disk is not None:
+            await self._flush_disk_writes()
+            evicted += await asyncio.to_thread(self.disk.delete_prefix, f"conversion/{instrument_id}/")
+        return evicted
+
+    async def _flush_disk_writes(self) -> None:
+        """Waits for pending background disk writes, so that none of them lands after an eviction."""
+        if self._disk_writes:
+            await asyncio.gather(*self._disk_writes, return_exceptions=True)
+
+    async def _get(self, memory: BlobCache, kind: str, key: str) -> bytes | bytearray | None:
+        """Looks a body up in memory, then on disk, promoting a body found on disk into memory."""
+        body = memory.get(key)
+        if body is None and self.disk is not None:
+            body = await asyncio.to_thread(self.disk.get, f"{kind}/{key}")
+            if body is not None:
+                memory.set(key, body)
+        return body
+
+    def _set(
+        self,
+        memory: BlobCache,
+        kind: str,
+        key: str,
+        body: bytes | bytearray,
+        *,
+        digest: str | None = None,
+    ) -> None:
+        """Caches a body in memory, and writes it to disk in the background."""
+        memory.set(key, body, digest=digest)
+        if self.disk is not None:
+            task = asyncio.get_running_loop().create_task(self._write_to_disk(self.disk, f"{kind}/{key}", body))
+            self._disk_writes.add(task)
+            task.add_done_callback(self._disk_writes.discard)
+
+    @staticmethod
+    async def _write_to_disk(disk: DiskCache, disk_key: str, body: bytes | bytearray) -> None:
+        """Writes a body to the disk cache in a worker thread, logging rather than raising on failure."""
+        try:
+            await asyncio.to_thread(disk.set, disk_key, body)
+        except OSError:
+            logger.exception("Failed to write to the disk cache.", key=disk_key)
+
+
+@cache
+def get_instrument_cache(settings: Settings) -> InstrumentCache:
+    """Returns the instrument cache for the application's settings."""
+    return InstrumentCache(settings)
@@ -1,23 +1,37 @@
 """This module requests conversion of the instrument from Converter Service."""
 
-import os
+import hashlib
+import json
+from uuid import UUID
 
 from fastapi import HTTPException, status
-from httpx import RequestError
+from httpx import RequestError, TimeoutException
 from semver import Version
 from structlog import get_logger
 
+from eq_cir_proxy_service.config.settings import Settings
 from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.services.instrument.cache import InstrumentCache, get_instrument_cache
+from eq_cir_proxy_service.services.validators.instrument import validate_instrument
 from eq_cir_proxy_service.types.custom_types import Instrument
+from eq_cir_proxy_service.utils import access_log, metrics
+from eq_cir_proxy_service.utils.concurrency import get_upstream_limiter
+from eq_cir_proxy_service.utils.deadline import check_deadline, upstream_deadline, upstream_timeout
 from eq_cir_proxy_service.utils.iap import get_api_client
+from eq_cir_proxy_service.utils.streaming import (
+    ERROR_BODY_LOG_LIMIT,
+    PayloadTooLargeError,
+    read_body,
+)
+from eq_cir_proxy_service.utils.version import parse_version
 
 logger = get_logger()
 
 
 def safe_parse(source: str, version: str) -> Version:
-    """Safely parses a version string into a Version object."""
+    """Safely parses a version string into a Version object, using the shared version cache."""
     try:
-        return Version.parse(version)
+        return parse_version(version)
     except ValueError as e:
         # Logs full traceback with context
         logger.exception("Error parsing version:", source=source, version=version)
@@ -31,13 +45,199 @@ def safe_parse(source: str, version: str) -> Version:
         ) from e
 
 
-async def convert_instrument(instrument: Instrument, target_version: str) -> Instrument:
+async def _request_conversion(
+    settings: Settings,
+    request_body: bytes,
+    params: dict[str, str],
+    cache_key: tuple[str, str],
+) -> Instrument:
+    """Posts an instrument to the Converter Service, streaming the response with a size limit.
+
+    Successful conversions are cached under the cache key.
+
+    Parameters:
+    - settings: The application settings.
+    - request_body: The serialised conversion request.
+    - params: The current and target version query parameters.
+    - cache_key: The source instrument's ID and the conversion's key, to cache the converted instrument under.
+
+    Returns:
+    - Instrument: The converted instrument.
+
+    Raises:
+    - HTTPException: 500 if the Converter Service cannot be reached or does not return a converted instrument.
+    """
+    async with (
+        get_upstream_limiter(settings, settings.converter_service).slot(),
+        get_api_client(settings.converter_service) as converter_service_api_client,
+    ):
+        try:
+            async with (
+                upstream_deadline("conversion"),
+                converter_service_api_client.stream(
+                    "POST",
+                    settings.converter_service.endpoint,
+                    content=request_body,
+                    headers={"Content-Type": "application/json"},
+                    params=params,
+                    timeout=upstream_timeout(converter_service_api_client),
+                ) as response,
+            ):
+                if response.status_code == 200:
+                    body = await read_body(response, settings.max_instrument_size_bytes)
+                else:
+                    body = await read_body(response, ERROR_BODY_LOG_LIMIT, truncate=True)
+        except RequestError as e:
+            if isinstance(e, TimeoutException):
+                check_deadline("conversion")
+            logger.exception("Error occurred while converting instrument.", error=e)
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "status": "error",
+                    "message": "Error connecting to Converter Service.",
+                },
+            ) from e
+        except PayloadTooLargeError as e:
+            logger.exception("Converted instrument exceeds the maximum size.", size=e.size, max_size=e.max_bytes)
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "status": "error",
+                    "message": exception_messages.EXCEPTION_500_INSTRUMENT_TOO_LARGE,
+                },
+            ) from e
+
+    if response.status_code != 200:
+        logger.error(
+            "Failed to convert instrument.",
+            status=response.status_code,
+            response_text=body.decode(errors="replace"),
+        )
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING,
+            },
+        )
+
+    instrument_data: Instrument = json.loads(body)
+    if settings.validate_upstream_instruments:
+        validate_instrument(instrument_data, source="converter_service")
+    get_instrument_cache(settings).store_conversion(*cache_key, body)
+    return instrument_data
+
+
+async def _cached_intermediate(
+    instrument_cache: InstrumentCache,
+    instrument_id: str,
+    source_key: str,
+    current_version: str,
+    target_version: str,
+) -> tuple[str, bytes | bytearray] | None:
+    """Returns the highest cached conversion of a source instrument to a version between its own and the target.
+
+    Parameters:
+    - instrument_cache: The instrument cache.
+    - instrument_id: The ID of the instrument.
+    - source_key: The prefix of the conversion keys of the source instrument.
+    - current_version: The version of the source instrument.
+    - target_version: The target version of the conversion.
+
+    Returns:
+    - tuple: The intermediate version and its cached body, or None if no intermediate version is cached.
+    """
+    lowest, highest = parse_version(current_version), parse_version(target_version)
+    # Conversion keys end in a target version, which was validated before the conversion was cached.
+    keys = await instrument_cache.conversion_keys(instrument_id, source_key)
+    versions = [key.removeprefix(source_key) for key in keys]
+    intermediate_versions = [version for version in versions if lowest < parse_version(version) < highest]
+    for version in sorted(intermediate_versions, key=parse_version, reverse=True):
+        body = await instrument_cache.get_conversion(instrument_id, source_key + version)
+        if body is not None:
+            return version, body
+    return None
+
+
+async def _convert_reusing_cache(
+    settings: Settings,
+    instrument_id: str,
+    request_body: bytes,
+    current_version: str,
+    target_version: str,
+) -> Instrument:
+    """Converts a serialised instrument, reusing cached conversions of the same source instrument.
+
+    An exact match is served from the cache without calling the Converter Service. Otherwise, if the source has been
+    converted to a version between its own and the target, the conversion starts from the highest such version, so
+    the Converter Service has fewer upgrade steps to apply. Either way, the result is cached under the source.
+
+    Parameters:
+    - settings: The application settings.
+    - instrument_id: The ID of the instrument.
+    - request_body: The serialised conversion request for the source instrument.
+    - current_version: The version of the source instrument.
+    - target_version: The target version of the conversion.
+
+    Returns:
+    - Instrument: The converted instrument.
+    """
+    instrument_cache = get_instrument_cache(settings)
+    # The request body identifies the source instrument exactly, so its hash keys the source's conversions.
+    source_key = f"{hashlib.sha256(request_body).hexdigest()}:"
+    cached_body = await instrument_cache.get_conversion(instrument_id, source_key + target_version)
+    if cached_body is not None:
+        logger.debug("Converted instrument served from cache.", target_version=target_version)
+        metrics.increment("conversion_reuse_total", labels={"result": "exact"})
+        access_log.annotate(conversion_cache="exact")
+        cached_instrument: Instrument = json.loads(cached_body)
+        return cached_instrument
+
+    intermediate = await _cached_intermediate(
+        instrument_cache,
+        instrument_id,
+        source_key,
+        current_version,
+        target_version,
+    )
+    if intermediate is None:
+        metrics.increment("conversion_reuse_total", labels={"result": "miss"})
+        access_log.annotate(conversion_cache="miss")
+    else:
+        current_version, intermediate_body = intermediate
+        logger.debug(
+            "Converting from a cached intermediate version.",
+            intermediate_version=current_version,
+            target_version=target_version,
+        )
+        metrics.increment("conversion_reuse_total", labels={"result": "intermediate"})
+        access_log.annotate(conversion_cache="intermediate")
+        # The cached body is a Converter Service response, so it is wrapped into a request without being parsed.
+        request_body = b'{"instrument":' + intermediate_body + b"}"
+
+    return await _request_conversion(
+        settings,
+        request_body,
+        params={"current_version": current_version, "target_version": target_version},
+        cache_key=(instrument_id, source_key + target_version),
+    )
+
+
+async def convert_instrument(
+    instrument: Instrument,
+    target_version: str,
+    settings: Settings,
+    *,
+    instrument_id: UUID,
+) -> Instrument:
     """Requests conversion of the instrument from Converter Service.
 
     Parameters:
     - instrument: The instrument.
-    - current_version: The current version of the instrument.
     - target_version: The target version of the instrument.
+    - settings: The application settings.
+    - instrument_id: The ID of the instrument, which conversions are cached under.
 
     Returns:
     - dict: The converted instrument.
@@ -60,43 +260,25 @@ async def convert_instrument(instrument: Instrument, target_version: str) -> Ins
             target_version=target_version,
         )
 
-        converter_service_endpoint = os.getenv("CONVERTER_SERVICE_CONVERT_CI_ENDPOINT", "/schema")
+        # Don't start a conversion whose result the caller will never see.
+        check_deadline("conversion")
 
-        if not converter_service_endpoint:
-            logger.error("CONVERTER_SERVICE_CONVERT_CI_ENDPOINT is not configured.")
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    "status": "error",
-                    "message": "CONVERTER_SERVICE_CONVERT_CI_ENDPOINT configuration is missing.",
-                },
-            )
+        # Serialise the request body up front and drop this frame's reference to the instrument, so the
+        # parsed source instrument can be freed while the Converter Service is working.
+        request_body = json.dumps({"instrument": instrument}, separators=(",", ":")).encode()
+        del instrument
 
-        async with get_api_client(
-            url_env="CONVERTER_SERVICE_API_BASE_URL",
-            iap_env="CONVERTER_SERVICE_IAP_CLIENT_ID",
-        ) as converter_service_api_client:
-            try:
-                response = await converter_service_api_client.post(
-                    converter_service_endpoint,
-                    json={"instrument": instrument},
-                    params={"current_version": current_version, "target_version": target_version},
-                )
-            except RequestError as e:
-                logger.exception("Error occurred while converting instrument.", error=e)
-                raise HTTPException(
-                    status_code=500,
-                    detail={
-                        "status": "error",
-                        "message": "Error connecting to Converter Service.",
-                    },
-                ) from e
-
-        instrument_data: Instrument = response.json()
-        return instrument_data
+        with access_log.stage("conversion"):
+            return await _convert_reusing_cache(
+                settings,
+                str(instrument_id),
+                request_body,
+                current_version,
+                target_version,
+            )
 
     if parsed_current_version == parsed_target_version:
-        logger.info("Instrument version matches the target")
+        logger.debug("Instrument version matches the target")
         return instrument
 
     logger.warning("Instrument version is higher than target")
@@ -0,0 +1,212 @@
+"""This module runs conversions as background jobs, for instruments too large to convert within a client's timeout."""
+
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Literal
+from urllib.parse import urlencode
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException
+from structlog import get_logger
+from structlog.contextvars import bound_contextvars
+
+from eq_cir_proxy_service.config.settings import Settings
+from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.services.instrument import conversion, retrieval
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.concurrency import ConcurrencyLimitExceededError
+from eq_cir_proxy_service.utils.deadline import DeadlineExceededError, request_deadline
+
+logger = get_logger()
+
+# Name of the job queue in logs and the concurrency_rejected_total metric.
+JOB_LIMITER = "conversion_jobs"
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+@dataclass
+class ConversionJob:
+    """A request to retrieve an instrument and convert it to a version, and its progress."""
+
+    job_id: str
+    instrument_id: UUID
+    version: str
+    status: JobStatus = "queued"
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    error: dict | None = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has succeeded or failed."""
+        return self.status in {"succeeded", "failed"}
+
+    def to_dict(self) -> dict:
+        """Returns the job as a JSON-serialisable dictionary, with the URL of its result once it has succeeded."""
+        job = {
+            "job_id": self.job_id,
+            "instrument_id": str(self.instrument_id),
+            "version": self.version,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "succeeded":
+            job["result_url"] = f"/instrument/{self.instrument_id}?{urlencode({'version': self.version})}"
+        if self.error is not None:
+            job["error"] = self.error
+        return job
+
+
+class ConversionJobs:
+    """Runs conversion jobs in a bounded pool of worker tasks, keeping the most recent jobs for status requests.
+
+    A job retrieves and converts an instrument exactly as a request to /instrument would, so its result lands in the
+    instrument cache and is then served from there. Jobs run under their own, longer deadline and outside admission
+    control; the upstream limiters still cap the calls they make. A job submitted for an instrument and version that
+    is already queued or running is not started again: the existing job is returned instead.
+
+    Workers are started on the first submission, in the event loop that serves it.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        """Initialise the pool without workers or jobs."""
+        self.settings = settings
+        self._queue: asyncio.Queue[ConversionJob] = asyncio.Queue()
+        self._jobs: OrderedDict[str, ConversionJob] = OrderedDict()
+        # Unfinished jobs by instrument ID and version, so duplicate submissions share a job.
+        self._unfinished: dict[tuple[UUID, str], ConversionJob] = {}
+        self._workers: list[asyncio.Task[None]] = []
+        self._running = 0
+        self._publish()
+
+    def submit(self, instrument_id: UUID, version: str) -> ConversionJob:
+        """Queues a job to convert an instrument to a version, or returns the unfinished job already doing so.
+
+        Parameters:
+        - instrument_id: The ID of the instrument.
+        - version: The validated target version.
+
+        Returns:
+        - ConversionJob: The queued or unfinished job.
+
+        Raises:
+        - ConcurrencyLimitExceededError: If the maximum number of jobs are already queued.
+        """
+        existing = self._unfinished.get((instrument_id, version))
+        if existing is not None:
+            return existing
+        if self._queue.qsize() >= self.settings.conversion_job_max_queued:
+            logger.warning("Conversion job queue full.", instrument_id=instrument_id, version=version)
+            labels = {"limiter": JOB_LIMITER, "reason": "queue_full"}
+            metrics.increment("concurrency_rejected_total", labels=labels)
+            raise ConcurrencyLimitExceededError(JOB_LIMITER, labels["reason"], self.settings.retry_after_seconds)
+
+        job = ConversionJob(job_id=uuid4().hex, instrument_id=instrument_id, version=version)
+        self._jobs[job.job_id] = job
+        self._unfinished[(instrument_id, version)] = job
+        self._queue.put_nowait(job)
+        self._start_workers()
+        self._publish()
+        logger.info("Conversion job queued.", job_id=job.job_id, instrument_id=instrument_id, version=version)
+        return job
+
+    def get(self, job_id: str) -> ConversionJob | None:
+        """Returns a job, or None if there is no job with the ID or it has been forgotten."""
+        return self._jobs.get(job_id)
+
+    async def aclose(self) -> None:
+        """Stops the workers, abandoning any running jobs."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def _start_workers(self) -> None:
+        """Starts the workers if they are not running.
+
+        Workers run in a context of their own, so that they do not log under, or add to the access log record of, the
+        request that happened to start them.
+        """
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [
+                loop.create_task(self._work(), context=contextvars.Context())
+                for _ in range(self.settings.conversion_job_workers)
+            ]
+
+    async def _work(self) -> None:
+        """Runs queued jobs one at a time until cancelled."""
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            self._publish()
+            try:
+                await self._run(job)
+            finally:
+                self._running -= 1
+                self._finish(job)
+
+    async def _run(self, job: ConversionJob) -> None:
+        """Retrieves and converts the job's instrument, recording the outcome on the job."""
+        job.status = "running"
+        started = time.monotonic()
+        try:
+            with bound_contextvars(job_id=job.job_id), request_deadline(self.settings.conversion_job_timeout_seconds):
+                await conversion.convert_instrument(
+                    await retrieval.retrieve_instrument(job.instrument_id, self.settings),
+                    job.version,
+                    self.settings,
+                    instrument_id=job.instrument_id,
+                )
+        except HTTPException as exc:
+            job.status, job.error = "failed", {"status_code": exc.status_code, "detail": exc.detail}
+        except ConcurrencyLimitExceededError:
+            job.status, job.error = "failed", self._error(503, exception_messages.EXCEPTION_503_SERVICE_OVERLOADED)
+        except DeadlineExceededError as exc:
+            logger.warning("Conversion job deadline exceeded.", job_id=job.job_id, stage=exc.stage)
+            job.status, job.error = "failed", self._error(504, exception_messages.EXCEPTION_504_DEADLINE_EXCEEDED)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("An exception occurred while running the conversion job", job_id=job.job_id)
+            job.status, job.error = "failed", self._error(500, exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING)
+        else:
+            job.status = "succeeded"
+        logger.info(
+            "Conversion job finished.",
+            job_id=job.job_id,
+            status=job.status,
+            duration_seconds=round(time.monotonic() - started, 3),
+        )
+
+    @staticmethod
+    def _error(status_code: int, message: str) -> dict:
+        """Returns a job error in the form of the HTTP error a request would have received."""
+        return {"status_code": status_code, "detail": {"status": "error", "message": message}}
+
+    def _finish(self, job: ConversionJob) -> None:
+        """Marks a job finished, forgetting the oldest finished jobs beyond the maximum kept."""
+        if not job.finished:
+            job.status, job.error = "failed", self._error(500, exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING)
+        job.finished_at = time.time()
+        self._unfinished.pop((job.instrument_id, job.version), None)
+        metrics.increment("conversion_jobs_total", labels={"status": job.status})
+        finished = [job_id for job_id, kept in self._jobs.items() if kept.finished]
+        for job_id in finished[: max(len(finished) - self.settings.conversion_job_max_kept, 0)]:
+            del self._jobs[job_id]
+        self._publish()
+
+    def _publish(self) -> None:
+        """Publishes the numbers of queued and running jobs as gauges."""
+        metrics.set_gauge("conversion_jobs_queued", self._queue.qsize())
+        metrics.set_gauge("conversion_jobs_running", self._running)
+
+
+@cache
+def get_conversion_jobs(settings: Settings) -> ConversionJobs:
+    """Returns the conversion job pool for the application's settings."""
+    return ConversionJobs(settings)
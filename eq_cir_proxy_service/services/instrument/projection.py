@@ -0,0 +1,21 @@
+"""This module projects an instrument down to the top-level fields requested by the client."""
+
+from eq_cir_proxy_service.types.custom_types import Instrument
+
+
+def project_fields(instrument: Instrument, fields: list[str] | None) -> Instrument:
+    """Returns only the requested top-level fields of the instrument.
+
+    Requested fields that the instrument does not have are omitted from the result. The field values are not
+    copied, so projecting costs one dictionary lookup per requested field.
+
+    Parameters:
+    - instrument: The instrument.
+    - fields: The top-level fields to keep, or None to keep them all.
+
+    Returns:
+    - Instrument: The projected instrument.
+    """
+    if fields is None:
+        return instrument
+    return {field: instrument[field] for field in fields if field in instrument}
@@ -1,52 +1,154 @@
 """This module retrieves the instrument from CIR using the instrument_id."""
 
-import os
+import json
 from uuid import UUID
 
 from fastapi import HTTPException
-from httpx import RequestError
+from httpx import RequestError, TimeoutException
 from structlog import get_logger
 
+from eq_cir_proxy_service.config.settings import Settings
 from eq_cir_proxy_service.exceptions.exception_messages import (
     EXCEPTION_404_INSTRUMENT_NOT_FOUND,
     EXCEPTION_500_INSTRUMENT_PROCESSING,
+    EXCEPTION_500_INSTRUMENT_TOO_LARGE,
 )
+from eq_cir_proxy_service.services.instrument.cache import (
+    InstrumentMetadata,
+    get_instrument_cache,
+)
+from eq_cir_proxy_service.services.validators.instrument import validate_instrument
 from eq_cir_proxy_service.types.custom_types import Instrument
+from eq_cir_proxy_service.utils import access_log
+from eq_cir_proxy_service.utils.concurrency import get_upstream_limiter
+from eq_cir_proxy_service.utils.deadline import check_deadline, upstream_deadline, upstream_timeout
+from eq_cir_proxy_service.utils.error_log import log_error_event
 from eq_cir_proxy_service.utils.iap import get_api_client
+from eq_cir_proxy_service.utils.streaming import (
+    ERROR_BODY_LOG_LIMIT,
+    PayloadTooLargeError,
+    read_body,
+)
 
 logger = get_logger()
 
 
-async def retrieve_instrument(instrument_id: UUID) -> Instrument:
-    """Retrieves the instrument from CIR.
+def reject_if_not_found(instrument_id: UUID, settings: Settings) -> None:
+    """Raises a 404 if CIR recently reported that it has no instrument with the ID, without contacting CIR.
+
+    The routers call this before a request waits for admission, so that retrieval itself does not check again.
 
     Parameters:
     - instrument_id: The ID of the instrument.
-
-    Returns:
-    - Instrument: The retrieved instrument.
+    - settings: The application settings.
     """
-    logger.debug("Retrieving instrument from CIR...", instrument_id=instrument_id)
-
-    cir_endpoint = os.getenv("CIR_RETRIEVE_CI_ENDPOINT", "/v2/retrieve_collection_instrument")
-
-    if not cir_endpoint:
-        logger.error("CIR_RETRIEVE_CI_ENDPOINT is not configured.")
+    if get_instrument_cache(settings).is_not_found(str(instrument_id)):
+        logger.debug("Instrument recently not found in CIR.", instrument_id=instrument_id)
+        access_log.annotate(instrument_cache="not_found")
         raise HTTPException(
-            status_code=500,
+            status_code=404,
             detail={
                 "status": "error",
-                "message": "CIR_RETRIEVE_CI_ENDPOINT configuration is missing.",
+                "message": EXCEPTION_404_INSTRUMENT_NOT_FOUND,
             },
         )
 
-    async with get_api_client(
-        url_env="CIR_API_BASE_URL",
-        iap_env="CIR_IAP_CLIENT_ID",
-    ) as cir_api_client:
+
+async def retrieve_instrument(instrument_id: UUID, settings: Settings) -> Instrument:
+    """Retrieves the instrument from the cache, or from CIR if it is not cached.
+
+    Parameters:
+    - instrument_id: The ID of the instrument.
+    - settings: The application settings.
+
+    Returns:
+    - Instrument: The retrieved instrument.
+    """
+    with access_log.stage("retrieval"):
+        body = await get_instrument_cache(settings).get_body(str(instrument_id))
+        if body is not None:
+            logger.debug("Instrument served from cache.", instrument_id=instrument_id)
+            access_log.annotate(instrument_cache="hit")
+            cached_instrument: Instrument = json.loads(body)
+            return cached_instrument
+
+        instrument, _ = await _fetch_instrument(instrument_id, settings)
+        return instrument
+
+
+async def cached_metadata(instrument_id: UUID, settings: Settings) -> InstrumentMetadata | None:
+    """Returns the metadata of an instrument from the metadata index, without contacting CIR.
+
+    If the instrument's metadata is not in the index but its body is cached, in memory or on disk, the metadata
+    is rebuilt from the body.
+
+    Parameters:
+    - instrument_id: The ID of the instrument.
+    - settings: The application settings.
+
+    Returns:
+    - InstrumentMetadata | None: The metadata, or None if the instrument is not cached.
+    """
+    key = str(instrument_id)
+    instrument_cache = get_instrument_cache(settings)
+    metadata = instrument_cache.metadata.get(key)
+    if metadata is None:
+        body = await instrument_cache.get_body(key)
+        if body is not None:
+            metadata = instrument_cache.store(key, json.loads(body), body)
+    return metadata
+
+
+async def retrieve_instrument_metadata(instrument_id: UUID, settings: Settings) -> InstrumentMetadata:
+    """Retrieves an instrument from CIR, caching it, and returns its metadata.
+
+    Parameters:
+    - instrument_id: The ID of the instrument.
+    - settings: The application settings.
+
+    Returns:
+    - InstrumentMetadata: The metadata of the retrieved instrument.
+    """
+    with access_log.stage("retrieval"):
+        _, metadata = await _fetch_instrument(instrument_id, settings)
+        return metadata
+
+
+async def _fetch_instrument(instrument_id: UUID, settings: Settings) -> tuple[Instrument, InstrumentMetadata]:
+    """Retrieves the instrument from CIR and caches it.
+
+    Parameters:
+    - instrument_id: The ID of the instrument.
+    - settings: The application settings.
+
+    Returns:
+    - tuple[Instrument, InstrumentMetadata]: The retrieved instrument and its metadata.
+    """
+    instrument_cache = get_instrument_cache(settings)
+    logger.debug("Retrieving instrument from CIR...", instrument_id=instrument_id)
+    access_log.annotate(instrument_cache="miss")
+
+    async with (
+        get_upstream_limiter(settings, settings.cir).slot(),
+        get_api_client(settings.cir) as cir_api_client,
+    ):
         try:
-            response = await cir_api_client.get(cir_endpoint, params={"guid": str(instrument_id)})
+            async with (
+                upstream_deadline("retrieval"),
+                cir_api_client.stream(
+                    "GET",
+                    settings.cir.endpoint,
+                    params={"guid": str(instrument_id)},
+                    timeout=upstream_timeout(cir_api_client),
+                ) as response,
+            ):
+                if response.status_code == 200:
+                    body = await read_body(response, settings.max_instrument_size_bytes)
+                else:
+                    body = await read_body(response, ERROR_BODY_LOG_LIMIT, truncate=True)
         except RequestError as e:
+            if isinstance(e, TimeoutException):
+                check_deadline("retrieval")
             logger.exception("Error occurred while retrieving instrument.", error=e)
             raise HTTPException(
                 status_code=500,
@@ -55,14 +157,39 @@ async def retrieve_instrument(instrument_id: UUID) -> Instrument:
                     "message": "Error connecting to CIR service.",
                 },
             ) from e
+        except PayloadTooLargeError as e:
+            logger.exception(
+                "Instrument exceeds the maximum size.",
+                instrument_id=instrument_id,
+                size=e.size,
+                max_size=e.max_bytes,
+            )
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "status": "error",
+                    "message": EXCEPTION_500_INSTRUMENT_TOO_LARGE,
+                },
+            ) from e
 
     if response.status_code == 200:
-        logger.info("Instrument retrieved successfully.", instrument_id=instrument_id)
-        instrument_data: Instrument = response.json()
-        return instrument_data
+        logger.debug("Instrument retrieved successfully.", instrument_id=instrument_id)
+        instrument_data: Instrument = json.loads(body)
+        if settings.validate_upstream_instruments:
+            validate_instrument(instrument_data, source="cir")
+        metadata = instrument_cache.store(str(instrument_id), instrument_data, body)
+        return instrument_data, metadata
+
+    response_text = body.decode(errors="replace")
 
     if response.status_code == 404:
-        logger.error("Instrument not found. Response: ", instrument_id=instrument_id, response_text=response.text)
+        instrument_cache.store_not_found(str(instrument_id))
+        log_error_event(
+            "instrument_not_found",
+            "Instrument not found.",
+            instrument_id=instrument_id,
+            response_text=response_text,
+        )
         raise HTTPException(
             status_code=404,
             detail={
@@ -75,7 +202,7 @@ async def retrieve_instrument(instrument_id: UUID) -> Instrument:
         "Failed to retrieve instrument.",
         instrument_id=instrument_id,
         status=response.status_code,
-        response_text=response.text,
+        response_text=response_text,
     )
     raise HTTPException(
         status_code=500,
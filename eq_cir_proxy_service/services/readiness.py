@@ -0,0 +1,130 @@
+"""This module computes the service's readiness in the background, so that readiness probes are cheap."""
+
+import asyncio
+import time
+from functools import cache
+
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import Settings
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+from eq_cir_proxy_service.utils.balancer import get_balancer
+from eq_cir_proxy_service.utils.concurrency import (
+    ConcurrencyLimiter,
+    get_request_limiter,
+    get_upstream_limiter,
+)
+from eq_cir_proxy_service.utils.iap import IAP_TOKEN_TTL_SECONDS, iap_token_age
+
+logger = get_logger()
+
+
+def _pool_report(limiter: ConcurrencyLimiter) -> dict:
+    """Returns the occupancy of a limiter, which is saturated when it would reject a new caller outright."""
+    return {
+        "in_flight": limiter.in_flight,
+        "max_in_flight": limiter.max_in_flight,
+        "queued": limiter.queued,
+        "max_queued": limiter.max_queued,
+        "saturated": limiter.in_flight >= limiter.max_in_flight and limiter.queued >= limiter.max_queued,
+    }
+
+
+def _token_report(audience: str | None) -> str:
+    """Returns the state of the cached IAP token for an audience: not_required, not_fetched, fresh or stale."""
+    if audience is None:
+        return "not_required"
+    age = iap_token_age(audience)
+    if age is None:
+        return "not_fetched"
+    return "fresh" if age < IAP_TOKEN_TTL_SECONDS else "stale"
+
+
+def check_readiness(settings: Settings) -> dict:
+    """Builds a readiness report from in-process state only, without calling any upstream service.
+
+    The service is ready unless its admission limiter is saturated, in which case new requests would be rejected
+    with a 503 and traffic is better sent to another instance. Upstream pools, replicas, IAP tokens and cache
+    warmness are reported for diagnosis, but do not make the service unready: those conditions are shared by every
+    instance.
+
+    Parameters:
+    - settings: The application settings.
+
+    Returns:
+    - dict: The readiness report.
+    """
+    admission = _pool_report(get_request_limiter(settings))
+    instrument_cache = get_instrument_cache(settings)
+    return {
+        "status": "unavailable" if admission["saturated"] else "ready",
+        "checked_at": time.time(),
+        "admission": admission,
+        "upstreams": {
+            upstream.name: {
+                "pool": _pool_report(get_upstream_limiter(settings, upstream)),
+                "iap_token": _token_report(upstream.iap_client_id),
+                "endpoints": get_balancer(upstream).report(),
+            }
+            for upstream in (settings.cir, settings.converter_service)
+        },
+        "cache": {
+            "instrument_entries": len(instrument_cache.bodies),
+            "conversion_entries": len(instrument_cache.conversions),
+            "metadata_entries": len(instrument_cache.metadata),
+            "disk_bytes": None if instrument_cache.disk is None else instrument_cache.disk.size,
+            "warm": len(instrument_cache.bodies) > 0,
+        },
+    }
+
+
+class ReadinessChecker:
+    """Recomputes the readiness report at a fixed interval in a background task.
+
+    Readiness probes read the latest report, so they cost nothing however often they are made. Changes of status
+    are logged; the checks themselves are not.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        """Initialise the checker without a report; one is computed as soon as the checker is started."""
+        self.settings = settings
+        self.report: dict | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the latest report says the service is ready."""
+        return self.report is not None and self.report["status"] == "ready"
+
+    def refresh(self) -> dict:
+        """Recomputes the report, logging if the status has changed."""
+        previous = None if self.report is None else self.report["status"]
+        self.report = check_readiness(self.settings)
+        if self.report["status"] != previous:
+            logger.info("Readiness changed.", status=self.report["status"], previous=previous)
+        return self.report
+
+    def start(self) -> None:
+        """Computes the first report and starts recomputing it in the background."""
+        self.refresh()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def aclose(self) -> None:
+        """Stops the background task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """Recomputes the report at the configured interval until cancelled."""
+        while True:
+            await asyncio.sleep(self.settings.readiness_check_interval_seconds)
+            self.refresh()
+
+
+@cache
+def get_readiness_checker(settings: Settings) -> ReadinessChecker:
+    """Returns the readiness checker for the application's settings."""
+    return ReadinessChecker(settings)
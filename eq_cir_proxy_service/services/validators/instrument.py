@@ -0,0 +1,77 @@
+"""This module contains the structural validation of instruments received from upstream services."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import HTTPException
+from structlog import get_logger
+
+from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.types.custom_types import Instrument
+
+logger = get_logger()
+
+# Expected JSON types of the top-level instrument fields the service and eQ Runner rely on. Only the top level
+# is checked, so validation costs a few dictionary lookups however large the instrument's sections are.
+INSTRUMENT_FIELD_TYPES: dict[str, type | tuple[type, ...]] = {
+    "validator_version": str,
+    "data_version": str,
+    "survey_id": str,
+    "form_type": str,
+    "title": str,
+    "language": str,
+    "metadata": list,
+    "sections": list,
+    "navigation": dict,
+    "questionnaire_flow": dict,
+    "submission": dict,
+    "post_submission": dict,
+}
+
+# Fields every instrument must have. The version is needed to decide whether, and from where, to convert it.
+REQUIRED_INSTRUMENT_FIELDS = ("validator_version",)
+
+
+def validate_instrument(instrument: Any, source: str) -> Instrument:
+    """Checks that an upstream response is a JSON object with the required fields and correctly typed known fields.
+
+    Other fields may be absent.
+
+    Parameters:
+    - instrument: The decoded upstream response.
+    - source: The upstream service, for logging.
+
+    Returns:
+    - Instrument: The instrument, unchanged.
+
+    Raises:
+    - HTTPException: 500 if the response is not a JSON object, lacks a required field or a known field has the wrong
+      type.
+    """
+    if isinstance(instrument, dict):
+        invalid_fields = [
+            field
+            for field, expected_type in INSTRUMENT_FIELD_TYPES.items()
+            if field in instrument and not isinstance(instrument[field], expected_type)
+        ]
+        missing_fields = [field for field in REQUIRED_INSTRUMENT_FIELDS if field not in instrument]
+        if not invalid_fields and not missing_fields:
+            return instrument
+    else:
+        invalid_fields, missing_fields = [], []
+
+    logger.error(
+        "Upstream service returned an invalid instrument.",
+        source=source,
+        response_type=type(instrument).__name__,
+        invalid_fields=invalid_fields,
+        missing_fields=missing_fields,
+    )
+    raise HTTPException(
+        status_code=500,
+        detail={
+            "status": "error",
+            "message": exception_messages.EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT,
+        },
+    )
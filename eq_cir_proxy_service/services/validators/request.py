@@ -3,25 +3,47 @@
 from __future__ import annotations
 
 from fastapi import HTTPException, status
-from semver import VersionInfo
-from structlog import get_logger
 
 from eq_cir_proxy_service.exceptions import exception_messages
-
-logger = get_logger()
+from eq_cir_proxy_service.utils.error_log import log_error_event
+from eq_cir_proxy_service.utils.version import is_valid_version
 
 
 def validate_version(version: str) -> None:
     """Checks if the version is a valid semver.
 
-    Raises an HTTPException if the version is invalid (is_valid check returns False).
+    Raises an HTTPException if the version is invalid (is_valid check returns False). Valid versions are
+    cached by the shared version parser, so the conversion service does not parse them again.
 
     Parameters:
     - version: The version to validate.
     """
-    if not VersionInfo.is_valid(version):
-        logger.exception("Invalid version.", version=version)
+    if not is_valid_version(version):
+        log_error_event("invalid_version", "Invalid version.", version=version)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"status": "error", "message": exception_messages.EXCEPTION_400_INVALID_VERSION},
         )
+
+
+def parse_fields(fields: str | None) -> list[str] | None:
+    """Parses the comma-separated list of top-level instrument fields requested by the client.
+
+    Raises an HTTPException if the parameter is given but names no fields.
+
+    Parameters:
+    - fields: The fields query parameter, if given.
+
+    Returns:
+    - list[str] | None: The requested field names in order, without duplicates, or None to return every field.
+    """
+    if fields is None:
+        return None
+    field_names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    if not field_names:
+        log_error_event("invalid_fields", "Invalid fields parameter.", fields=fields)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": exception_messages.EXCEPTION_400_INVALID_FIELDS},
+        )
+    return field_names
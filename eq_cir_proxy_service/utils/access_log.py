@@ -0,0 +1,142 @@
+"""One structured access log record per request, with a request ID bound to every log record made while serving it.
+
+The record is built up while the request is served: the router and services add the instrument, cache statuses and
+stage timings, and the upstream transports add the status of every upstream call. Successful requests are logged at
+the ACCESS_LOG_SAMPLE_RATE, while client and server errors and requests slower than ACCESS_LOG_SLOW_REQUEST_SECONDS
+are always logged. Sampling is decided from the request ID rather than at random, so it is repeatable for a given ID.
+"""
+
+import logging
+import re
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+from uuid import uuid4
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from structlog import get_logger
+from structlog.contextvars import bound_contextvars
+
+from eq_cir_proxy_service.config.settings import get_settings
+
+logger = get_logger()
+
+REQUEST_ID_HEADER = "X-Request-Id"
+# Request IDs sent by clients are used if they look like IDs, so they cannot be used to forge log content.
+VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+# Probes and metrics scrapes are frequent and uninteresting, so they are only logged if they fail.
+UNLOGGED_PATHS = frozenset({"/status", "/status/ready", "/metrics"})
+
+# Fields of the access log record of the current request, or None outside a request.
+_record: ContextVar[dict[str, Any] | None] = ContextVar("access_log_record", default=None)
+
+
+def annotate(**fields: object) -> None:
+    """Adds fields to the access log record of the current request, if there is one."""
+    record = _record.get()
+    if record is not None:
+        record.update(fields)
+
+
+def record_upstream_status(upstream: str, status: int | str) -> None:
+    """Adds the status of an upstream call, or ``error`` if it failed, to the current request's access log record."""
+    record = _record.get()
+    if record is not None:
+        record.setdefault("upstreams", {}).setdefault(upstream, []).append(status)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Adds time spent in a stage of serving the current request to its access log record."""
+    record = _record.get()
+    if record is not None:
+        stages = record.setdefault("stages_ms", {})
+        stages[name] = round(stages.get(name, 0) + seconds * 1000, 3)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Records the time spent in the context as a stage of serving the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def _request_id(headers: Headers) -> str:
+    """Returns the request ID sent by the client if it is valid, or a new one."""
+    request_id = headers.get(REQUEST_ID_HEADER)
+    if request_id is not None and VALID_REQUEST_ID.fullmatch(request_id):
+        return request_id
+    return uuid4().hex
+
+
+def _sampled(request_id: str, rate: float) -> bool:
+    """Whether a request is in the sample of successful requests to log, decided by its ID."""
+    return zlib.crc32(request_id.encode()) < rate * 2**32
+
+
+class AccessLogMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware that logs one access log record per request and binds its request ID to every log record.
+
+    The request ID is taken from the X-Request-Id header if the client sent a valid one, and is returned in the
+    same header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Initialise the middleware around the application."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serves the request, then logs its access log record if it is sampled, an error or slow."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(Headers(scope=scope))
+        request_id_header = (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+        record: dict[str, Any] = {"request_id": request_id, "method": scope["method"], "path": scope["path"]}
+        response = {"status": 500, "bytes": 0}
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), request_id_header]}
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        token = _record.set(record)
+        started = time.perf_counter()
+        try:
+            with bound_contextvars(request_id=request_id):
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            _record.reset(token)
+            self._log(record, response["status"], response["bytes"], time.perf_counter() - started)
+
+    @staticmethod
+    def _log(record: dict[str, Any], status: int, sent_bytes: int, duration: float) -> None:
+        """Logs a request's access log record if it is an error, slow, or sampled."""
+        settings = get_settings()
+        if status >= 500:
+            level = logging.ERROR
+        elif status >= 400 or duration >= settings.access_log_slow_request_seconds:
+            level = logging.WARNING
+        elif record["path"] not in UNLOGGED_PATHS and _sampled(record["request_id"], settings.access_log_sample_rate):
+            level = logging.INFO
+        else:
+            return
+        logger.log(
+            level,
+            "Request completed.",
+            **record,
+            status=status,
+            bytes=sent_bytes,
+            duration_ms=round(duration * 1000, 3),
+        )
@@ -0,0 +1,174 @@
+"""Client-side load balancing across the replicas of an upstream service, with health tracking and ejection.
+
+Each call goes to the healthy replica with the lowest expected cost: its moving average latency multiplied by the
+number of calls it would then have outstanding, so traffic shifts to the fastest replica until its queue builds up.
+A replica that fails several calls in a row, by a connection error, timeout or 5xx response, is ejected from rotation
+for a while. If every replica is ejected, calls go to the one that is due back soonest rather than failing outright.
+"""
+
+import math
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import cache
+
+from httpx import AsyncHTTPTransport, Limits, Request, Response, TransportError
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import UpstreamSettings
+from eq_cir_proxy_service.utils import access_log, metrics
+
+logger = get_logger()
+
+# Weight of each new latency sample in a replica's moving average.
+LATENCY_SMOOTHING = 0.3
+# A replica's latency estimate fades towards zero while it is not called, over this many seconds, so that a replica
+# avoided for being slow is tried again now and then, and wins back traffic once it has recovered.
+LATENCY_DECAY_SECONDS = 30.0
+
+
+class Endpoint:
+    """One replica of an upstream service, and what the balancer has observed of it."""
+
+    def __init__(self, base_url: str) -> None:
+        """Initialise the replica as healthy, idle and not yet measured."""
+        self.base_url = base_url
+        self.outstanding = 0
+        self.latency: float | None = None
+        self.observed_at = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def latency_estimate(self, now: float) -> float:
+        """Returns the moving average latency, faded by the time since it was last measured."""
+        if self.latency is None:
+            return 0.0
+        return self.latency * math.exp(-(now - self.observed_at) / LATENCY_DECAY_SECONDS)
+
+    def cost(self, now: float) -> float:
+        """Returns the expected cost of one more call: the latency estimate for every call it would have outstanding."""
+        return self.latency_estimate(now) * (self.outstanding + 1)
+
+
+class EndpointBalancer:
+    """Chooses which replica of an upstream service each call goes to, from the outcomes of earlier calls."""
+
+    def __init__(self, upstream: UpstreamSettings) -> None:
+        """Initialise the balancer with every replica healthy."""
+        self.name = upstream.name
+        self.ejection = upstream.ejection
+        self.endpoints = [Endpoint(base_url) for base_url in upstream.base_urls]
+        for endpoint in self.endpoints:
+            self._publish(endpoint)
+
+    def pick(self) -> Endpoint:
+        """Returns the healthy replica with the lowest expected cost, or the one due back soonest if none is healthy."""
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now]
+        if not healthy:
+            return min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)
+        return min(healthy, key=lambda endpoint: (endpoint.cost(now), endpoint.outstanding))
+
+    @contextmanager
+    def call(self) -> Iterator[Endpoint]:
+        """Picks a replica and counts the call as outstanding on it for the duration of the context."""
+        endpoint = self.pick()
+        endpoint.outstanding += 1
+        self._publish(endpoint)
+        try:
+            yield endpoint
+        finally:
+            endpoint.outstanding -= 1
+            self._publish(endpoint)
+
+    def observe(self, endpoint: Endpoint, latency: float, *, ok: bool) -> None:
+        """Records the outcome of a call, ejecting the replica once it has failed too many calls in a row.
+
+        Args:
+            endpoint (Endpoint): The replica called.
+            latency (float): Seconds until the response headers were received, or the call failed.
+            ok (bool): Whether the call succeeded; connection errors, timeouts and 5xx responses are failures.
+        """
+        now = time.monotonic()
+        if ok:
+            previous = latency if endpoint.latency is None else endpoint.latency
+            endpoint.latency = previous + LATENCY_SMOOTHING * (latency - previous)
+            endpoint.observed_at = now
+            endpoint.consecutive_failures = 0
+            self._publish(endpoint)
+            return
+
+        endpoint.consecutive_failures += 1
+        metrics.increment("upstream_endpoint_failures_total", labels=self._labels(endpoint))
+        if (
+            len(self.endpoints) > 1
+            and endpoint.consecutive_failures >= self.ejection.consecutive_failures
+            and endpoint.ejected_until <= now
+        ):
+            endpoint.ejected_until = now + self.ejection.seconds
+            # Back in rotation, the replica is ejected again by its next failure.
+            endpoint.consecutive_failures = self.ejection.consecutive_failures - 1
+            logger.warning(
+                "Upstream endpoint ejected.",
+                upstream=self.name,
+                endpoint=endpoint.base_url,
+                seconds=self.ejection.seconds,
+            )
+            metrics.increment("upstream_endpoint_ejections_total", labels=self._labels(endpoint))
+
+    def report(self) -> list[dict]:
+        """Returns the state of every replica, for the readiness report."""
+        now = time.monotonic()
+        return [
+            {
+                "base_url": endpoint.base_url,
+                "healthy": endpoint.ejected_until <= now,
+                "outstanding": endpoint.outstanding,
+                "latency_seconds": None if endpoint.latency is None else round(endpoint.latency, 6),
+                "consecutive_failures": endpoint.consecutive_failures,
+            }
+            for endpoint in self.endpoints
+        ]
+
+    def _labels(self, endpoint: Endpoint) -> dict[str, str]:
+        """Returns the metric labels of a replica."""
+        return {"upstream": self.name, "endpoint": endpoint.base_url}
+
+    def _publish(self, endpoint: Endpoint) -> None:
+        """Publishes a replica's outstanding calls and latency as gauges."""
+        labels = self._labels(endpoint)
+        metrics.set_gauge("upstream_endpoint_outstanding", endpoint.outstanding, labels=labels)
+        if endpoint.latency is not None:
+            metrics.set_gauge("upstream_endpoint_latency_seconds", endpoint.latency, labels=labels)
+
+
+class ObservedTransport(AsyncHTTPTransport):
+    """HTTP transport to one replica that reports the latency and outcome of every call to the replica's balancer."""
+
+    def __init__(self, balancer: EndpointBalancer, endpoint: Endpoint, limits: Limits) -> None:
+        """Initialise the transport with the replica's connection pool limits."""
+        super().__init__(limits=limits)
+        self.balancer = balancer
+        self.endpoint = endpoint
+
+    async def handle_async_request(self, request: Request) -> Response:
+        """Sends the request, observing the time until the response headers arrive.
+
+        The call's status is also added to the access log record of the request it was made for.
+        """
+        started = time.monotonic()
+        try:
+            response = await super().handle_async_request(request)
+        except TransportError:
+            self.balancer.observe(self.endpoint, time.monotonic() - started, ok=False)
+            access_log.record_upstream_status(self.balancer.name, "error")
+            raise
+        self.balancer.observe(self.endpoint, time.monotonic() - started, ok=response.status_code < 500)
+        access_log.record_upstream_status(self.balancer.name, response.status_code)
+        return response
+
+
+@cache
+def get_balancer(upstream: UpstreamSettings) -> EndpointBalancer:
+    """Returns the balancer for an upstream service's replicas."""
+    return EndpointBalancer(upstream)
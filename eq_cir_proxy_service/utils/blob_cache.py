@@ -0,0 +1,176 @@
+"""In-process cache of byte strings, storing each distinct value once, compressed, within a byte budget."""
+
+import hashlib
+import time
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple
+
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.disk_cache import COMPRESSION_LEVEL
+
+# Smaller values are stored as they are, as compressing them would save little memory for a copy on every read.
+MIN_COMPRESSED_BYTES = 4096
+
+
+class Blob:
+    """A distinct cached value, stored compressed unless compressing it would not make it smaller."""
+
+    __slots__ = ("compressed", "data", "references", "size")
+
+    def __init__(self, data: bytes | bytearray, *, size: int, compressed: bool) -> None:
+        """Initialise the blob without references."""
+        self.data = data
+        self.size = size
+        self.compressed = compressed
+        self.references = 0
+
+    @classmethod
+    def encode(cls, value: bytes | bytearray, *, compress: bool) -> "Blob":
+        """Builds the blob of a value, compressing it if asked to and it is worth it.
+
+        A value that is not compressed is stored without being copied, so it must not be modified afterwards.
+        """
+        if compress and len(value) >= MIN_COMPRESSED_BYTES:
+            data = zlib.compress(value, COMPRESSION_LEVEL)
+            if len(data) < len(value):
+                return cls(data, size=len(value), compressed=True)
+        return cls(value, size=len(value), compressed=False)
+
+    def decode(self) -> bytes | bytearray:
+        """Returns the value, decompressing it if it is stored compressed."""
+        return zlib.decompress(self.data) if self.compressed else self.data
+
+
+class _Entry(NamedTuple):
+    """A key's reference to the blob of its value."""
+
+    digest: str
+    expires_at: float
+
+
+class BlobCache:  # pylint: disable=too-many-instance-attributes
+    """Caches byte strings by string key, storing identical values once and evicting least recently used keys.
+
+    Values are identified by the SHA-256 of their content, so identical values cached under several keys, such as
+    the same converted instrument for several IDs or target versions, share one blob, and the byte budget counts it
+    once. Blobs are compressed when stored and only decompressed when read, and the budget counts their compressed
+    size. A blob is freed once no key refers to it.
+
+    Entries older than the time-to-live are treated as absent. The cache is only used from the event loop, so it
+    needs no locking.
+    """
+
+    def __init__(self, name: str, *, max_bytes: int, ttl_seconds: float, compress: bool = True) -> None:
+        """Initialise the cache.
+
+        Args:
+            name (str): Name used in metric labels.
+            max_bytes (int): Maximum total size of the stored blobs.
+            ttl_seconds (float): Seconds an entry stays valid after it is stored.
+            compress (bool): Whether to compress values; uncompressed values are stored without being copied.
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.compress = compress
+        self.size = 0
+        self.uncompressed_size = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._blobs: dict[str, Blob] = {}
+        self._publish()
+
+    def __len__(self) -> int:
+        """Number of keys held, including any whose entries have expired but not yet been evicted."""
+        return len(self._entries)
+
+    def get(self, key: str) -> bytes | bytearray | None:
+        """Returns the value cached for the key, decompressed, or None if there is no valid entry."""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry.expires_at:
+            if entry is not None:
+                self._remove(key)
+            metrics.increment("cache_misses_total", labels={"cache": self.name})
+            return None
+        self._entries.move_to_end(key)
+        metrics.increment("cache_hits_total", labels={"cache": self.name})
+        return self._blobs[entry.digest].decode()
+
+    def set(self, key: str, value: bytes | bytearray, *, digest: str | None = None) -> None:
+        """Caches the value, sharing the blob of an identical cached value, and evicting keys as needed.
+
+        Values whose blobs are larger than the whole budget are not cached.
+
+        Args:
+            key (str): The key to cache the value under.
+            value (bytes | bytearray): The value, which must not be modified afterwards.
+            digest (str | None): The SHA-256 hex digest of the value, if the caller has already computed it.
+        """
+        digest = digest or hashlib.sha256(value).hexdigest()
+        previous = self._entries.get(key)
+        blob = self._blobs.get(digest)
+        if blob is not None:
+            # Referenced before the key's previous entry is removed, so a value cached again is not freed first.
+            blob.references += 1
+            if previous is None or previous.digest != digest:
+                metrics.increment("cache_deduplicated_total", labels={"cache": self.name})
+        self.delete(key)
+        if blob is None:
+            blob = Blob.encode(value, compress=self.compress)
+            if len(blob.data) > self.max_bytes:
+                return
+            while self._entries and self.size + len(blob.data) > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                metrics.increment("cache_evictions_total", labels={"cache": self.name})
+            blob.references = 1
+            self._blobs[digest] = blob
+            self.size += len(blob.data)
+            self.uncompressed_size += blob.size
+        self._entries[key] = _Entry(digest, time.monotonic() + self.ttl_seconds)
+        self._publish()
+
+    def delete(self, key: str) -> bool:
+        """Removes the entry for the key, returning whether there was one."""
+        if key not in self._entries:
+            return False
+        self._remove(key)
+        return True
+
+    def keys_with_prefix(self, prefix: str) -> list[str]:
+        """Returns the keys that start with the prefix, including any whose entries have expired."""
+        return [key for key in self._entries if key.startswith(prefix)]
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Removes every entry whose key starts with the prefix, returning how many were removed."""
+        keys = self.keys_with_prefix(prefix)
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self) -> int:
+        """Removes every entry and blob, returning how many entries there were."""
+        count = len(self._entries)
+        self._entries.clear()
+        self._blobs.clear()
+        self.size = self.uncompressed_size = 0
+        self._publish()
+        return count
+
+    def _remove(self, key: str) -> None:
+        """Removes an entry that is known to be present, freeing its blob once no other key refers to it."""
+        digest = self._entries.pop(key).digest
+        blob = self._blobs[digest]
+        blob.references -= 1
+        if not blob.references:
+            del self._blobs[digest]
+            self.size -= len(blob.data)
+            self.uncompressed_size -= blob.size
+        self._publish()
+
+    def _publish(self) -> None:
+        """Publishes the numbers of entries and blobs and the blobs' total size, stored and uncompressed, as gauges."""
+        labels = {"cache": self.name}
+        metrics.set_gauge("cache_entries", len(self._entries), labels=labels)
+        metrics.set_gauge("cache_blobs", len(self._blobs), labels=labels)
+        metrics.set_gauge("cache_size", self.size, labels=labels)
+        metrics.set_gauge("cache_uncompressed_size", self.uncompressed_size, labels=labels)
@@ -0,0 +1,79 @@
+"""In-process least-recently-used cache with a maximum number of entries and a time-to-live."""
+
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+from eq_cir_proxy_service.utils import metrics
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """Caches values by string key, evicting the least recently used entries to stay within a number of entries.
+
+    Entries older than the time-to-live are treated as absent. The cache is only used from the event loop,
+    so it needs no locking.
+    """
+
+    def __init__(self, name: str, *, max_entries: int, ttl_seconds: float) -> None:
+        """Initialise the cache.
+
+        Args:
+            name (str): Name used in metric labels.
+            max_entries (int): Maximum number of entries held.
+            ttl_seconds (float): Seconds an entry stays valid after it is stored.
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[V, float]] = OrderedDict()
+        self._publish()
+
+    def __len__(self) -> int:
+        """Number of entries held, including any that have expired but not yet been evicted."""
+        return len(self._entries)
+
+    def get(self, key: str) -> V | None:
+        """Returns the value cached for the key, or None if there is no valid entry."""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            if entry is not None:
+                self._remove(key)
+            metrics.increment("cache_misses_total", labels={"cache": self.name})
+            return None
+        self._entries.move_to_end(key)
+        metrics.increment("cache_hits_total", labels={"cache": self.name})
+        return entry[0]
+
+    def set(self, key: str, value: V) -> None:
+        """Caches the value, evicting the least recently used entry if the cache is full."""
+        self.delete(key)
+        while self._entries and len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+            metrics.increment("cache_evictions_total", labels={"cache": self.name})
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._publish()
+
+    def delete(self, key: str) -> bool:
+        """Removes the entry for the key, returning whether there was one."""
+        if key not in self._entries:
+            return False
+        self._remove(key)
+        return True
+
+    def clear(self) -> int:
+        """Removes every entry, returning how many there were."""
+        count = len(self._entries)
+        self._entries.clear()
+        self._publish()
+        return count
+
+    def _remove(self, key: str) -> None:
+        """Removes an entry that is known to be present."""
+        del self._entries[key]
+        self._publish()
+
+    def _publish(self) -> None:
+        """Publishes the number of entries as a gauge."""
+        metrics.set_gauge("cache_entries", len(self._entries), labels={"cache": self.name})
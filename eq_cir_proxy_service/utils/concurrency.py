@@ -0,0 +1,195 @@
+"""Admission control for incoming requests and concurrency caps for upstream services."""
+
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import cache
+
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import (
+    DEFAULT_RETRY_AFTER_SECONDS,
+    Settings,
+    UpstreamSettings,
+)
+from eq_cir_proxy_service.utils import deadline, metrics
+
+logger = get_logger()
+
+
+class ConcurrencyLimitExceededError(Exception):
+    """Raised when a limiter is saturated and cannot admit the caller in time."""
+
+    def __init__(self, limiter: str, reason: str, retry_after: int) -> None:
+        """Initialise the error with the limiter name, rejection reason and Retry-After hint."""
+        super().__init__(f"Concurrency limit exceeded for {limiter}: {reason}")
+        self.limiter = limiter
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:  # pylint: disable=too-many-instance-attributes
+    """Caps the number of concurrent holders, queueing a bounded number of waiters fairly across clients.
+
+    Each client has its own FIFO queue, and freed slots go to the clients' queues in turn, so one client with many
+    queued requests cannot starve the others. Callers that cannot get a slot are rejected immediately when the
+    queue is full, or once they have waited longer than the queue timeout, so that a saturated service sheds load
+    instead of piling up work.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        max_in_flight: int,
+        max_queued: int,
+        queue_timeout: float,
+        retry_after: int = DEFAULT_RETRY_AFTER_SECONDS,
+    ) -> None:
+        """Initialise the limiter.
+
+        Args:
+            name (str): Name used in logs and metric labels.
+            max_in_flight (int): Maximum number of concurrent slot holders.
+            max_queued (int): Maximum number of callers waiting for a slot.
+            queue_timeout (float): Maximum seconds a caller waits for a slot.
+            retry_after (int): Seconds a rejected client is told to wait before retrying.
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._in_flight = 0
+        self._queued = 0
+        # Queues of waiters by client, in the order in which the clients will next be served.
+        self._waiters: OrderedDict[str, deque[asyncio.Future[None]]] = OrderedDict()
+        self._publish()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of callers currently holding a slot."""
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        """Number of callers currently waiting for a slot."""
+        return self._queued
+
+    async def acquire(self, client: str = "") -> None:
+        """Waits for a slot.
+
+        Waiting is bounded by the queue timeout and by the time left before the current request's deadline.
+
+        Args:
+            client (str): Identity of the caller, whose waiters are queued together.
+
+        Raises:
+            ConcurrencyLimitExceededError: If the queue is full or the queue timeout elapses.
+            DeadlineExceededError: If the request's deadline passes while waiting.
+        """
+        if self._in_flight < self.max_in_flight and not self._queued:
+            self._in_flight += 1
+            self._publish()
+            return
+
+        if self._queued >= self.max_queued:
+            self._reject("queue_full")
+
+        time_left = deadline.remaining()
+        timeout = self.queue_timeout if time_left is None else max(min(self.queue_timeout, time_left), 0)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(waiter)
+        self._queued += 1
+        self._publish()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except TimeoutError:
+            self._abandon(client, waiter)
+            deadline.check_deadline(f"{self.name} queue")
+            self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            self._abandon(client, waiter)
+            raise
+
+    def release(self) -> None:
+        """Releases a slot, handing it directly to the longest-waiting caller of the next client in turn."""
+        while self._waiters:
+            client, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self._in_flight -= 1
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, client: str = "") -> AsyncIterator[None]:
+        """Holds a slot for the duration of the context."""
+        await self.acquire(client)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _abandon(self, client: str, waiter: asyncio.Future[None]) -> None:
+        """Removes a waiter that gave up, passing on the slot if it was handed one as it gave up."""
+        waiters = self._waiters.get(client)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[client]
+        elif not waiter.cancelled():
+            self.release()
+        self._publish()
+
+    def _reject(self, reason: str) -> None:
+        """Records and raises a rejection."""
+        logger.warning("Concurrency limit exceeded.", limiter=self.name, reason=reason)
+        metrics.increment("concurrency_rejected_total", labels={"limiter": self.name, "reason": reason})
+        raise ConcurrencyLimitExceededError(self.name, reason, self.retry_after)
+
+    def _publish(self) -> None:
+        """Publishes the in-flight count and queue depth as gauges."""
+        labels = {"limiter": self.name}
+        metrics.set_gauge("concurrency_in_flight", self._in_flight, labels=labels)
+        metrics.set_gauge("concurrency_queue_depth", self._queued, labels=labels)
+
+
+@cache
+def get_request_limiter(settings: Settings) -> ConcurrencyLimiter:
+    """Returns the admission limiter for /instrument requests."""
+    return ConcurrencyLimiter(
+        "instrument",
+        max_in_flight=settings.max_in_flight_requests,
+        max_queued=settings.max_queued_requests,
+        queue_timeout=settings.request_queue_timeout_seconds,
+        retry_after=settings.retry_after_seconds,
+    )
+
+
+@cache
+def get_upstream_limiter(settings: Settings, upstream: UpstreamSettings) -> ConcurrencyLimiter:
+    """Returns the concurrency cap for an upstream service.
+
+    Args:
+        settings (Settings): The application settings, for the queueing limits.
+        upstream (UpstreamSettings): The upstream service, e.g. ``settings.cir``.
+    """
+    return ConcurrencyLimiter(
+        upstream.name,
+        max_in_flight=upstream.max_concurrency,
+        # Admission control already bounds how many requests can be waiting on an upstream.
+        max_queued=settings.max_in_flight_requests,
+        queue_timeout=settings.request_queue_timeout_seconds,
+        retry_after=settings.retry_after_seconds,
+    )
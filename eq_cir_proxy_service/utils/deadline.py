@@ -0,0 +1,99 @@
+"""End-to-end request deadlines, carried in a context variable through retrieval and conversion."""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from httpx import AsyncClient, Timeout
+
+from eq_cir_proxy_service.config.settings import Settings
+
+# Header a client can send to set its own deadline, in seconds, capped at MAX_REQUEST_DEADLINE_SECONDS.
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Monotonic clock time by which the current request must complete, or None outside a request.
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the current request's deadline has passed before or during a stage of work."""
+
+    def __init__(self, stage: str) -> None:
+        """Initialise the error with the stage that was abandoned."""
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+def resolve_deadline_seconds(requested: float | None, settings: Settings) -> float:
+    """Returns the deadline to apply to a request, in seconds.
+
+    Parameters:
+    - requested: The deadline requested by the client, if any.
+    - settings: The application settings.
+
+    Returns:
+    - float: The requested deadline capped at the configured maximum, or the default deadline if none.
+    """
+    if requested is None:
+        return settings.request_deadline_seconds
+    return min(requested, settings.max_request_deadline_seconds)
+
+
+@contextmanager
+def request_deadline(seconds: float) -> Iterator[None]:
+    """Sets the deadline of the current request for the duration of the context."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Returns the seconds left before the current request's deadline, or None if no deadline is set."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline(stage: str) -> None:
+    """Aborts the current stage if the request's deadline has already passed.
+
+    Raises:
+    - DeadlineExceededError: If the deadline has passed.
+    """
+    time_left = remaining()
+    if time_left is not None and time_left <= 0:
+        raise DeadlineExceededError(stage)
+
+
+def upstream_timeout(client: AsyncClient) -> Timeout:
+    """Returns the timeout of each connect, read and write of an upstream call made with the client.
+
+    Within a request, this is the time left before its deadline, so a slow upstream is waited for as long as the
+    request can wait rather than for the client's default timeout. Outside a request, it is the client's timeout.
+    """
+    time_left = remaining()
+    return client.timeout if time_left is None else Timeout(max(time_left, 0.0))
+
+
+@asynccontextmanager
+async def upstream_deadline(stage: str) -> AsyncIterator[None]:
+    """Bounds an upstream call, from connecting to reading the last byte of the body, by the time left.
+
+    The timeouts from upstream_timeout apply to each connect, read and write separately, so a body that keeps
+    trickling in is only abandoned by this bound on the whole call.
+
+    Raises:
+    - DeadlineExceededError: If the deadline has already passed, so the call should not be started, or passes before
+      the call completes.
+    """
+    check_deadline(stage)
+    try:
+        async with asyncio.timeout(remaining()):
+            yield
+    except TimeoutError as e:
+        raise DeadlineExceededError(stage) from e
@@ -0,0 +1,303 @@
+"""Persistent cache of compressed, content-addressed files on local disk, shared by the processes on a node."""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from collections.abc import Iterator
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import quote, unquote
+
+from structlog import get_logger
+
+from eq_cir_proxy_service.utils import metrics
+
+logger = get_logger()
+
+BLOB_SUFFIX = ".zz"
+ENTRY_SUFFIX = ".entry"
+GROUP_SUFFIX = ".d"
+ENTRIES_DIRECTORY_NAME = "entries"
+LOCK_FILE_NAME = "sweep.lock"
+
+# Fast compression: instruments are highly repetitive JSON, so even the lowest levels shrink them several times over.
+COMPRESSION_LEVEL = 1
+# Each process sweeps the directory once it has written this fraction of the size cap since its last sweep, so the
+# directory exceeds the cap by at most this fraction per process between sweeps.
+SWEEP_FRACTION = 0.1
+
+
+class DiskCacheEntry(NamedTuple):
+    """Entry of a cached value, recorded in the key's entry file."""
+
+    digest: str
+    size: int
+    stored_at: float
+
+
+class DiskCache:  # pylint: disable=too-many-instance-attributes
+    """Caches byte strings on disk by string key, with a size cap and least-recently-used eviction.
+
+    Values are stored zlib-compressed in files named by the SHA-256 of their content, so identical values stored
+    under several keys share one file. Each key has an entry file of its own, naming the content it refers to, in a
+    directory per key prefix up to the key's last ``/``. The directory is the only index, so every process using it
+    sees the same entries, and a new process starts with the cache warm. Reading an entry touches its file, which
+    records the least-recently-used order. Compressed files at least ``mmap_threshold`` bytes long are memory-mapped
+    rather than read into memory before decompressing.
+
+    Removing an entry only removes its entry file. Sweeps, by one process at a time, remove expired entries and the
+    least recently used ones beyond the size cap, and delete the compressed files no entry refers to. Writers hold a
+    shared lock while they write a file and its entry, and sweeps an exclusive one, so a sweep never deletes a file
+    that is about to be referred to.
+
+    The methods block on file I/O, so call them from a worker thread. They are safe to call from several threads and
+    processes. Reads take no lock.
+    """
+
+    def __init__(self, directory: Path, *, max_bytes: int, ttl_seconds: float, mmap_threshold: int) -> None:
+        """Initialise the cache on the directory, sweeping what previous processes left there.
+
+        Args:
+            directory (Path): Directory holding the entries and the compressed files; created if missing.
+            max_bytes (int): Maximum total size of the compressed files, across every process using the directory.
+            ttl_seconds (float): Seconds an entry stays valid after it is stored, across restarts.
+            mmap_threshold (int): Compressed size from which files are memory-mapped when read.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.mmap_threshold = mmap_threshold
+        self.entries_directory = directory / ENTRIES_DIRECTORY_NAME
+        self.entries_directory.mkdir(parents=True, exist_ok=True)
+        # Size of the compressed files as of the last sweep, plus the files this process has written since.
+        self.size = 0
+        self._written_since_sweep = 0
+        self._size_lock = threading.Lock()
+        self.sweep(wait=True)
+
+    def get(self, key: str) -> bytes | None:
+        """Returns the value cached for the key, or None if there is no valid entry."""
+        entry_path = self._entry_path(key)
+        try:
+            entry = self._read_entry(entry_path)
+            if time.time() >= entry.stored_at + self.ttl_seconds:
+                entry_path.unlink(missing_ok=True)
+                metrics.increment("cache_misses_total", labels={"cache": "disk"})
+                return None
+            value = self._read(entry)
+            self._touch(entry_path)
+        except FileNotFoundError:
+            # No entry, or its file was deleted by a sweep after the entry was read.
+            metrics.increment("cache_misses_total", labels={"cache": "disk"})
+            return None
+        except (OSError, ValueError, TypeError, zlib.error):
+            logger.exception("Discarding unreadable disk cache entry.", key=key)
+            entry_path.unlink(missing_ok=True)
+            metrics.increment("cache_misses_total", labels={"cache": "disk"})
+            return None
+        metrics.increment("cache_hits_total", labels={"cache": "disk"})
+        return value
+
+    def set(self, key: str, value: bytes | bytearray) -> None:
+        """Caches the value, sweeping the directory once this process has written enough since its last sweep.
+
+        Values whose compressed size exceeds the whole cap are not cached.
+        """
+        digest = hashlib.sha256(value).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock(fcntl.LOCK_SH):
+            try:
+                size = path.stat().st_size
+                written = 0
+            except FileNotFoundError:
+                compressed = zlib.compress(value, COMPRESSION_LEVEL)
+                size = written = len(compressed)
+                if size > self.max_bytes:
+                    return
+                self._write_atomically(path, compressed)
+            entry_path = self._entry_path(key)
+            self._write_atomically(entry_path, json.dumps(DiskCacheEntry(digest, size, time.time())).encode())
+            self._touch(entry_path)
+
+        with self._size_lock:
+            self.size += written
+            self._written_since_sweep += written
+            sweep_due = self._written_since_sweep >= self.max_bytes * SWEEP_FRACTION
+        if sweep_due:
+            self.sweep()
+
+    def delete(self, key: str) -> bool:
+        """Removes the entry for the key, returning whether there was one."""
+        try:
+            self._entry_path(key).unlink()
+        except FileNotFoundError:
+            return False
+        self.sweep()
+        return True
+
+    def keys_with_prefix(self, prefix: str) -> list[str]:
+        """Returns the keys that start with the prefix, including any whose entries have expired."""
+        return [key for key, _ in self._entries_with_prefix(prefix)]
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Removes every entry whose key starts with the prefix, returning how many were removed.
+
+        An empty prefix removes every entry.
+        """
+        removed = 0
+        for _, entry_path in self._entries_with_prefix(prefix):
+            # Another process may have removed the entry since it was listed.
+            with contextlib.suppress(FileNotFoundError):
+                entry_path.unlink()
+                removed += 1
+        if removed:
+            self.sweep()
+        return removed
+
+    def sweep(self, *, wait: bool = False) -> None:
+        """Removes expired entries and those beyond the size cap, and deletes the files no entry refers to.
+
+        Unreadable entries, and entries whose file has gone, are removed too. Least recently used entries are removed
+        first to bring the compressed files within the size cap.
+
+        Args:
+            wait (bool): Wait for writers and other sweeps to finish, rather than skipping the sweep while they run.
+        """
+        with contextlib.suppress(BlockingIOError), self._lock(fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB):
+            self._sweep()
+
+    def _sweep(self) -> None:
+        """Sweeps the directory, holding the exclusive lock."""
+        now = time.time()
+        blob_sizes = {path.name.removesuffix(BLOB_SUFFIX): path.stat().st_size for path in self._blob_files()}
+        entries: list[tuple[int, Path, str]] = []
+        for _, entry_path in self._entries_with_prefix(""):
+            try:
+                entry = self._read_entry(entry_path)
+                recency = entry_path.stat().st_mtime_ns
+            except (OSError, ValueError, TypeError):
+                entry_path.unlink(missing_ok=True)
+                continue
+            if now >= entry.stored_at + self.ttl_seconds or entry.digest not in blob_sizes:
+                entry_path.unlink(missing_ok=True)
+            else:
+                entries.append((recency, entry_path, entry.digest))
+
+        entries.sort()
+        references = Counter(digest for _, _, digest in entries)
+        size = sum(blob_sizes[digest] for digest in references)
+        evicted = 0
+        while size > self.max_bytes:
+            _, entry_path, digest = entries[evicted]
+            entry_path.unlink(missing_ok=True)
+            evicted += 1
+            references[digest] -= 1
+            if not references[digest]:
+                del references[digest]
+                size -= blob_sizes[digest]
+        if evicted:
+            metrics.increment("cache_evictions_total", evicted, labels={"cache": "disk"})
+
+        for digest in blob_sizes.keys() - references.keys():
+            self._blob_path(digest).unlink(missing_ok=True)
+        self._remove_empty_directories()
+
+        with self._size_lock:
+            self.size = size
+            self._written_since_sweep = 0
+        metrics.set_gauge("cache_entries", len(entries) - evicted, labels={"cache": "disk"})
+        metrics.set_gauge("cache_size", size, labels={"cache": "disk"})
+
+    @contextlib.contextmanager
+    def _lock(self, operation: int) -> Iterator[None]:
+        """Holds a lock on the directory, shared by writers or exclusive to a sweep, across every process.
+
+        Raises:
+            BlockingIOError: If the lock is asked for without blocking and another process holds it.
+        """
+        file_descriptor = os.open(self.directory / LOCK_FILE_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(file_descriptor, operation)
+            yield
+        finally:
+            os.close(file_descriptor)
+
+    def _blob_path(self, digest: str) -> Path:
+        """Returns the path of the compressed file for a content digest."""
+        return self.directory / digest[:2] / f"{digest}{BLOB_SUFFIX}"
+
+    def _blob_files(self) -> list[Path]:
+        """Returns the compressed files in the directory."""
+        return list(self.directory.glob(f"??/*{BLOB_SUFFIX}"))
+
+    def _entry_path(self, key: str) -> Path:
+        """Returns the path of the entry file of a key.
+
+        Each part of the key between slashes is quoted, so no part can name a file outside the entries directory.
+        """
+        *groups, name = key.split("/")
+        group_path = self.entries_directory.joinpath(*(quote(group, safe="") + GROUP_SUFFIX for group in groups))
+        return group_path / (quote(name, safe="") + ENTRY_SUFFIX)
+
+    def _entries_with_prefix(self, prefix: str) -> Iterator[tuple[str, Path]]:
+        """Yields the key and entry file of every entry whose key starts with the prefix.
+
+        Only the directory of the prefix's own group is searched, so listing one instrument's entries stays cheap.
+        """
+        *groups, _ = prefix.split("/")
+        group_path = self.entries_directory.joinpath(*(quote(group, safe="") + GROUP_SUFFIX for group in groups))
+        for directory, _, file_names in os.walk(group_path):
+            relative_groups = Path(directory).relative_to(self.entries_directory).parts
+            key_groups = [unquote(group.removesuffix(GROUP_SUFFIX)) for group in relative_groups]
+            for file_name in file_names:
+                if file_name.endswith(ENTRY_SUFFIX):
+                    key = "/".join([*key_groups, unquote(file_name.removesuffix(ENTRY_SUFFIX))])
+                    if key.startswith(prefix):
+                        yield key, Path(directory) / file_name
+
+    @staticmethod
+    def _touch(entry_path: Path) -> None:
+        """Records that an entry was used, to the nanosecond, as file systems update times every few milliseconds."""
+        now = time.time_ns()
+        os.utime(entry_path, ns=(now, now))
+
+    @staticmethod
+    def _read_entry(entry_path: Path) -> DiskCacheEntry:
+        """Reads an entry file."""
+        return DiskCacheEntry(*json.loads(entry_path.read_bytes()))
+
+    def _read(self, entry: DiskCacheEntry) -> bytes:
+        """Reads and decompresses a cached value."""
+        with self._blob_path(entry.digest).open("rb") as blob:
+            if entry.size < self.mmap_threshold:
+                return zlib.decompress(blob.read())
+            with mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return zlib.decompress(mapped)
+
+    def _remove_empty_directories(self) -> None:
+        """Removes the directories of key prefixes that no longer have any entries."""
+        for directory, _, _ in os.walk(self.entries_directory, topdown=False):
+            path = Path(directory)
+            if path != self.entries_directory and not any(path.iterdir()):
+                path.rmdir()
+
+    @staticmethod
+    def _write_atomically(path: Path, data: bytes) -> None:
+        """Writes a file through a temporary file in the same directory, then renames it into place."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                temporary_file.write(data)
+            Path(temporary_path).replace(path)
+        except BaseException:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
@@ -0,0 +1,66 @@
+"""Rate-limited logging of error events that clients can trigger at will, such as invalid requests.
+
+Each kind of event is logged in full up to a maximum number of times per window. Further events of that kind in the
+window are only counted, and the count is logged as one summary record when the next event of that kind arrives
+after the window has ended. Every event is also counted in the ``error_events_total`` metric, so no event goes
+unrecorded however many are suppressed.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+
+from structlog import get_logger
+
+from eq_cir_proxy_service.utils import metrics
+
+logger = get_logger()
+
+MAX_EVENTS_PER_WINDOW = 10
+WINDOW_SECONDS = 60.0
+
+
+@dataclass
+class _Window:
+    """Events of one kind logged and suppressed since the window started."""
+
+    started: float
+    logged: int = 0
+    suppressed: int = 0
+
+
+_windows: dict[str, _Window] = {}
+
+
+def log_error_event(kind: str, event: str, *, level: int = logging.ERROR, **fields: object) -> None:
+    """Logs an error event unless too many of its kind have been logged in the current window.
+
+    Args:
+        kind (str): Kind of event, used to rate-limit and count it; one of a fixed set, not derived from input.
+        event (str): The log message.
+        level (int): The log level.
+        **fields: Structured fields of the log record. They are only rendered if the event is logged.
+    """
+    metrics.increment("error_events_total", labels={"kind": kind})
+    now = time.monotonic()
+    window = _windows.get(kind)
+    if window is None or now - window.started >= WINDOW_SECONDS:
+        if window is not None and window.suppressed:
+            logger.warning(
+                "Suppressed repeated error events.",
+                kind=kind,
+                suppressed=window.suppressed,
+                window_seconds=WINDOW_SECONDS,
+            )
+        window = _windows[kind] = _Window(started=now)
+
+    if window.logged < MAX_EVENTS_PER_WINDOW:
+        window.logged += 1
+        logger.log(level, event, kind=kind, **fields)
+    else:
+        window.suppressed += 1
+
+
+def reset() -> None:
+    """Forgets every window, so the next event of every kind is logged."""
+    _windows.clear()
@@ -1,19 +1,39 @@
 """Utility functions for handling IAP authentication and HTTP clients."""
 
-import os
+import asyncio
+import importlib
+import time
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
+from typing import Any
 
-import google.oauth2.id_token
-from google.auth.transport import requests
-from httpx import AsyncClient
+from httpx import AsyncClient, Limits
 from structlog import get_logger
 
+from eq_cir_proxy_service.config.settings import Settings, UpstreamSettings
+from eq_cir_proxy_service.utils.balancer import Endpoint, EndpointBalancer, ObservedTransport, get_balancer
+
 logger = get_logger()
 
+# Google ID tokens are valid for an hour; refresh well before they expire.
+IAP_TOKEN_TTL_SECONDS = 45 * 60
+
+# Pooled clients, keyed by base URL and IAP audience, reused across requests for connection keep-alive.
+_clients: dict[tuple[str, str | None], AsyncClient] = {}
+# Cached IAP tokens, keyed by audience, with the monotonic time they were fetched.
+_iap_tokens: dict[str, tuple[str, float]] = {}
+
 
 def get_iap_token(audience: str) -> str:
-    """Fetch an ID token for the IAP-secured resource (blocking)."""
+    """Fetch an ID token for the IAP-secured resource (blocking).
+
+    google-auth (and the requests library it uses) are imported here rather than at module level, because they
+    are only needed when an IAP client ID is configured and account for a large share of cold-start import time.
+    """
+    # pylint: disable=import-outside-toplevel
+    import google.oauth2.id_token
+    from google.auth.transport import requests
+
     token: str = google.oauth2.id_token.fetch_id_token(requests.Request(), audience)  # type: ignore[no-untyped-call]
     if token is None:
         logger.error("Failed to fetch IAP token", audience=audience)
@@ -22,37 +42,115 @@ def get_iap_token(audience: str) -> str:
     return token
 
 
+def verify_id_token(token: str, audience: str) -> dict[str, Any]:
+    """Verify a Google-signed ID token for the audience, such as Pub/Sub sends with authenticated pushes (blocking).
+
+    Raises:
+        ValueError: If the token is malformed, expired, not issued by Google or issued for another audience.
+        google.auth.exceptions.TransportError: If Google's signing keys cannot be fetched.
+
+    Returns:
+        dict: The token's claims, including the ``email`` of the service account it was issued to.
+    """
+    # pylint: disable=import-outside-toplevel
+    import google.oauth2.id_token
+    from google.auth import exceptions
+    from google.auth.transport import requests
+
+    try:
+        claims: dict[str, Any] = google.oauth2.id_token.verify_oauth2_token(  # type: ignore[no-untyped-call]
+            token,
+            requests.Request(),
+            audience,
+        )
+    except exceptions.TransportError:
+        raise
+    except exceptions.GoogleAuthError as exc:
+        # Raised for a token from another issuer, where other verification failures raise ValueError.
+        raise ValueError(str(exc)) from exc
+    return claims
+
+
+async def preload_iap_dependencies(settings: Settings) -> None:
+    """Imports google-auth off the event loop at startup if any upstream has an IAP client ID configured.
+
+    This moves the import cost out of the first request on instances that use IAP, while instances that do not
+    (such as local development) never import it at all.
+    """
+    if settings.iap_client_ids:
+        await asyncio.to_thread(importlib.import_module, "google.oauth2.id_token")
+
+
+async def get_cached_iap_token(audience: str) -> str:
+    """Returns a cached ID token for the audience, fetching a new one off the event loop when it is stale."""
+    cached = _iap_tokens.get(audience)
+    if cached and time.monotonic() - cached[1] < IAP_TOKEN_TTL_SECONDS:
+        return cached[0]
+
+    token = await asyncio.to_thread(get_iap_token, audience)
+    _iap_tokens[audience] = (token, time.monotonic())
+    return token
+
+
+def iap_token_age(audience: str) -> float | None:
+    """Returns the seconds since the cached ID token for the audience was fetched, or None if none is cached."""
+    cached = _iap_tokens.get(audience)
+    return None if cached is None else time.monotonic() - cached[1]
+
+
+def _create_client(upstream: UpstreamSettings, balancer: EndpointBalancer, endpoint: Endpoint) -> AsyncClient:
+    """Creates a pooled httpx.AsyncClient for a replica of the upstream, with its configured pool limits."""
+    limits = Limits(
+        max_connections=upstream.pool.max_connections,
+        max_keepalive_connections=upstream.pool.max_keepalive_connections,
+        keepalive_expiry=upstream.pool.keepalive_expiry_seconds,
+    )
+    return AsyncClient(base_url=endpoint.base_url, transport=ObservedTransport(balancer, endpoint, limits))
+
+
 @asynccontextmanager
-async def get_api_client(*, url_env: str, iap_env: str) -> AsyncIterator[AsyncClient]:
+async def get_api_client(upstream: UpstreamSettings) -> AsyncIterator[AsyncClient]:
     """Context-managed httpx.AsyncClient that switches between IAP and non-IAP connections.
 
-    Args:
-        url_env (str): Environment variable holding the base URL of the API.
-        iap_env (str): Environment variable holding the IAP client ID of the API.
+    When the upstream has several replicas, the client is for the replica chosen by the upstream's balancer, and
+    calls made with it are counted as outstanding on that replica until the context exits.
 
-    Raises:
-        RuntimeError: If the base URL environment variable is missing or empty.
+    Clients are pooled per base URL and IAP audience and stay open between requests, so connections to the
+    upstream are kept alive. They are closed by close_api_clients when the application shuts down.
+
+    Args:
+        upstream (UpstreamSettings): The upstream service's base URLs, IAP client ID and pool limits.
 
     Yields:
         httpx.AsyncClient: An httpx.AsyncClient instance.
     """
-    base_url = os.getenv(url_env)
-    audience = os.getenv(iap_env)
-
-    if not base_url:
-        logger.error("Missing or empty environment variable for GCP base URL", var=url_env)
-        base_url_error = f"Missing or empty environment variable: {url_env}"
-        raise RuntimeError(base_url_error)
-
-    if audience:
-        logger.info("Using GCP API client", url_env=url_env, iap_env=iap_env)
-        client = AsyncClient(
-            base_url=base_url,
-            headers={"Authorization": f"Bearer {get_iap_token(audience)}"},
-        )
-    else:
-        logger.info("No IAP client ID set. Using local API client.")
-        client = AsyncClient(base_url=base_url)
+    audience = upstream.iap_client_id
+    balancer = get_balancer(upstream)
+
+    with balancer.call() as endpoint:
+        client = _clients.get((endpoint.base_url, audience))
+        if client is None or client.is_closed:
+            if audience:
+                logger.info("Using GCP API client", upstream=upstream.name, endpoint=endpoint.base_url)
+            else:
+                logger.info(
+                    "No IAP client ID set. Using local API client.",
+                    upstream=upstream.name,
+                    endpoint=endpoint.base_url,
+                )
+            client = _clients[(endpoint.base_url, audience)] = _create_client(upstream, balancer, endpoint)
+
+        if audience:
+            client.headers["Authorization"] = f"Bearer {await get_cached_iap_token(audience)}"
+
+        yield client
+
 
-    yield client
-    await client.aclose()
+async def close_api_clients() -> None:
+    """Closes all pooled API clients, and forgets cached IAP tokens and what was observed of upstream replicas."""
+    clients = list(_clients.values())
+    _clients.clear()
+    _iap_tokens.clear()
+    get_balancer.cache_clear()
+    for client in clients:
+        await client.aclose()
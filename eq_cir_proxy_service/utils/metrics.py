@@ -0,0 +1,36 @@
+"""In-process metrics registry for the EQ CIR Proxy Service, exposed by the /metrics endpoint."""
+
+from collections.abc import Mapping
+
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+
+
+def _metric_key(name: str, labels: Mapping[str, str] | None) -> str:
+    """Builds a Prometheus-style metric key, e.g. ``requests_rejected_total{reason="queue_full"}``."""
+    if not labels:
+        return name
+    rendered_labels = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{rendered_labels}}}"
+
+
+def increment(name: str, value: float = 1, labels: Mapping[str, str] | None = None) -> None:
+    """Increments a counter."""
+    key = _metric_key(name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, labels: Mapping[str, str] | None = None) -> None:
+    """Sets a gauge to the given value."""
+    _gauges[_metric_key(name, labels)] = value
+
+
+def snapshot() -> dict[str, dict[str, float]]:
+    """Returns a point-in-time copy of all counters and gauges."""
+    return {"counters": dict(_counters), "gauges": dict(_gauges)}
+
+
+def reset() -> None:
+    """Clears all metrics."""
+    _counters.clear()
+    _gauges.clear()
@@ -0,0 +1,219 @@
+"""Opt-in profiling: an on-demand sampling profiler, and per-request profiles triggered by a header.
+
+Nothing here runs unless PROFILING_ENABLED is set and an admin asks for a profile, so leaving profiling enabled in
+production costs one settings lookup per request.
+"""
+
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from types import FrameType
+from uuid import uuid4
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import get_settings
+
+logger = get_logger()
+
+PROFILE_REQUEST_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+ADMIN_HEADER = "X-Admin-Token"
+
+# The most recent request profiles are kept in memory for download, up to this number.
+MAX_REQUEST_PROFILES = 20
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# A frame is identified by its function's qualified name, file and first line.
+Frame = tuple[str, str, int]
+
+# Only one profile of each kind is captured at a time: a second sampling thread would double the overhead, and
+# Python allows only one deterministic profiler to be active in a process.
+_sampling_lock = threading.Lock()
+_request_profiling_lock = threading.Lock()
+_request_profiles: OrderedDict[str, cProfile.Profile] = OrderedDict()
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a sampling profile is requested while another is being captured."""
+
+
+@dataclass(frozen=True)
+class SampledProfile:
+    """The stacks seen by the sampling profiler, counted by thread name and stack from outermost frame inwards."""
+
+    stacks: Counter[tuple[str, tuple[Frame, ...]]]
+    interval: float
+    duration: float
+
+    def to_speedscope(self) -> dict:
+        """Returns the profile in speedscope's file format, with one sampled profile per thread."""
+        frames: dict[Frame, int] = {}
+        profiles: dict[str, dict] = {}
+        for (thread, stack), count in sorted(self.stacks.items()):
+            profile = profiles.setdefault(
+                thread,
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            profile["samples"].append([frames.setdefault(frame, len(frames)) for frame in stack])
+            profile["weights"].append(count * self.interval)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in frames]},
+            "profiles": list(profiles.values()),
+            "name": "eq-cir-proxy-service",
+            "exporter": "eq-cir-proxy-service",
+        }
+
+    def to_collapsed(self) -> str:
+        """Returns the profile as collapsed stacks, one ``thread;outer;...;inner count`` line per stack."""
+        lines = (
+            ";".join([thread, *(name for name, _file, _line in stack)]) + f" {count}"
+            for (thread, stack), count in sorted(self.stacks.items())
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _stack(frame: FrameType | None) -> tuple[Frame, ...]:
+    """Returns the stack ending at a frame, from the outermost frame inwards."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def sample_stacks(duration: float, interval: float) -> SampledProfile:
+    """Samples the stack of every other thread at the interval for the duration (blocking).
+
+    Args:
+        duration (float): Seconds to sample for.
+        interval (float): Seconds between samples.
+
+    Returns:
+        SampledProfile: The stacks seen and how often each was seen.
+    """
+    own_thread = threading.get_ident()
+    stacks: Counter[tuple[str, tuple[Frame, ...]]] = Counter()
+    started = time.monotonic()
+    while True:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():  # noqa: SLF001 # pylint: disable=protected-access
+            if ident != own_thread:
+                stacks[(names.get(ident, str(ident)), _stack(frame))] += 1
+        if time.monotonic() - started + interval > duration:
+            return SampledProfile(stacks, interval, time.monotonic() - started)
+        time.sleep(interval)
+
+
+async def capture_sampled_profile(duration: float, interval: float) -> SampledProfile:
+    """Runs the sampling profiler in a worker thread for the duration.
+
+    Raises:
+        ProfilerBusyError: If a sampling profile is already being captured.
+    """
+    if not _sampling_lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+        error_message = "A sampling profile is already being captured"
+        raise ProfilerBusyError(error_message)
+    try:
+        logger.info("Capturing sampling profile.", duration=duration, interval=interval)
+        return await asyncio.to_thread(sample_stacks, duration, interval)
+    finally:
+        _sampling_lock.release()
+
+
+def get_request_profile(profile_id: str) -> cProfile.Profile | None:
+    """Returns a captured request profile, or None if there is no profile with the ID."""
+    return _request_profiles.get(profile_id)
+
+
+def dump_request_profile(profile: cProfile.Profile) -> bytes:
+    """Returns a request profile in pstats' file format, as written by ``pstats.Stats.dump_stats``."""
+    return marshal.dumps(pstats.Stats(profile).stats)  # type: ignore[attr-defined]
+
+
+def format_request_profile(profile: cProfile.Profile, limit: int = 50) -> str:
+    """Returns a report of the functions of a request profile with the highest cumulative time."""
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return stream.getvalue()
+
+
+def store_request_profile(profile_id: str, profile: cProfile.Profile) -> None:
+    """Keeps a request profile for download, dropping the oldest beyond the maximum."""
+    _request_profiles[profile_id] = profile
+    while len(_request_profiles) > MAX_REQUEST_PROFILES:
+        _request_profiles.popitem(last=False)
+
+
+class ProfilingMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware that profiles requests sending the X-Profile header with a valid admin token.
+
+    The profile's ID is returned in the X-Profile-Id response header. As the event loop runs other requests while
+    the profiled one is waiting, the profile also includes any work done for them in the meantime. Only one request
+    is profiled at a time; others sending the header are served without a profile.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Initialise the middleware around the application."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serves the request, profiling it if it asks to be profiled and profiling is enabled."""
+        if scope["type"] != "http" or not get_settings().profiling_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if not (
+            headers.get(PROFILE_REQUEST_HEADER)
+            and get_settings().admin_token_matches(headers.get(ADMIN_HEADER))
+            and _request_profiling_lock.acquire(blocking=False)  # pylint: disable=consider-using-with
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid4().hex
+        profile_id_header = (PROFILE_ID_HEADER.lower().encode(), profile_id.encode())
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), profile_id_header]}
+            await send(message)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another deterministic profiler, such as a debugger's, is already active.
+            _request_profiling_lock.release()
+            logger.warning("Could not start a request profile as another profiler is active.")
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.disable()
+            _request_profiling_lock.release()
+            store_request_profile(profile_id, profile)
+            logger.info("Captured request profile.", profile_id=profile_id, path=scope["path"])
@@ -0,0 +1,235 @@
+"""Per-client token bucket rate limiting for incoming requests, held in process or shared through Redis."""
+
+import importlib
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import cache
+from typing import Any, Protocol
+
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import RateLimitQuota, Settings
+from eq_cir_proxy_service.utils import metrics
+
+logger = get_logger()
+
+# Set by Identity-Aware Proxy to the authenticated principal, e.g. "accounts.google.com:runner@example.com".
+IAP_PRINCIPAL_HEADER = "X-Goog-Authenticated-User-Email"
+IAP_PRINCIPAL_PREFIX = "accounts.google.com:"
+ANONYMOUS_CLIENT = "anonymous"
+
+# Client identities come from request headers, so they are truncated, and clients without a configured quota only
+# get their own metric label up to a limit, beyond which they share one.
+MAX_CLIENT_ID_LENGTH = 128
+MAX_CLIENT_LABELS = 100
+OTHER_CLIENTS_LABEL = "other"
+
+REDIS_KEY_PREFIX = "eq-cir-proxy:rate-limit:"
+
+# Refills and takes a token atomically, using the Redis server's clock so that every instance agrees on the time.
+# Returns the seconds until a token is available as a string, as Redis truncates Lua numbers to integers.
+REFILL_AND_TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+local tokens = math.min(burst, (tonumber(bucket[1]) or burst) + elapsed * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimitExceededError(Exception):
+    """Raised when a client has used up its quota."""
+
+    def __init__(self, client: str, retry_after: int) -> None:
+        """Initialise the error with the client and the seconds until its next token."""
+        super().__init__(f"Rate limit exceeded for client {client}")
+        self.client = client
+        self.retry_after = retry_after
+
+
+class TokenBuckets(Protocol):
+    """Storage of the clients' token buckets."""
+
+    async def take(self, client: str, quota: RateLimitQuota) -> float:
+        """Takes a token from the client's bucket, returning 0, or the seconds until a token is available."""
+
+    async def aclose(self) -> None:
+        """Releases any connection to the storage."""
+
+
+class InProcessBuckets:
+    """Token buckets held in this process, forgetting the least recently seen clients beyond a maximum number."""
+
+    def __init__(self, max_clients: int) -> None:
+        """Initialise the buckets.
+
+        Args:
+            max_clients (int): Maximum number of clients to keep buckets for.
+        """
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, client: str, quota: RateLimitQuota) -> float:
+        """Takes a token from the client's bucket, returning 0, or the seconds until a token is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (quota.burst, now))
+        tokens = min(quota.burst, tokens + (now - updated) * quota.requests_per_second)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / quota.requests_per_second
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def aclose(self) -> None:
+        """Nothing to release."""
+
+
+class RedisBuckets:
+    """Token buckets held in Redis, so that every instance draws on the same quotas.
+
+    When Redis cannot be reached, the fallback buckets are used instead, so an outage of the shared backend costs
+    accuracy rather than availability.
+    """
+
+    def __init__(self, client: Any, fallback: TokenBuckets, errors: tuple[type[Exception], ...]) -> None:
+        """Initialise the buckets.
+
+        Args:
+            client (redis.asyncio.Redis): The Redis client.
+            fallback (TokenBuckets): Buckets used while Redis cannot be reached.
+            errors (tuple): Exceptions raised by the client when Redis cannot be reached.
+        """
+        self.client = client
+        self.fallback = fallback
+        self.errors = errors
+
+    @classmethod
+    def from_url(cls, url: str, fallback: TokenBuckets) -> "RedisBuckets":
+        """Creates buckets stored in the Redis server at the URL.
+
+        The redis package is optional, so it is only imported when a Redis URL is configured.
+
+        Raises:
+            RuntimeError: If the redis package is not installed.
+        """
+        try:
+            redis = importlib.import_module("redis.asyncio")
+        except ImportError as exc:
+            error_message = "RATE_LIMIT_REDIS_URL is set, but the redis package is not installed"
+            raise RuntimeError(error_message) from exc
+        return cls(redis.from_url(url), fallback, errors=(redis.RedisError, OSError))
+
+    async def take(self, client: str, quota: RateLimitQuota) -> float:
+        """Takes a token from the client's bucket in Redis, or from the fallback if Redis cannot be reached."""
+        try:
+            wait = await self.client.eval(
+                REFILL_AND_TAKE_SCRIPT,
+                1,
+                REDIS_KEY_PREFIX + client,
+                quota.burst,
+                quota.requests_per_second,
+            )
+        except self.errors as exc:
+            logger.warning("Rate limit backend unavailable, using in-process buckets.", error=str(exc))
+            metrics.increment("rate_limit_backend_errors_total")
+            return await self.fallback.take(client, quota)
+        return float(wait)
+
+    async def aclose(self) -> None:
+        """Closes the connection to Redis."""
+        await self.client.aclose()
+
+
+class RateLimiter:
+    """Applies a token bucket quota to each client: its own quota if one is configured, else the default quota.
+
+    Clients with neither are not limited. Requests are counted per client whether or not they are limited.
+    """
+
+    def __init__(
+        self,
+        buckets: TokenBuckets,
+        *,
+        default_quota: RateLimitQuota | None,
+        client_quotas: Mapping[str, RateLimitQuota],
+    ) -> None:
+        """Initialise the limiter.
+
+        Args:
+            buckets (TokenBuckets): Storage of the clients' token buckets.
+            default_quota (RateLimitQuota | None): Quota of clients without their own, or None for no limit.
+            client_quotas (Mapping): Quotas of particular clients.
+        """
+        self.buckets = buckets
+        self.default_quota = default_quota
+        self.client_quotas = client_quotas
+        self._labelled_clients: set[str] = set()
+
+    async def check(self, client: str) -> None:
+        """Takes a token for the client.
+
+        Raises:
+            RateLimitExceededError: If the client has used up its quota.
+        """
+        quota = self.client_quotas.get(client, self.default_quota)
+        wait = 0.0 if quota is None else await self.buckets.take(client, quota)
+        labels = {"client": self._label(client), "result": "limited" if wait else "allowed"}
+        metrics.increment("rate_limit_requests_total", labels=labels)
+        if wait:
+            logger.warning("Client rate limit exceeded.", client=client)
+            raise RateLimitExceededError(client, retry_after=max(1, math.ceil(wait)))
+
+    async def aclose(self) -> None:
+        """Releases the bucket storage."""
+        await self.buckets.aclose()
+
+    def _label(self, client: str) -> str:
+        """Returns the metric label of a client, sharing one label between clients beyond the limit."""
+        if client in self.client_quotas or client in self._labelled_clients:
+            return client
+        if len(self._labelled_clients) < MAX_CLIENT_LABELS:
+            self._labelled_clients.add(client)
+            return client
+        return OTHER_CLIENTS_LABEL
+
+
+def client_identity(headers: Mapping[str, str], settings: Settings) -> str:
+    """Returns the identity of the calling client: its IAP principal, else its client ID header, else anonymous.
+
+    The client ID header is unauthenticated, so a caller could send a new ID with every request to get fresh bursts,
+    push other clients out of the buckets, or use up another client's quota. It is only trusted from callers that
+    IAP did not authenticate, and from the principals in CLIENT_ID_TRUSTED_PRINCIPALS, such as a gateway calling on
+    behalf of several services.
+    """
+    principal = headers.get(IAP_PRINCIPAL_HEADER, "").removeprefix(IAP_PRINCIPAL_PREFIX).strip()
+    if not principal or principal in settings.client_id_trusted_principals:
+        identity = headers.get(settings.client_id_header, "").strip() or principal
+    else:
+        identity = principal
+    return identity[:MAX_CLIENT_ID_LENGTH] or ANONYMOUS_CLIENT
+
+
+@cache
+def get_rate_limiter(settings: Settings) -> RateLimiter:
+    """Returns the rate limiter for /instrument requests, keeping its buckets in Redis if a URL is configured."""
+    buckets: TokenBuckets = InProcessBuckets(settings.rate_limit_max_clients)
+    if settings.rate_limit_redis_url:
+        buckets = RedisBuckets.from_url(settings.rate_limit_redis_url, fallback=buckets)
+    return RateLimiter(buckets, default_quota=settings.rate_limit, client_quotas=dict(settings.client_rate_limits))
@@ -0,0 +1,62 @@
+"""Cold-start diagnostics: a breakdown of the time spent importing the application."""
+
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+APP_MODULE = "eq_cir_proxy_service.main"
+
+
+@dataclass(frozen=True)
+class ImportTiming:
+    """Time spent importing the modules of one top-level package."""
+
+    package: str
+    seconds: float
+
+
+def parse_import_times(importtime_output: str) -> list[ImportTiming]:
+    """Aggregates ``python -X importtime`` output by top-level package, slowest first.
+
+    Parameters:
+    - importtime_output: The stderr of a ``python -X importtime`` run.
+
+    Returns:
+    - list[ImportTiming]: The self import time of each top-level package's modules, summed.
+    """
+    totals: dict[str, int] = defaultdict(int)
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_microseconds, _, module = line.removeprefix("import time:").split("|")
+        if not self_microseconds.strip().isdigit():
+            continue  # the header line
+        totals[module.strip().split(".")[0]] += int(self_microseconds)
+    return sorted(
+        (ImportTiming(package, microseconds / 1_000_000) for package, microseconds in totals.items()),
+        key=lambda timing: timing.seconds,
+        reverse=True,
+    )
+
+
+def measure_import_times(module: str = APP_MODULE) -> list[ImportTiming]:
+    """Imports a module in a fresh interpreter and returns its import-time breakdown by package."""
+    result = subprocess.run(  # noqa: S603 - fixed command built from sys.executable
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_import_times(result.stderr)
+
+
+def format_startup_report(timings: list[ImportTiming], limit: int = 15) -> str:
+    """Formats an import-time breakdown as a table of the slowest packages."""
+    total = sum(timing.seconds for timing in timings)
+    lines = [f"Total import time: {total * 1000:.1f} ms", f"{'package':<30} {'ms':>8} {'share':>6}"]
+    lines.extend(
+        f"{timing.package:<30} {timing.seconds * 1000:>8.1f} {timing.seconds / total:>6.1%}"
+        for timing in timings[:limit]
+    )
+    return "\n".join(lines) + "\n"
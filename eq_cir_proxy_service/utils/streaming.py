@@ -0,0 +1,48 @@
+"""Utilities for reading upstream response bodies without unbounded buffering."""
+
+from httpx import Response
+
+# Upstream error bodies are only read for logging, so only their start is kept.
+ERROR_BODY_LOG_LIMIT = 1024
+
+
+class PayloadTooLargeError(Exception):
+    """Raised when an upstream response body exceeds the configured maximum size."""
+
+    def __init__(self, size: int, max_bytes: int) -> None:
+        """Initialise the error with the observed (or declared) size and the limit."""
+        super().__init__(f"Response body of at least {size} bytes exceeds the limit of {max_bytes} bytes")
+        self.size = size
+        self.max_bytes = max_bytes
+
+
+async def read_body(response: Response, max_bytes: int, *, truncate: bool = False) -> bytearray:
+    """Reads a streamed response body into a single buffer, enforcing a maximum size.
+
+    Oversized bodies are rejected from the Content-Length header before any of the body is read, and
+    bodies without a usable Content-Length are rejected as soon as the limit is crossed while streaming.
+
+    Args:
+        response (httpx.Response): A response opened with ``AsyncClient.stream``.
+        max_bytes (int): The maximum number of bytes to read.
+        truncate (bool): Return the first ``max_bytes`` bytes instead of raising when the body is larger.
+
+    Raises:
+        PayloadTooLargeError: If the body exceeds ``max_bytes`` and ``truncate`` is not set.
+
+    Returns:
+        bytearray: The (possibly truncated) response body, returned without a further copy.
+    """
+    content_length = response.headers.get("Content-Length", "")
+    if not truncate and content_length.isdigit() and int(content_length) > max_bytes:
+        raise PayloadTooLargeError(int(content_length), max_bytes)
+
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            if truncate:
+                del buffer[max_bytes:]
+                break
+            raise PayloadTooLargeError(len(buffer), max_bytes)
+    return buffer
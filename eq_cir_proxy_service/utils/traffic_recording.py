@@ -0,0 +1,190 @@
+"""Opt-in recording of anonymised traffic, for replaying real workloads against local upstream stand-ins.
+
+When TRAFFIC_RECORDING_DIR is set, every request to an instrument route is recorded: when it arrived, its method,
+route and target version, its instrument ID replaced by an anonymous one, and its status and duration. Each process
+writes its own file in the directory, a header line followed by one compact JSON array per request, in batches
+written from a worker thread. Recording stops after TRAFFIC_RECORDING_MAX_REQUESTS requests.
+
+Anonymous IDs are keyed hashes of the instrument IDs, so every request for an instrument gets the same anonymous ID,
+and a recording keeps the workload's mix of repeated and distinct instruments. Each process makes a random key and
+only keeps it in memory, as instrument IDs are few enough that anyone holding the key could recover them by hashing
+every candidate; once the process exits, the IDs cannot be recovered. Each file is replayed on its own, so its
+anonymous IDs only need to be consistent within it.
+
+Recordings are replayed with ``python -m benchmarks.replay_traffic``.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from functools import cache
+from pathlib import Path
+from typing import NamedTuple
+from uuid import UUID
+
+from starlette.datastructures import QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from structlog import get_logger
+
+from eq_cir_proxy_service.config.settings import Settings, get_settings
+
+logger = get_logger()
+
+RECORDING_FORMAT = "eq-cir-proxy-traffic/1"
+# Length of the anonymisation key, in bytes.
+KEY_BYTES = 32
+# Requests to routes below this path are recorded; probes, metrics, job status and admin requests are not.
+RECORDED_ROUTE_PREFIX = "/instrument/{instrument_id}"
+# Recorded requests are written in batches of this many, so the file is not written to on every request.
+BATCH_SIZE = 256
+
+
+class RecordedRequest(NamedTuple):
+    """A recorded request, with its instrument ID anonymised, or None if the request's ID was not a valid UUID."""
+
+    offset_ms: float
+    method: str
+    route: str
+    instrument_id: str | None
+    version: str | None
+    status: int
+    duration_ms: float
+
+
+def read_recording(path: Path) -> list[RecordedRequest]:
+    """Reads the requests recorded in a file, in the order they arrived.
+
+    Raises:
+        ValueError: If the file is not a traffic recording.
+    """
+    with path.open(encoding="utf-8") as recording:
+        header = json.loads(recording.readline() or "{}")
+        if header.get("format") != RECORDING_FORMAT:
+            error_message = f"{path} is not a traffic recording"
+            raise ValueError(error_message)
+        requests = [RecordedRequest(*json.loads(line)) for line in recording if line.strip()]
+    return sorted(requests, key=lambda request: request.offset_ms)
+
+
+class TrafficRecorder:  # pylint: disable=too-many-instance-attributes
+    """Records requests to a file of its own in the recording directory."""
+
+    def __init__(self, directory: Path, *, max_requests: int) -> None:
+        """Initialise the recorder, creating its file with a header line.
+
+        Args:
+            directory (Path): The recording directory, created if it does not exist.
+            max_requests (int): The number of requests after which recording stops.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        self._key = secrets.token_bytes(KEY_BYTES)
+        self.max_requests = max_requests
+        self.recorded = 0
+        self.started = time.monotonic()
+        file_descriptor, path = tempfile.mkstemp(prefix=f"traffic-{os.getpid()}-", suffix=".jsonl", dir=directory)
+        os.close(file_descriptor)
+        self.path = Path(path)
+        header = {"format": RECORDING_FORMAT, "started_at": int(time.time())}
+        self.path.write_text(json.dumps(header) + "\n", encoding="utf-8")
+        self._batch: list[RecordedRequest] = []
+        self._writes: set[asyncio.Task[None]] = set()
+        # Batches are appended from worker threads, one at a time.
+        self._write_lock = threading.Lock()
+        logger.info("Recording traffic.", path=str(self.path), max_requests=max_requests)
+
+    def anonymise(self, instrument_id: str) -> str | None:
+        """Returns the anonymous ID of an instrument ID, itself a UUID, or None if the ID is not a valid UUID."""
+        try:
+            canonical_id = str(UUID(instrument_id))
+        except ValueError:
+            return None
+        digest = hmac.new(self._key, canonical_id.encode(), "sha256").digest()
+        return str(UUID(bytes=digest[:16], version=4))
+
+    def record(self, request: RecordedRequest) -> None:
+        """Records a request, writing a batch once enough requests have been recorded."""
+        if self.recorded >= self.max_requests:
+            return
+        self._batch.append(request)
+        self.recorded += 1
+        if self.recorded == self.max_requests:
+            logger.info("Traffic recording finished.", path=str(self.path), requests=self.recorded)
+        if len(self._batch) >= BATCH_SIZE or self.recorded == self.max_requests:
+            self._flush()
+
+    async def aclose(self) -> None:
+        """Writes any requests not yet written, and waits for every write to finish."""
+        if self._batch:
+            self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def _flush(self) -> None:
+        """Writes the recorded requests to the file in the background."""
+        batch, self._batch = self._batch, []
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._write, batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _write(self, batch: list[RecordedRequest]) -> None:
+        """Appends a batch of requests to the file, logging rather than raising on failure."""
+        lines = "".join(json.dumps(request, separators=(",", ":")) + "\n" for request in batch)
+        try:
+            with self._write_lock, self.path.open("a", encoding="utf-8") as recording:
+                recording.write(lines)
+        except OSError:
+            logger.exception("Failed to write the traffic recording.", path=str(self.path))
+
+
+@cache
+def get_traffic_recorder(settings: Settings) -> TrafficRecorder | None:
+    """Returns the traffic recorder for the application's settings, or None if traffic is not recorded."""
+    if not settings.traffic_recording_dir:
+        return None
+    return TrafficRecorder(Path(settings.traffic_recording_dir), max_requests=settings.traffic_recording_max_requests)
+
+
+class TrafficRecordingMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware that records requests to instrument routes when TRAFFIC_RECORDING_DIR is set."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Initialise the middleware around the application."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serves the request, then records it if it was routed to an instrument route."""
+        recorder = get_traffic_recorder(get_settings()) if scope["type"] == "http" else None
+        if recorder is None:
+            await self.app(scope, receive, send)
+            return
+
+        offset = time.monotonic() - recorder.started
+        response = {"status": 500}
+
+        async def send_recording_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_recording_status)
+        finally:
+            # The router adds the matched route and its path parameters to the scope.
+            route = getattr(scope.get("route"), "path", "")
+            if route.startswith(RECORDED_ROUTE_PREFIX):
+                recorder.record(
+                    RecordedRequest(
+                        offset_ms=round(offset * 1000, 3),
+                        method=scope["method"],
+                        route=route,
+                        instrument_id=recorder.anonymise(scope["path_params"]["instrument_id"]),
+                        version=QueryParams(scope["query_string"]).get("version"),
+                        status=response["status"],
+                        duration_ms=round((time.monotonic() - recorder.started - offset) * 1000, 3),
+                    ),
+                )
@@ -0,0 +1,37 @@
+"""Memoized semantic version parsing shared by the request validator and the conversion service."""
+
+from functools import lru_cache
+
+from semver import Version
+
+# Only a handful of validator versions are in use at any one time, so a small bound keeps every
+# common version string cached while stopping arbitrary client input from growing the cache.
+VERSION_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def parse_version(version: str) -> Version:
+    """Parses a version string into a Version object, caching the result.
+
+    Invalid versions raise and are therefore never cached, so malformed input cannot evict valid entries.
+
+    Parameters:
+    - version: The version string to parse.
+
+    Returns:
+    - Version: The parsed (immutable) version.
+
+    Raises:
+    - ValueError: If the version is not a valid semver string.
+    - TypeError: If the version is not a string.
+    """
+    return Version.parse(version)
+
+
+def is_valid_version(version: str) -> bool:
+    """Checks whether a version string is a valid semver, warming the parse cache on success."""
+    try:
+        parse_version(version)
+    except ValueError:
+        return False
+    return True
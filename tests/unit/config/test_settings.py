@@ -0,0 +1,159 @@
+"""Tests for loading and validating the application settings."""
+
+import pytest
+
+from eq_cir_proxy_service.config.settings import (
+    DEFAULT_CIR_RETRIEVE_CI_ENDPOINT,
+    DEFAULT_MAX_INSTRUMENT_SIZE_BYTES,
+    EjectionSettings,
+    RateLimitQuota,
+    SettingsError,
+    get_settings,
+    load_settings,
+)
+
+REQUIRED_ENVIRONMENT = {
+    "CIR_API_BASE_URL": "http://cir",
+    "CONVERTER_SERVICE_API_BASE_URL": "http://converter-service",
+}
+
+
+def test_load_settings_defaults():
+    """Test that only the base URLs are required, with defaults for everything else."""
+    settings = load_settings(REQUIRED_ENVIRONMENT)
+
+    assert settings.cir.base_urls == ("http://cir",)
+    assert settings.cir.endpoint == DEFAULT_CIR_RETRIEVE_CI_ENDPOINT
+    assert settings.cir.iap_client_id is None
+    assert settings.max_instrument_size_bytes == DEFAULT_MAX_INSTRUMENT_SIZE_BYTES
+    assert not settings.iap_client_ids
+    assert not settings.client_id_trusted_principals
+    assert settings.conversion_jobs_enabled is True
+    assert settings.validate_upstream_instruments is True
+    assert settings.disk_cache_dir is None
+    assert settings.cache_compression_enabled is True
+    assert (settings.rate_limit, settings.client_rate_limits) == (None, ())
+    assert settings.readiness_check_interval_seconds == 5.0
+    assert (settings.traffic_recording_dir, settings.traffic_recording_max_requests) == (None, 100_000)
+    assert settings.profiling_enabled is False
+    assert (settings.negative_cache_ttl_seconds, settings.negative_cache_max_entries) == (30.0, 10_000)
+    assert settings.conversion_job_workers == 2
+    assert settings.conversion_job_timeout_seconds == 600.0
+    assert (settings.access_log_sample_rate, settings.access_log_slow_request_seconds) == (1.0, 1.0)
+
+
+def test_load_settings_from_environment():
+    """Test that settings are read from their environment variables."""
+    settings = load_settings(
+        REQUIRED_ENVIRONMENT
+        | {
+            "CONVERTER_SERVICE_CONVERT_CI_ENDPOINT": "/convert",
+            "CONVERTER_SERVICE_IAP_CLIENT_ID": "converter-audience",
+            "CONVERTER_SERVICE_MAX_CONCURRENCY": "2",
+            "CIR_IAP_CLIENT_ID": "",
+            "UPSTREAM_MAX_CONNECTIONS": "7",
+            "UPSTREAM_MAX_KEEPALIVE_CONNECTIONS": "3",
+            "UPSTREAM_KEEPALIVE_EXPIRY_SECONDS": "2.5",
+            "REQUEST_QUEUE_TIMEOUT_SECONDS": "0.5",
+            "VALIDATE_UPSTREAM_INSTRUMENTS": "False",
+            "DISK_CACHE_DIR": "/var/cache/proxy",
+            "DISK_CACHE_MAX_BYTES": "1000",
+            "CACHE_COMPRESSION_ENABLED": "false",
+            "ADMIN_TOKEN": "secret-token",
+            "RATE_LIMIT_REQUESTS_PER_SECOND": "2.5",
+            "RATE_LIMIT_CLIENT_QUOTAS": "runner-v5=10:20, runner-v4=0.5,",
+            "CLIENT_ID_TRUSTED_PRINCIPALS": "gateway@project.iam.gserviceaccount.com",
+            "CONVERTER_SERVICE_API_BASE_URL": "https://converter-eu, https://converter-us,",
+            "UPSTREAM_EJECTION_FAILURES": "3",
+            "ACCESS_LOG_SAMPLE_RATE": "0.05",
+            "TRAFFIC_RECORDING_DIR": "/var/lib/proxy/traffic",
+            "TRAFFIC_RECORDING_MAX_REQUESTS": "500",
+            "CONVERSION_JOBS_ENABLED": "false",
+        },
+    )
+
+    assert settings.converter_service.endpoint == "/convert"
+    assert settings.converter_service.base_urls == ("https://converter-eu", "https://converter-us")
+    assert settings.cir.ejection == EjectionSettings(consecutive_failures=3, seconds=30.0)
+    assert settings.converter_service.max_concurrency == 2
+    assert settings.access_log_sample_rate == 0.05
+    assert settings.iap_client_ids == ("converter-audience",)
+    assert settings.cir.pool.max_connections == 7
+    assert settings.converter_service.pool.keepalive_expiry_seconds == 2.5
+    assert settings.request_queue_timeout_seconds == 0.5
+    assert settings.validate_upstream_instruments is False
+    assert (settings.disk_cache_dir, settings.disk_cache_max_bytes) == ("/var/cache/proxy", 1000)
+    assert settings.cache_compression_enabled is False
+    assert (settings.traffic_recording_dir, settings.traffic_recording_max_requests) == ("/var/lib/proxy/traffic", 500)
+    assert settings.admin_token == "secret-token"  # noqa: S105
+    assert "secret-token" not in repr(settings)
+    assert settings.admin_token_matches("secret-token")
+    assert not settings.admin_token_matches("other-token")
+    assert not settings.admin_token_matches(None)
+    assert settings.rate_limit == RateLimitQuota(requests_per_second=2.5, burst=3)
+    assert settings.client_rate_limits == (
+        ("runner-v5", RateLimitQuota(requests_per_second=10, burst=20)),
+        ("runner-v4", RateLimitQuota(requests_per_second=0.5, burst=1)),
+    )
+    assert settings.client_id_trusted_principals == ("gateway@project.iam.gserviceaccount.com",)
+    assert settings.conversion_jobs_enabled is False
+
+
+@pytest.mark.parametrize("value, expected", [("true", True), ("1", True), ("No", False), (" ", True)])
+def test_load_settings_flags(value, expected):
+    """Test the accepted spellings of true/false flags, with an empty value taking the default."""
+    settings = load_settings(REQUIRED_ENVIRONMENT | {"VALIDATE_UPSTREAM_INSTRUMENTS": value})
+
+    assert settings.validate_upstream_instruments is expected
+
+
+@pytest.mark.parametrize(
+    "overrides, error",
+    [
+        ({"CIR_API_BASE_URL": ""}, "CIR_API_BASE_URL must be set"),
+        ({"CIR_API_BASE_URL": " , "}, "CIR_API_BASE_URL must be set"),
+        ({"CIR_RETRIEVE_CI_ENDPOINT": ""}, "CIR_RETRIEVE_CI_ENDPOINT must be set"),
+        ({"MAX_INSTRUMENT_SIZE_BYTES": "20MB"}, "MAX_INSTRUMENT_SIZE_BYTES must be a number"),
+        ({"MAX_IN_FLIGHT_REQUESTS": "0"}, "MAX_IN_FLIGHT_REQUESTS must be greater than zero"),
+        ({"UPSTREAM_MAX_KEEPALIVE_CONNECTIONS": "200"}, "must not exceed UPSTREAM_MAX_CONNECTIONS"),
+        ({"REQUEST_DEADLINE_SECONDS": "90"}, "must not exceed MAX_REQUEST_DEADLINE_SECONDS"),
+        ({"VALIDATE_UPSTREAM_INSTRUMENTS": "maybe"}, "VALIDATE_UPSTREAM_INSTRUMENTS must be true or false"),
+        ({"RATE_LIMIT_REQUESTS_PER_SECOND": "inf"}, "RATE_LIMIT_REQUESTS_PER_SECOND and RATE_LIMIT_BURST must be"),
+        (
+            {"RATE_LIMIT_REQUESTS_PER_SECOND": "1", "RATE_LIMIT_BURST": "0"},
+            "RATE_LIMIT_REQUESTS_PER_SECOND and RATE_LIMIT_BURST must be",
+        ),
+        ({"RATE_LIMIT_CLIENT_QUOTAS": "runner"}, "RATE_LIMIT_CLIENT_QUOTAS entries must look like"),
+        ({"RATE_LIMIT_CLIENT_QUOTAS": "=1"}, "RATE_LIMIT_CLIENT_QUOTAS entries must look like"),
+        ({"ACCESS_LOG_SAMPLE_RATE": "2"}, "ACCESS_LOG_SAMPLE_RATE must be a number from 0 to 1"),
+        ({"ACCESS_LOG_SAMPLE_RATE": "some"}, "ACCESS_LOG_SAMPLE_RATE must be a number from 0 to 1"),
+        ({"PUBLISH_EVENT_AUDIENCE": "https://proxy"}, "PUBLISH_EVENT_AUDIENCE and PUBLISH_EVENT_SERVICE_ACCOUNT"),
+    ],
+)
+def test_load_settings_invalid(overrides, error):
+    """Test that invalid configuration is rejected."""
+    with pytest.raises(SettingsError, match=error):
+        load_settings(REQUIRED_ENVIRONMENT | overrides)
+
+
+def test_load_settings_reports_every_error():
+    """Test that every problem is reported at once."""
+    with pytest.raises(SettingsError) as exc_info:
+        load_settings({"RETRY_AFTER_SECONDS": "soon"})
+
+    assert len(exc_info.value.errors) == 3
+
+
+def test_settings_are_frozen(settings):
+    """Test that settings cannot be changed once loaded."""
+    with pytest.raises(AttributeError):
+        settings.max_instrument_size_bytes = 1
+
+
+def test_get_settings_is_cached(monkeypatch):
+    """Test that the environment is only read once."""
+    settings = get_settings()
+    monkeypatch.setenv("CIR_API_BASE_URL", "http://changed")
+
+    assert get_settings() is settings
+    assert settings.cir.base_urls != ("http://changed",)
@@ -1,7 +1,83 @@
 """Configuration for unit tests."""
 
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 import pytest
-from httpx import AsyncClient
+import pytest_asyncio
+from httpx import AsyncClient, MockTransport
+
+from eq_cir_proxy_service.config.settings import get_settings
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+from eq_cir_proxy_service.services.instrument.jobs import get_conversion_jobs
+from eq_cir_proxy_service.services.readiness import get_readiness_checker
+from eq_cir_proxy_service.utils import balancer, blob_cache, cache, deadline, disk_cache, error_log, rate_limit
+from eq_cir_proxy_service.utils.rate_limit import get_rate_limiter
+from eq_cir_proxy_service.utils.traffic_recording import get_traffic_recorder
+
+
+@pytest.fixture(autouse=True)
+def settings_environment(monkeypatch):
+    """Give every test the required environment variables, and settings, caches, quotas, logs and recorders afresh."""
+    monkeypatch.setenv("CIR_API_BASE_URL", "http://fake-cir")
+    monkeypatch.setenv("CONVERTER_SERVICE_API_BASE_URL", "http://fake-converter-service")
+    error_log.reset()
+    get_settings.cache_clear()
+    get_instrument_cache.cache_clear()
+    get_rate_limiter.cache_clear()
+    get_readiness_checker.cache_clear()
+    get_conversion_jobs.cache_clear()
+    get_traffic_recorder.cache_clear()
+    yield
+    get_settings.cache_clear()
+    get_instrument_cache.cache_clear()
+    get_rate_limiter.cache_clear()
+    get_readiness_checker.cache_clear()
+    get_conversion_jobs.cache_clear()
+    get_traffic_recorder.cache_clear()
+
+
+class FakeClock:
+    """Stands in for the time module in the modules under test, with a clock that only moves when the test moves it."""
+
+    def __init__(self) -> None:
+        """Initialise the clock at an arbitrary time."""
+        self.now = 1000.0
+
+    def __getattr__(self, name):
+        """Delegate everything but the clocks to the time module."""
+        return getattr(time, name)
+
+    def monotonic(self) -> float:
+        """Return the current time."""
+        return self.now
+
+    def time(self) -> float:
+        """Return the current time, as the wall clock."""
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock forward."""
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    """Give the modules that keep time for caches, deadlines, limits and logs a clock the test controls.
+
+    Only these modules' references to the time module are replaced, so the event loop keeps the real clock.
+    """
+    fake_clock = FakeClock()
+    for module in (balancer, blob_cache, cache, deadline, disk_cache, error_log, rate_limit):
+        monkeypatch.setattr(module, "time", fake_clock)
+    return fake_clock
+
+
+@pytest.fixture
+def settings():
+    """Fixture returning the application settings for the test environment."""
+    return get_settings()
 
 
 @pytest.fixture
@@ -33,3 +109,63 @@ def mock_post(monkeypatch):
         "captured": captured,
         "set_response": lambda data, status_code=200: captured.update(response_data=data, status_code=status_code),
     }
+
+
+@pytest.fixture
+def mock_api_client():
+    """Fixture returning a factory for get_api_client replacements backed by an httpx.MockTransport handler."""
+
+    def factory(handler):
+        @asynccontextmanager
+        async def fake_api_client(*_args, **_kwargs):
+            async with AsyncClient(transport=MockTransport(handler), base_url="http://fake-service") as client:
+                yield client
+
+        return fake_api_client
+
+    return factory
+
+
+# Default timeout of the clients served by slow_api_client, standing in for httpx's 5 second default.
+SLOW_CLIENT_TIMEOUT_SECONDS = 0.1
+
+
+@pytest_asyncio.fixture
+async def slow_api_client():
+    """Fixture returning a factory for get_api_client replacements backed by a real local server that answers slowly.
+
+    The server answers every request with a 200 and the given JSON body after the given delay. Unlike a
+    MockTransport, it is subject to the client's timeouts, which default to SLOW_CLIENT_TIMEOUT_SECONDS.
+    """
+    servers = []
+
+    async def factory(body: bytes, delay: float):
+        async def answer(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            head = await reader.readuntil(b"\r\n\r\n")
+            headers = dict(line.lower().split(b": ", 1) for line in head.split(b"\r\n")[1:] if line)
+            length = int(headers.get(b"content-length", 0))
+            await reader.readexactly(length)
+            await asyncio.sleep(delay)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body,
+            )
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(answer, "127.0.0.1", 0)
+        servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+
+        @asynccontextmanager
+        async def fake_api_client(*_args, **_kwargs):
+            async with AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=SLOW_CLIENT_TIMEOUT_SECONDS) as client:
+                yield client
+
+        return fake_api_client
+
+    yield factory
+    for server in servers:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,30 @@
+"""Tests for the precomputed error responses."""
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.exceptions.error_responses import error_response
+
+
+@pytest.mark.parametrize(
+    "status_code, detail",
+    [
+        (400, {"status": "error", "message": exception_messages.EXCEPTION_400_INVALID_VERSION}),
+        (404, {"status": "error", "message": exception_messages.EXCEPTION_404_INSTRUMENT_NOT_FOUND}),
+        (404, "Not Found"),
+        (500, {"status": "error", "message": exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING}),
+        (400, {"status": "error", "message": exception_messages.EXCEPTION_400_INVALID_VERSION, "extra": 1}),
+        (400, {"status": "fail", "message": 1}),
+        (400, {"status": "error", "message": 1}),
+        (405, None),
+    ],
+)
+def test_error_response_matches_json_response(status_code, detail):
+    """Test that error responses, precomputed or not, are the same as JSONResponse would render."""
+    response = error_response(status_code, detail, headers={"Retry-After": "1"})
+    expected = JSONResponse(status_code=status_code, content={"detail": detail}, headers={"Retry-After": "1"})
+
+    assert response.status_code == status_code
+    assert response.body == expected.body
+    assert response.headers == expected.headers
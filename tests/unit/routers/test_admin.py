@@ -0,0 +1,306 @@
+"""Unit tests for the admin router's cache invalidation and profiling endpoints."""
+
+import base64
+import cProfile
+import json
+import pstats
+from collections import OrderedDict
+from uuid import uuid4
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from eq_cir_proxy_service.config.settings import get_settings
+from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.routers.admin import router
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+from eq_cir_proxy_service.utils import iap, profiling
+
+ADMIN_TOKEN = "test-admin-token"  # noqa: S105
+HEADERS = {"X-Admin-Token": ADMIN_TOKEN}
+INSTRUMENT = {"validator_version": "1.0.0", "title": "Title"}
+PUSH_AUDIENCE = "https://proxy.example.com/admin/events/cir-publish"
+PUSH_SERVICE_ACCOUNT = "cir-publish-push@project.iam.gserviceaccount.com"
+CLAIMS = {
+    "pubsub": {"email": PUSH_SERVICE_ACCOUNT, "email_verified": True},
+    "other-account": {"email": "someone@example.com", "email_verified": True},
+    "unverified-email": {"email": PUSH_SERVICE_ACCOUNT, "email_verified": False},
+}
+
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    """Configure the admin token for every test."""
+    monkeypatch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+
+
+def cache_instrument(instrument_id):
+    """Caches an instrument, its metadata and one conversion, returning the cache."""
+    instrument_cache = get_instrument_cache(get_settings())
+    instrument_cache.store(str(instrument_id), INSTRUMENT, json.dumps(INSTRUMENT).encode())
+    instrument_cache.store_conversion(str(instrument_id), "hash:2.0.0", b"{}")
+    return instrument_cache
+
+
+def publish_event(instrument_id, data=None) -> dict:
+    """Builds the Pub/Sub push envelope that CIR's publish subscription delivers for a published instrument."""
+    data = {"id": str(instrument_id), "survey_id": "3456", "validator_version": "2.0.0"} if data is None else data
+    return {
+        "message": {
+            "data": base64.b64encode(json.dumps(data).encode()).decode(),
+            "messageId": "1",
+            "attributes": {},
+        },
+        "subscription": "projects/test/subscriptions/cir-publish",
+    }
+
+
+def test_invalidate_instrument():
+    """Should evict the instrument, its metadata and its conversions, leaving other instruments cached."""
+    instrument_id, other_id = uuid4(), uuid4()
+    instrument_cache = cache_instrument(instrument_id)
+    cache_instrument(other_id)
+
+    response = client.delete(f"/admin/cache/instrument/{instrument_id}", headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "instrument_id": str(instrument_id), "evicted": 3}
+    assert instrument_cache.bodies.get(str(instrument_id)) is None
+    assert instrument_cache.metadata.get(str(instrument_id)) is None
+    assert len(instrument_cache.conversions) == 1
+    assert instrument_cache.bodies.get(str(other_id)) is not None
+
+
+def test_invalidate_conversions():
+    """Should evict only the conversions of the instrument."""
+    instrument_id = uuid4()
+    instrument_cache = cache_instrument(instrument_id)
+
+    response = client.delete(f"/admin/cache/instrument/{instrument_id}/conversions", headers=HEADERS)
+
+    assert response.json()["evicted"] == 1
+    assert len(instrument_cache.conversions) == 0
+    assert instrument_cache.bodies.get(str(instrument_id)) is not None
+
+
+def test_invalidate_all():
+    """Should evict every cached entry."""
+    instrument_cache = cache_instrument(uuid4())
+    cache_instrument(uuid4())
+
+    response = client.delete("/admin/cache", headers=HEADERS)
+
+    assert response.json() == {"status": "success", "evicted": 6}
+    assert len(instrument_cache.bodies) == len(instrument_cache.conversions) == len(instrument_cache.metadata) == 0
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Admin-Token": "wrong"}])
+def test_admin_requires_token(headers):
+    """Should reject requests without the admin token."""
+    response = client.delete("/admin/cache", headers=headers)
+
+    assert response.status_code == 403
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_403_ADMIN_FORBIDDEN
+
+
+def test_admin_disabled_without_configured_token(monkeypatch):
+    """Should reject every request when no admin token is configured."""
+    monkeypatch.delenv("ADMIN_TOKEN")
+
+    assert client.delete("/admin/cache", headers=HEADERS).status_code == 403
+
+
+def test_publish_event_invalidates_instrument():
+    """Should evict the published instrument from the cache."""
+    instrument_id = uuid4()
+    instrument_cache = cache_instrument(instrument_id)
+
+    response = client.post("/admin/events/cir-publish", headers=HEADERS, json=publish_event(instrument_id))
+
+    assert response.status_code == 200
+    assert response.json()["evicted"] == 3
+    assert instrument_cache.bodies.get(str(instrument_id)) is None
+
+
+@pytest.fixture(name="push_subscription")
+def fixture_push_subscription(monkeypatch):
+    """Configure the publish subscription's push audience and service account, returning the verified tokens."""
+    monkeypatch.setenv("PUBLISH_EVENT_AUDIENCE", PUSH_AUDIENCE)
+    monkeypatch.setenv("PUBLISH_EVENT_SERVICE_ACCOUNT", PUSH_SERVICE_ACCOUNT)
+    verified = []
+
+    def verify_id_token(token, audience):
+        if token == "forged":  # noqa: S105
+            error_message = "Could not verify token signature."
+            raise ValueError(error_message)
+        verified.append((token, audience))
+        return CLAIMS[token]
+
+    monkeypatch.setattr(iap, "verify_id_token", verify_id_token)
+    return verified
+
+
+def test_publish_event_from_authenticated_push(push_subscription):
+    """Should accept publish events pushed with an ID token issued to the subscription's service account."""
+    response = client.post(
+        "/admin/events/cir-publish",
+        headers={"Authorization": "Bearer pubsub"},
+        json=publish_event(uuid4()),
+    )
+
+    assert response.status_code == 200
+    assert push_subscription == [("pubsub", PUSH_AUDIENCE)]
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {},
+        {"Authorization": "Bearer forged"},
+        {"Authorization": "Bearer other-account"},
+        {"Authorization": "Bearer unverified-email"},
+        {"Authorization": "Basic pubsub"},
+        {"X-Admin-Token": "wrong"},
+    ],
+)
+@pytest.mark.usefixtures("push_subscription")
+def test_publish_event_requires_authenticated_publisher(headers):
+    """Should reject publish events without a valid push ID token from the service account, or the admin token."""
+    response = client.post("/admin/events/cir-publish", headers=headers, json=publish_event(uuid4()))
+
+    assert response.status_code == 403
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_403_PUBLISHER_FORBIDDEN
+
+
+def test_publish_event_push_token_ignored_without_audience(monkeypatch):
+    """Should not accept ID tokens unless the push audience is configured."""
+    monkeypatch.setattr(iap, "verify_id_token", lambda *_: CLAIMS["pubsub"])
+
+    response = client.post(
+        "/admin/events/cir-publish",
+        headers={"Authorization": "Bearer pubsub"},
+        json=publish_event(uuid4()),
+    )
+
+    assert response.status_code == 403
+
+
+def test_publish_event_ignores_token_in_query_string():
+    """Should not accept the admin token in the query string, where access logs would record it."""
+    response = client.post("/admin/events/cir-publish", params={"token": ADMIN_TOKEN}, json=publish_event(uuid4()))
+
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize(
+    "envelope",
+    [
+        {},
+        {"message": {"data": "not base64!"}},
+        {"message": {"data": base64.b64encode(b"not json").decode()}},
+        publish_event(None, data={"survey_id": "3456"}),
+        publish_event(None, data={"id": "not-a-uuid"}),
+        publish_event(None, data=["not", "an", "object"]),
+    ],
+)
+def test_publish_event_invalid(envelope):
+    """Should reject publish events that do not identify an instrument."""
+    response = client.post("/admin/events/cir-publish", headers=HEADERS, json=envelope)
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_400_INVALID_PUBLISH_EVENT
+
+
+@pytest.fixture
+def profiling_enabled(monkeypatch):
+    """Enable profiling, without any request profiles."""
+    monkeypatch.setenv("PROFILING_ENABLED", "true")
+    monkeypatch.setenv("PROFILING_MAX_SECONDS", "1")
+    monkeypatch.setattr(profiling, "_request_profiles", OrderedDict())
+
+
+@pytest.mark.usefixtures("profiling_enabled")
+def test_capture_profile():
+    """Should sample for the requested duration and return a speedscope profile."""
+    response = client.get("/admin/profile", params={"seconds": 0.02}, headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.json()["$schema"] == profiling.SPEEDSCOPE_SCHEMA
+    assert "attachment" in response.headers["Content-Disposition"]
+
+
+@pytest.mark.usefixtures("profiling_enabled")
+def test_capture_profile_collapsed():
+    """Should return collapsed stacks when asked."""
+    response = client.get("/admin/profile", params={"seconds": 0.02, "format": "collapsed"}, headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert response.text.endswith("\n")
+
+
+@pytest.mark.usefixtures("profiling_enabled")
+@pytest.mark.parametrize("seconds", [0, 2])
+def test_capture_profile_invalid_duration(seconds):
+    """Should reject durations that are not positive or exceed PROFILING_MAX_SECONDS."""
+    response = client.get("/admin/profile", params={"seconds": seconds}, headers=HEADERS)
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_400_INVALID_PROFILE_DURATION
+
+
+@pytest.mark.usefixtures("profiling_enabled")
+def test_capture_profile_busy(monkeypatch):
+    """Should reject a profile while another is being captured."""
+
+    async def busy(*_args):
+        error_message = "busy"
+        raise profiling.ProfilerBusyError(error_message)
+
+    monkeypatch.setattr(profiling, "capture_sampled_profile", busy)
+
+    response = client.get("/admin/profile", params={"seconds": 0.01}, headers=HEADERS)
+
+    assert response.status_code == 409
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_409_PROFILER_BUSY
+
+
+@pytest.mark.parametrize("path", ["/admin/profile", "/admin/profile/requests/abc"])
+def test_profiling_disabled(path):
+    """Should not expose profiles unless profiling is enabled."""
+    response = client.get(path, headers=HEADERS)
+
+    assert response.status_code == 404
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_404_PROFILING_DISABLED
+
+
+@pytest.mark.usefixtures("profiling_enabled")
+def test_download_request_profile(tmp_path):
+    """Should return a captured request profile as a pstats file or a text report."""
+    profile = cProfile.Profile()
+    profile.runcall(sum, range(10))
+    profiling.store_request_profile("abc", profile)
+
+    pstats_response = client.get("/admin/profile/requests/abc", headers=HEADERS)
+    text_response = client.get("/admin/profile/requests/abc", params={"format": "text"}, headers=HEADERS)
+
+    assert pstats_response.headers["Content-Disposition"] == 'attachment; filename="abc.pstats"'
+    (tmp_path / "abc.pstats").write_bytes(pstats_response.content)
+    assert any(
+        function[2] == "<built-in method builtins.sum>" for function in pstats.Stats(str(tmp_path / "abc.pstats")).stats
+    )
+    assert "builtins.sum" in text_response.text
+
+
+@pytest.mark.usefixtures("profiling_enabled")
+def test_download_request_profile_not_found():
+    """Should return a 404 for an unknown profile ID."""
+    response = client.get("/admin/profile/requests/unknown", headers=HEADERS)
+
+    assert response.status_code == 404
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_404_PROFILE_NOT_FOUND
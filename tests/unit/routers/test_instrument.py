@@ -6,8 +6,14 @@ import pytest
 from fastapi import FastAPI, HTTPException
 from fastapi.testclient import TestClient
 
+from eq_cir_proxy_service.config.settings import get_settings
+from eq_cir_proxy_service.exceptions import exception_messages
 from eq_cir_proxy_service.routers import instrument as instrument_router
 from eq_cir_proxy_service.routers.instrument import router
+from eq_cir_proxy_service.services.instrument.cache import InstrumentMetadata, get_instrument_cache
+from eq_cir_proxy_service.services.instrument.jobs import JOB_LIMITER
+from eq_cir_proxy_service.utils.concurrency import ConcurrencyLimitExceededError
+from eq_cir_proxy_service.utils.deadline import DeadlineExceededError, remaining
 
 # Set up FastAPI test app and client
 app = FastAPI()
@@ -23,7 +29,7 @@ async def test_get_instrument_by_uuid_success(monkeypatch: pytest.MonkeyPatch):
         "validator_version": "1.0.0",
     }
 
-    async def mock_retrieve_instrument(_instrument_id):
+    async def mock_retrieve_instrument(_instrument_id, _settings):
         return mocked_instrument
 
     monkeypatch.setattr(
@@ -38,7 +44,7 @@ async def test_get_instrument_by_uuid_success(monkeypatch: pytest.MonkeyPatch):
 @pytest.mark.asyncio
 async def test_get_instrument_by_uuid_with_version(monkeypatch: pytest.MonkeyPatch):
     """Should return 200 and correct instrument data when version is supplied, including conversion."""
-    instrument_id = uuid4()
+    instrument_id = requested_id = uuid4()
     version = "2.0.0"
     mocked_instrument = {
         "validator_version": "1.0.0",
@@ -47,10 +53,11 @@ async def test_get_instrument_by_uuid_with_version(monkeypatch: pytest.MonkeyPat
         "validator_version": version,
     }
 
-    async def mock_retrieve_instrument(_instrument_id):
+    async def mock_retrieve_instrument(_instrument_id, _settings):
         return mocked_instrument
 
-    async def mock_convert_instrument(instrument, target_version):
+    async def mock_convert_instrument(instrument, target_version, _settings, *, instrument_id):
+        assert instrument_id == requested_id
         assert instrument == mocked_instrument
         assert target_version == version
         return converted_instrument
@@ -113,3 +120,250 @@ def test_get_instrument_by_uuid_internal_error(monkeypatch: pytest.MonkeyPatch)
     data = response.json()
     assert data["detail"]["status"] == "error"
     assert "message" in data["detail"]
+
+
+def test_get_instrument_by_uuid_overloaded(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return 503 with a Retry-After header when the service is at capacity."""
+    instrument_id = str(uuid4())
+
+    async def mock_retrieve_instrument(_instrument_id, _settings):
+        limiter_name = "instrument"
+        raise ConcurrencyLimitExceededError(limiter_name, "queue_full", retry_after=7)
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.retrieval.retrieve_instrument",
+        mock_retrieve_instrument,
+    )
+
+    response = client.get(f"/instrument/{instrument_id}?version=1.0.0")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert response.json()["detail"]["status"] == "error"
+
+
+@pytest.mark.parametrize("path", ["/instrument/{instrument_id}?version=1.0.0", "/instrument/{instrument_id}/metadata"])
+def test_not_found_instrument_rejected_before_admission(path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return 404 for an ID CIR recently did not find, without waiting for admission or retrieving it."""
+    instrument_id = uuid4()
+    get_instrument_cache(get_settings()).store_not_found(str(instrument_id))
+
+    def unexpected_call(*_args, **_kwargs):
+        raise AssertionError
+
+    monkeypatch.setattr("eq_cir_proxy_service.routers.instrument.get_request_limiter", unexpected_call)
+
+    response = client.get(path.format(instrument_id=instrument_id))
+
+    assert response.status_code == 404
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_404_INSTRUMENT_NOT_FOUND
+
+
+def test_instrument_requests_rate_limited_per_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return 429 with a Retry-After header once a client has used up its quota, without affecting others."""
+    monkeypatch.setenv("RATE_LIMIT_CLIENT_QUOTAS", "greedy=0.5:1")
+
+    async def mock_retrieve_instrument(_instrument_id, _settings):
+        return {"validator_version": "1.0.0"}
+
+    monkeypatch.setattr(instrument_router.retrieval, "retrieve_instrument", mock_retrieve_instrument)
+
+    greedy = {"X-Client-Id": "greedy"}
+    assert client.get(f"/instrument/{uuid4()}?version=1.0.0", headers=greedy).status_code == 200
+    limited = client.get(f"/instrument/{uuid4()}/metadata", headers=greedy)
+    other = client.get(f"/instrument/{uuid4()}?version=1.0.0", headers={"X-Client-Id": "other"})
+
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "2"
+    assert limited.json()["detail"]["message"] == exception_messages.EXCEPTION_429_RATE_LIMITED
+    assert other.status_code == 200
+
+
+def test_get_instrument_by_uuid_deadline_exceeded(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return 504 when the request deadline passes, honouring the client's X-Request-Timeout."""
+    instrument_id = str(uuid4())
+    observed = {}
+
+    async def mock_retrieve_instrument(_instrument_id, _settings):
+        observed["remaining"] = remaining()
+        stage = "retrieval"
+        raise DeadlineExceededError(stage)
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.retrieval.retrieve_instrument",
+        mock_retrieve_instrument,
+    )
+
+    response = client.get(f"/instrument/{instrument_id}?version=1.0.0", headers={"X-Request-Timeout": "2.5"})
+    assert response.status_code == 504
+    assert response.json()["detail"]["status"] == "error"
+    assert 0 < observed["remaining"] <= 2.5
+
+
+def test_get_instrument_by_uuid_invalid_request_timeout() -> None:
+    """Should return 422 when X-Request-Timeout is not a positive number."""
+    response = client.get(f"/instrument/{uuid4()}?version=1.0.0", headers={"X-Request-Timeout": "0"})
+    assert response.status_code == 422
+
+
+def test_get_instrument_by_uuid_with_fields(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return only the requested top-level fields when fields is supplied."""
+    instrument = {"validator_version": "1.0.0", "title": "Title", "sections": [{"id": "section-1"}]}
+
+    async def mock_retrieve_instrument(_instrument_id, _settings):
+        return instrument
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.retrieval.retrieve_instrument",
+        mock_retrieve_instrument,
+    )
+
+    response = client.get(f"/instrument/{uuid4()}?version=1.0.0&fields=title,validator_version")
+    assert response.status_code == 200
+    assert response.json() == {"title": "Title", "validator_version": "1.0.0"}
+
+
+def test_get_instrument_by_uuid_invalid_fields() -> None:
+    """Should return 400 when fields names no fields."""
+    response = client.get(f"/instrument/{uuid4()}?version=1.0.0&fields=,")
+    assert response.status_code == 400
+
+
+def test_get_instrument_metadata_miss_then_hit(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should fetch metadata on a cache miss, then answer from the metadata index."""
+    instrument_id = uuid4()
+    metadata = InstrumentMetadata(
+        validator_version="1.0.0",
+        size_bytes=123,
+        content_hash="sha256:abc",
+        retrieved_at=0.0,
+        fields={"title": "Title"},
+    )
+    cached = {}
+
+    async def mock_retrieve_instrument_metadata(_instrument_id, _settings):
+        cached["metadata"] = metadata
+        return metadata
+
+    async def mock_cached_metadata(_instrument_id, _settings):
+        return cached.get("metadata")
+
+    monkeypatch.setattr(instrument_router.retrieval, "cached_metadata", mock_cached_metadata)
+    monkeypatch.setattr(instrument_router.retrieval, "retrieve_instrument_metadata", mock_retrieve_instrument_metadata)
+
+    miss = client.get(f"/instrument/{instrument_id}/metadata")
+    hit = client.get(f"/instrument/{instrument_id}/metadata")
+
+    assert miss.status_code == hit.status_code == 200
+    assert miss.json()["cache_status"] == "miss"
+    assert hit.json() == {
+        "instrument_id": str(instrument_id),
+        "validator_version": "1.0.0",
+        "size_bytes": 123,
+        "content_hash": "sha256:abc",
+        "retrieved_at": 0.0,
+        "fields": {"title": "Title"},
+        "cache_status": "hit",
+    }
+
+
+def test_get_instrument_metadata_not_found(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should pass on a 404 from CIR."""
+
+    async def mock_retrieve_instrument_metadata(_instrument_id, _settings):
+        raise HTTPException(status_code=404, detail={"status": "error", "message": "Not found"})
+
+    monkeypatch.setattr(instrument_router.retrieval, "retrieve_instrument_metadata", mock_retrieve_instrument_metadata)
+
+    response = client.get(f"/instrument/{uuid4()}/metadata")
+    assert response.status_code == 404
+
+
+def test_conversion_job(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should accept a conversion job, and report its status with the URL of the converted instrument."""
+    instrument_id = uuid4()
+    converted = []
+
+    async def mock_retrieve_instrument(_instrument_id, _settings):
+        return {"validator_version": "1.0.0"}
+
+    async def mock_convert_instrument(_instrument, target_version, _settings, *, instrument_id):
+        converted.append((instrument_id, target_version))
+        return {"validator_version": target_version}
+
+    monkeypatch.setattr(instrument_router.retrieval, "retrieve_instrument", mock_retrieve_instrument)
+    monkeypatch.setattr(instrument_router.conversion, "convert_instrument", mock_convert_instrument)
+
+    with TestClient(app) as job_client:
+        submitted = job_client.post(f"/instrument/{instrument_id}/jobs?version=2.0.0")
+        assert submitted.status_code == 202
+        assert submitted.json()["status"] in {"queued", "succeeded"}
+        assert submitted.headers["Location"] == submitted.json()["status_url"]
+
+        status = {"status": "queued"}
+        for _ in range(100):
+            status = job_client.get(submitted.headers["Location"]).json()
+            if status["status"] == "succeeded":
+                break
+
+    assert status["result_url"] == f"/instrument/{instrument_id}?version=2.0.0"
+    assert converted == [(instrument_id, "2.0.0")]
+
+
+@pytest.mark.parametrize(
+    "path, status_code",
+    [
+        ("/instrument/{instrument_id}/jobs?version=not-a-version", 400),
+        ("/instrument/{instrument_id}/jobs", 422),
+    ],
+)
+def test_conversion_job_rejected(path: str, status_code: int) -> None:
+    """Should reject a conversion job without a valid version."""
+    response = client.post(path.format(instrument_id=uuid4()))
+
+    assert response.status_code == status_code
+
+
+def test_conversion_job_for_missing_instrument_rejected() -> None:
+    """Should not start a conversion job for an instrument CIR recently did not find."""
+    instrument_id = uuid4()
+    get_instrument_cache(get_settings()).store_not_found(str(instrument_id))
+
+    response = client.post(f"/instrument/{instrument_id}/jobs?version=2.0.0")
+
+    assert response.status_code == 404
+
+
+def test_conversion_job_queue_full(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return 503 with Retry-After when the conversion job queue is full."""
+
+    def reject(_instrument_id, _version):
+        raise ConcurrencyLimitExceededError(JOB_LIMITER, "queue_full", 3)
+
+    monkeypatch.setattr(instrument_router.get_conversion_jobs(get_settings()), "submit", reject)
+
+    response = client.post(f"/instrument/{uuid4()}/jobs?version=2.0.0")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_conversion_job_not_found() -> None:
+    """Should return 404 for an unknown conversion job."""
+    response = client.get(f"/instrument/jobs/{uuid4().hex}")
+
+    assert response.status_code == 404
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_404_JOB_NOT_FOUND
+
+
+@pytest.mark.parametrize(
+    "method, path",
+    [("post", "/instrument/{instrument_id}/jobs?version=2.0.0"), ("get", "/instrument/jobs/{instrument_id}")],
+)
+def test_conversion_jobs_disabled(method: str, path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should return 404 from the conversion job endpoints when conversion jobs are disabled."""
+    monkeypatch.setenv("CONVERSION_JOBS_ENABLED", "false")
+
+    response = client.request(method, path.format(instrument_id=uuid4()))
+
+    assert response.status_code == 404
+    assert response.json()["detail"]["message"] == exception_messages.EXCEPTION_404_JOBS_DISABLED
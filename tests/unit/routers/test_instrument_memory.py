@@ -0,0 +1,58 @@
+"""Peak memory test for a full /instrument request on a large instrument."""
+
+import json
+import tracemalloc
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from eq_cir_proxy_service.main import app
+
+# Peak traced memory allowed for one request, as a multiple of the size of the serialised instrument. This
+# covers the parsed source instrument, the converted instrument (as both bytes and a dict), the serialised
+# response and the test client's copy of the response body, with the source and converted bodies held in the cache.
+MAX_PEAK_MEMORY_RATIO = 8
+
+
+def build_instrument(validator_version: str) -> bytes:
+    """Builds a serialised instrument of roughly 1.8 MB."""
+    sections = [
+        {
+            "id": f"section-{i}",
+            "title": "t" * 200,
+            "questions": [{"id": f"question-{i}-{j}", "text": "q" * 100} for j in range(5)],
+        }
+        for i in range(2000)
+    ]
+    return json.dumps({"validator_version": validator_version, "sections": sections}).encode()
+
+
+@pytest.mark.asyncio
+async def test_peak_memory_per_request(monkeypatch, mock_api_client):
+    """A request for a large instrument that needs converting stays within the peak memory budget."""
+    source_instrument = build_instrument("1.0.0")
+    converted_instrument = build_instrument("2.0.0")
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(200, content=source_instrument)),
+    )
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(200, content=converted_instrument)),
+    )
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # Warm up import-time and first-request allocations so they are not attributed to the request.
+        await client.get(f"/instrument/{uuid4()}?version=2.0.0")
+
+        tracemalloc.start()
+        try:
+            response = await client.get(f"/instrument/{uuid4()}?version=2.0.0")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert response.status_code == 200
+    assert response.json()["validator_version"] == "2.0.0"
+    assert peak < MAX_PEAK_MEMORY_RATIO * len(source_instrument)
@@ -1,60 +1,26 @@
 """Unit tests for the instrument conversion service."""
 
-import os
-from dataclasses import dataclass
+import json
+import time
+from dataclasses import dataclass, replace
+from uuid import uuid4
 
+import httpx
 import pytest
 from fastapi import HTTPException, status
-from httpx import RequestError
+from httpx import RequestError, Timeout
 
 from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
 from eq_cir_proxy_service.services.instrument.conversion import (
     convert_instrument,
     safe_parse,
 )
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.deadline import DeadlineExceededError, request_deadline
 
-FAKE_API_URL = "http://fake-service"
 FAKE_CONVERT_ENDPOINT = "/convert"
-
-
-@dataclass
-class DummyResponse:
-    """Dummy response for testing."""
-
-    json_data: dict
-
-    def raise_for_status(self):
-        """Simulate raise_for_status (no-op for testing)."""
-
-    def json(self):
-        """Return the JSON data."""
-        return self.json_data
-
-
-@dataclass
-class DummyAsyncClient:
-    """Dummy async client for testing."""
-
-    expected_instrument: dict
-    expected_response: dict
-    target_version: str
-
-    async def __aenter__(self):
-        """Simulate async context manager enter."""
-        return self
-
-    async def __aexit__(self, *_):
-        """Simulate async context manager exit."""
-
-    async def post(self, url, **kwargs):
-        """Simulate post method to check parameters and return dummy response."""
-        assert url == "/convert"
-        assert kwargs["json"] == {"instrument": self.expected_instrument}
-        assert kwargs["params"] == {
-            "current_version": self.expected_instrument["validator_version"],
-            "target_version": self.target_version,
-        }
-        return DummyResponse(self.expected_response)
+INSTRUMENT_ID = uuid4()
 
 
 @dataclass
@@ -62,6 +28,7 @@ class DummyIAPClient:
     """Dummy IAP client for testing."""
 
     error = "failure"
+    timeout = Timeout(5.0)
 
     async def __aenter__(self):
         """Simulate async context manager enter."""
@@ -70,8 +37,8 @@ class DummyIAPClient:
     async def __aexit__(self, exc_type, exc, tb):
         """Simulate async context manager exit."""
 
-    async def post(self, *_args, **_kwargs):
-        """Simulate a post that raises RequestError."""
+    def stream(self, *_args, **_kwargs):
+        """Simulate a streamed request that raises RequestError."""
         raise RequestError(self.error, request=None)
 
     def __call__(self, *_args, **_kwargs):
@@ -80,13 +47,13 @@ class DummyIAPClient:
 
 
 @pytest.mark.asyncio
-async def test_convert_instrument_missing_version(caplog):
+async def test_convert_instrument_missing_version(caplog, settings):
     """Should raise 404 if validator_version is missing."""
     caplog.set_level("INFO")
     instrument = {"id": "123", "sections": []}  # no validator_version
 
     with pytest.raises(HTTPException) as excinfo:
-        await convert_instrument(instrument, "1.0.0")
+        await convert_instrument(instrument, "1.0.0", settings, instrument_id=INSTRUMENT_ID)
 
     assert excinfo.value.status_code == status.HTTP_404_NOT_FOUND
     assert excinfo.value.detail["message"] == exception_messages.EXCEPTION_400_INVALID_INSTRUMENT
@@ -96,107 +63,174 @@ async def test_convert_instrument_missing_version(caplog):
 
 
 @pytest.mark.asyncio
-async def test_convert_instrument_same_version(caplog):
+async def test_convert_instrument_same_version(caplog, settings):
     """Should return the same instrument if versions match."""
-    caplog.set_level("INFO")
+    caplog.set_level("DEBUG")
     instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
-    result = await convert_instrument(instrument, "1.0.0")
+    result = await convert_instrument(instrument, "1.0.0", settings, instrument_id=INSTRUMENT_ID)
     assert result == instrument
     assert any(
-        record.levelname == "INFO" and "Instrument version matches the target" in record.message
+        record.levelname == "DEBUG" and "Instrument version matches the target" in record.message
         for record in caplog.records
     )
 
 
 @pytest.mark.asyncio
-async def test_convert_instrument_higher_version():
+async def test_convert_instrument_higher_version(settings):
     """Should raise 400 if instrument version > target version."""
     instrument = {"id": "123", "validator_version": "2.0.0", "sections": []}
 
     with pytest.raises(HTTPException) as excinfo:
-        await convert_instrument(instrument, "1.0.0")
+        await convert_instrument(instrument, "1.0.0", settings, instrument_id=INSTRUMENT_ID)
 
     assert excinfo.value.status_code == status.HTTP_400_BAD_REQUEST
     assert excinfo.value.detail["message"] == exception_messages.EXCEPTION_400_INVALID_CONVERSION
 
 
 @pytest.mark.asyncio
-async def test_convert_instrument_lower_version_success(monkeypatch):
+async def test_convert_instrument_lower_version_success(monkeypatch, mock_api_client, settings):
     """Should call Converter Service and return converted instrument if instrument version < target version."""
     instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
     target_version = "2.0.0"
     fake_response_data = {"id": "123", "validator_version": "2.0.0"}
 
-    def dummy_get_api_client(*_args, **_kwargs):
-        return DummyAsyncClient(
-            expected_instrument=instrument,
-            expected_response=fake_response_data,
-            target_version=target_version,
-        )
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.method == "POST"
+        assert request.url.path == FAKE_CONVERT_ENDPOINT
+        assert request.headers["Content-Type"] == "application/json"
+        assert json.loads(request.content) == {"instrument": instrument}
+        assert dict(request.url.params) == {"current_version": "1.0.0", "target_version": target_version}
+        return httpx.Response(200, json=fake_response_data)
 
     monkeypatch.setattr(
         "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
-        dummy_get_api_client,
+        mock_api_client(handler),
     )
-    monkeypatch.setenv("CONVERTER_SERVICE_API_BASE_URL", FAKE_API_URL)
-    monkeypatch.setenv("CONVERTER_SERVICE_CONVERT_CI_ENDPOINT", FAKE_CONVERT_ENDPOINT)
+    settings = replace(settings, converter_service=replace(settings.converter_service, endpoint=FAKE_CONVERT_ENDPOINT))
 
-    result = await convert_instrument(instrument, target_version)
+    result = await convert_instrument(instrument, target_version, settings, instrument_id=INSTRUMENT_ID)
 
     assert result == fake_response_data
 
 
 @pytest.mark.asyncio
-async def test_convert_instrument_request_error_with_iap(monkeypatch):
-    """Should raise 500 if Converter Service request fails (IAP client version)."""
+async def test_convert_instrument_cached(monkeypatch, mock_api_client, settings):
+    """Should serve a repeated conversion from the cache, without caching failed conversions."""
+    instrument = {"id": "123", "validator_version": "1.0.0"}
+    responses = [
+        httpx.Response(502, json={"status": "error"}),
+        httpx.Response(200, json={"validator_version": "2.0.0"}),
+    ]
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        mock_api_client(handler),
+    )
+
+    with pytest.raises(HTTPException) as excinfo:
+        await convert_instrument(dict(instrument), "2.0.0", settings, instrument_id=INSTRUMENT_ID)
+    results = [
+        await convert_instrument(dict(instrument), "2.0.0", settings, instrument_id=INSTRUMENT_ID) for _ in range(2)
+    ]
+
+    assert excinfo.value.status_code == 500
+    assert results == [{"validator_version": "2.0.0"}, {"validator_version": "2.0.0"}]
+    assert len(requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_convert_instrument_from_cached_intermediate(monkeypatch, mock_api_client, settings):
+    """Should start a conversion from the highest cached version below the target, and count reuse."""
+    metrics.reset()
+    instrument = {"id": "123", "validator_version": "1.0.0"}
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        source = json.loads(request.content)["instrument"]
+        return httpx.Response(200, json=source | {"validator_version": request.url.params["target_version"]})
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        mock_api_client(handler),
+    )
+    instrument_cache = get_instrument_cache(settings)
+    conversion_keys = instrument_cache.conversion_keys
+
+    async def conversion_keys_with_evicted_entry(instrument_id, prefix):
+        # An expired entry can still be listed; it should be skipped in favour of the next highest version.
+        return await conversion_keys(instrument_id, prefix) | {f"{prefix}2.5.0"}
+
+    monkeypatch.setattr(instrument_cache, "conversion_keys", conversion_keys_with_evicted_entry)
+
+    for target_version in ("4.0.0", "2.0.0", "3.0.0", "3.0.0"):
+        result = await convert_instrument(dict(instrument), target_version, settings, instrument_id=INSTRUMENT_ID)
+        assert result == {"id": "123", "validator_version": target_version}
+
+    assert [dict(request.url.params) for request in requests] == [
+        {"current_version": "1.0.0", "target_version": "4.0.0"},
+        {"current_version": "1.0.0", "target_version": "2.0.0"},
+        {"current_version": "2.0.0", "target_version": "3.0.0"},
+    ]
+    assert json.loads(requests[2].content) == {"instrument": {"id": "123", "validator_version": "2.0.0"}}
+    counters = metrics.snapshot()["counters"]
+    assert counters['conversion_reuse_total{result="miss"}'] == 2
+    assert counters['conversion_reuse_total{result="intermediate"}'] == 1
+    assert counters['conversion_reuse_total{result="exact"}'] == 1
+
+
+@pytest.mark.asyncio
+async def test_convert_instrument_response_too_large(monkeypatch, mock_api_client, settings):
+    """Should raise 500 if the converted instrument exceeds MAX_INSTRUMENT_SIZE_BYTES."""
     instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
-    target_version = "2.0.0"
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"validator_version": "2.0.0", "sections": ["x" * 100]})
 
     monkeypatch.setattr(
         "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
-        DummyIAPClient(),
+        mock_api_client(handler),
     )
-    monkeypatch.setenv("CONVERTER_SERVICE_API_BASE_URL", FAKE_API_URL)
-    monkeypatch.setenv("CONVERTER_SERVICE_CONVERT_CI_ENDPOINT", FAKE_CONVERT_ENDPOINT)
-    monkeypatch.setenv("CONVERTER_SERVICE_IAP_CLIENT_ID", "dummy-client-id")
+    settings = replace(settings, max_instrument_size_bytes=64)
 
     with pytest.raises(HTTPException) as excinfo:
-        await convert_instrument(instrument, target_version)
+        await convert_instrument(instrument, "2.0.0", settings, instrument_id=INSTRUMENT_ID)
 
     assert excinfo.value.status_code == 500
-    assert excinfo.value.detail["message"] == "Error connecting to Converter Service."
+    assert excinfo.value.detail["message"] == exception_messages.EXCEPTION_500_INSTRUMENT_TOO_LARGE
 
 
 @pytest.mark.asyncio
-async def test_retrieve_instrument_missing_converter_endpoint(mocker):
-    """Test convert_instrument raises HTTPException if CONVERTER_SERVICE_CONVERT_CI_ENDPOINT exists but has no value."""
+async def test_convert_instrument_request_error_with_iap(monkeypatch, settings):
+    """Should raise 500 if Converter Service request fails (IAP client version)."""
     instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
     target_version = "2.0.0"
-    # Patch environment to include CONVERTER_SERVICE_API_BASE_URL but not CONVERTER_SERVICE_CONVERT_CI_ENDPOINT
-    mocker.patch.dict(
-        os.environ,
-        {"CONVERTER_SERVICE_API_BASE_URL": "http://fake-url", "CONVERTER_SERVICE_CONVERT_CI_ENDPOINT": ""},
-        clear=True,
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        DummyIAPClient(),
     )
-    with pytest.raises(HTTPException) as exc_info:
-        await convert_instrument(instrument, target_version)
-    exc = exc_info.value
-    assert exc.status_code == 500
-    assert exc.detail["message"] == "CONVERTER_SERVICE_CONVERT_CI_ENDPOINT configuration is missing."
+
+    with pytest.raises(HTTPException) as excinfo:
+        await convert_instrument(instrument, target_version, settings, instrument_id=INSTRUMENT_ID)
+
+    assert excinfo.value.status_code == 500
+    assert excinfo.value.detail["message"] == "Error connecting to Converter Service."
 
 
 def test_safe_parse_valid(monkeypatch):
     """Tests the safe_parse function with a valid version."""
 
-    class DummyVersion:  # pylint: disable=too-few-public-methods
-        """Dummy version parser for testing."""
+    def dummy_parse_version(s: str):
+        """Parses a version string."""
+        return f"parsed-{s}"
 
-        @staticmethod
-        def parse(s: str):
-            """Parses a version string."""
-            return f"parsed-{s}"
-
-    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.conversion.Version", DummyVersion)
+    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.conversion.parse_version", dummy_parse_version)
 
     result = safe_parse("current", "1.2.3")
     assert result == "parsed-1.2.3"
@@ -212,18 +246,14 @@ def test_safe_parse_valid(monkeypatch):
 def test_safe_parse_invalid_version(version_type, version_value, monkeypatch):
     """Tests the safe_parse function with an invalid version."""
 
-    class DummyVersion:  # pylint: disable=too-few-public-methods
-        """Dummy version parser for testing."""
-
-        @staticmethod
-        def parse(s: str):
-            """Parses a version string."""
-            error_message = "invalid version"
-            if s == "valid":
-                return "parsed-valid"
-            raise ValueError(error_message)
+    def dummy_parse_version(s: str):
+        """Parses a version string."""
+        error_message = "invalid version"
+        if s == "valid":
+            return "parsed-valid"
+        raise ValueError(error_message)
 
-    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.conversion.Version", DummyVersion)
+    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.conversion.parse_version", dummy_parse_version)
 
     # valid target
     assert safe_parse(version_type, "valid") == "parsed-valid"
@@ -236,3 +266,75 @@ def test_safe_parse_invalid_version(version_type, version_value, monkeypatch):
     assert exc.status_code == 400
     assert exc.detail["status"] == "error"
     assert exc.detail["message"] == f"Invalid {version_type} version: {version_value}"
+
+
+@pytest.mark.asyncio
+async def test_convert_instrument_deadline_passed(monkeypatch, settings):
+    """Should not call the Converter Service once the request deadline has passed."""
+    instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
+
+    def fail_get_api_client(*_args):
+        pytest.fail("The Converter Service should not be called")
+
+    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.conversion.get_api_client", fail_get_api_client)
+
+    with request_deadline(0), pytest.raises(DeadlineExceededError) as excinfo:
+        await convert_instrument(instrument, "2.0.0", settings, instrument_id=INSTRUMENT_ID)
+
+    assert excinfo.value.stage == "conversion"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("deadline_seconds, expected_error", [(0.05, DeadlineExceededError), (None, HTTPException)])
+async def test_convert_instrument_timeout(deadline_seconds, expected_error, monkeypatch, mock_api_client, settings):
+    """Should raise DeadlineExceededError on a timeout past the deadline, and a 500 on any other timeout."""
+    instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if deadline_seconds:
+            time.sleep(deadline_seconds)
+        error_message = "timed out"
+        raise httpx.ReadTimeout(error_message, request=request)
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        mock_api_client(handler),
+    )
+
+    with request_deadline(deadline_seconds or 30), pytest.raises(expected_error):
+        await convert_instrument(instrument, "2.0.0", settings, instrument_id=INSTRUMENT_ID)
+
+
+@pytest.mark.asyncio
+async def test_convert_instrument_converter_error(monkeypatch, mock_api_client, settings):
+    """Should raise 500 rather than return the body if the Converter Service does not respond with a 200."""
+    instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(500, json={"detail": "converter exploded"})),
+    )
+    settings = replace(settings, validate_upstream_instruments=False)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await convert_instrument(instrument, "2.0.0", settings, instrument_id=INSTRUMENT_ID)
+
+    assert excinfo.value.status_code == 500
+    assert excinfo.value.detail["message"] == exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING
+
+
+@pytest.mark.asyncio
+async def test_convert_instrument_invalid_response(monkeypatch, mock_api_client, settings):
+    """Should raise 500 if the Converter Service returns something other than an instrument."""
+    instrument = {"id": "123", "validator_version": "1.0.0", "sections": []}
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(200, json=["not", "an", "instrument"])),
+    )
+
+    with pytest.raises(HTTPException) as excinfo:
+        await convert_instrument(instrument, "2.0.0", settings, instrument_id=INSTRUMENT_ID)
+
+    assert excinfo.value.status_code == 500
+    assert excinfo.value.detail["message"] == exception_messages.EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT
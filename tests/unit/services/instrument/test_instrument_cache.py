@@ -0,0 +1,127 @@
+"""Unit tests for the instrument cache and metadata index."""
+
+import hashlib
+import json
+from dataclasses import replace
+
+import pytest
+
+from eq_cir_proxy_service.services.instrument.cache import (
+    InstrumentCache,
+    InstrumentMetadata,
+    get_instrument_cache,
+)
+
+INSTRUMENT = {"validator_version": "1.0.0", "survey_id": "3456", "title": "Title", "sections": []}
+BODY = json.dumps(INSTRUMENT).encode()
+
+
+def test_metadata_from_instrument():
+    """Should record the version, size, hash and header fields of the instrument."""
+    metadata = InstrumentMetadata.from_instrument(INSTRUMENT, BODY)
+
+    assert metadata.validator_version == "1.0.0"
+    assert metadata.size_bytes == len(BODY)
+    assert metadata.content_hash == f"sha256:{hashlib.sha256(BODY).hexdigest()}"
+    assert metadata.fields == {"survey_id": "3456", "title": "Title"}
+    assert metadata.to_dict()["fields"] == metadata.fields
+
+
+def test_metadata_without_version():
+    """Should record a missing validator_version as None."""
+    assert InstrumentMetadata.from_instrument({}, b"{}").validator_version is None
+
+
+def test_store_caches_body_and_metadata(settings):
+    """Should cache the body without copying it and index its metadata."""
+    instrument_cache = InstrumentCache(settings)
+    body = bytearray(BODY)
+
+    metadata = instrument_cache.store("id", INSTRUMENT, body)
+
+    assert instrument_cache.bodies.get("id") is body
+    assert instrument_cache.metadata.get("id") is metadata
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression_enabled", [True, False])
+async def test_identical_bodies_stored_once(settings, compression_enabled):
+    """Should store each distinct body once across keys, compressed unless compression is disabled."""
+    instrument_cache = InstrumentCache(replace(settings, cache_compression_enabled=compression_enabled))
+    instrument = INSTRUMENT | {"sections": [{"id": f"section-{index}", "title": "Title"} for index in range(500)]}
+    body = json.dumps(instrument).encode()
+    converted = body.replace(b"1.0.0", b"2.0.0")
+
+    for key in ("id", "copy"):
+        instrument_cache.store(key, instrument, bytearray(body))
+    instrument_cache.store_conversion("id", "hash:2.0.0", converted)
+    instrument_cache.store_conversion("id", "hash:2.1.0", converted)
+
+    assert (instrument_cache.bodies.uncompressed_size, instrument_cache.conversions.uncompressed_size) == (
+        len(body),
+        len(converted),
+    )
+    assert (instrument_cache.bodies.size < len(body) // 4) is compression_enabled
+    assert await instrument_cache.get_body("copy") == body
+    assert await instrument_cache.get_conversion("id", "hash:2.1.0") == converted
+
+
+def test_get_instrument_cache_is_shared(settings):
+    """Should return the same cache for the same settings."""
+    assert get_instrument_cache(settings) is get_instrument_cache(settings)
+
+
+def test_no_disk_cache_by_default(settings):
+    """Should only cache in memory unless a disk cache directory is configured."""
+    assert InstrumentCache(settings).disk is None
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_survives_restart(settings, tmp_path):
+    """Should write bodies to disk in the background, and serve them from disk to a new cache, promoting them."""
+    settings = replace(settings, disk_cache_dir=str(tmp_path))
+    instrument_cache = InstrumentCache(settings)
+    instrument_cache.store("id", INSTRUMENT, BODY)
+    instrument_cache.store_conversion("id", "hash:2.0.0", b"converted")
+    await instrument_cache.aclose()
+
+    restarted = InstrumentCache(settings)
+
+    assert restarted.bodies.get("id") is None
+    assert await restarted.get_body("id") == BODY
+    assert restarted.bodies.get("id") == BODY
+    assert await restarted.get_conversion("id", "hash:2.0.0") == b"converted"
+    assert await restarted.conversion_keys("id", "hash:") == {"hash:2.0.0"}
+    assert await restarted.get_body("other") is None
+
+
+@pytest.mark.asyncio
+async def test_disk_write_failure(settings, tmp_path, mocker):
+    """Should keep serving from memory when a disk write fails."""
+    instrument_cache = InstrumentCache(replace(settings, disk_cache_dir=str(tmp_path)))
+    disk_set = mocker.patch.object(instrument_cache.disk, "set", side_effect=OSError("disk full"))
+
+    instrument_cache.store("id", INSTRUMENT, BODY)
+    await instrument_cache.aclose()
+
+    disk_set.assert_called_once_with("instrument/id", BODY)
+    assert await instrument_cache.get_body("id") == BODY
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reaches_disk(settings, tmp_path):
+    """Should evict from disk too, after any pending write of the evicted entry has landed."""
+    settings = replace(settings, disk_cache_dir=str(tmp_path))
+    instrument_cache = InstrumentCache(settings)
+    for key in ("id", "other"):
+        instrument_cache.store(key, INSTRUMENT, BODY)
+        instrument_cache.store_conversion(key, "hash:2.0.0", b"converted")
+
+    assert await instrument_cache.invalidate_conversions("id") == 2
+    assert await instrument_cache.invalidate("id") == 3
+    restarted = InstrumentCache(settings)
+    assert await restarted.get_body("id") is None
+    assert await restarted.get_body("other") == BODY
+
+    assert await restarted.clear() == 3
+    assert await InstrumentCache(settings).get_conversion("other", "hash:2.0.0") is None
@@ -0,0 +1,211 @@
+"""Tests for background conversion jobs."""
+
+import asyncio
+from dataclasses import replace
+from uuid import uuid4
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from structlog.contextvars import bound_contextvars, get_contextvars
+
+from eq_cir_proxy_service.exceptions import exception_messages
+from eq_cir_proxy_service.services.instrument.jobs import ConversionJob, ConversionJobs
+from eq_cir_proxy_service.utils import deadline, metrics
+from eq_cir_proxy_service.utils.concurrency import ConcurrencyLimitExceededError
+from eq_cir_proxy_service.utils.deadline import DeadlineExceededError
+
+
+@pytest.fixture(name="conversions")
+def fixture_conversions(monkeypatch):
+    """Replace retrieval and conversion, recording the conversions and the deadline and context each ran under.
+
+    Conversions wait for the ``release`` event, and raise the error appended to ``errors`` on the returned object,
+    if any.
+    """
+    calls = []
+    state = {"release": asyncio.Event(), "errors": [], "calls": calls, "contexts": []}
+
+    async def retrieve_instrument(instrument_id, _settings):
+        return {"id": str(instrument_id), "validator_version": "1.0.0"}
+
+    async def convert_instrument(instrument, target_version, _settings, *, instrument_id):
+        calls.append((instrument_id, target_version, deadline.remaining()))
+        state["contexts"].append(get_contextvars())
+        await state["release"].wait()
+        if state["errors"]:
+            raise state["errors"][0]
+        return {**instrument, "validator_version": target_version}
+
+    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.retrieval.retrieve_instrument", retrieve_instrument)
+    monkeypatch.setattr("eq_cir_proxy_service.services.instrument.conversion.convert_instrument", convert_instrument)
+    return state
+
+
+async def wait_until_finished(*jobs: ConversionJob) -> None:
+    """Lets the workers run until the jobs have finished."""
+    for _ in range(100):
+        if all(job.finished for job in jobs):
+            return
+        await asyncio.sleep(0)
+    raise AssertionError
+
+
+@pytest.mark.asyncio
+async def test_job_runs_once_per_instrument_and_version(settings, conversions):
+    """Test that a job converts the instrument under the job deadline, and duplicate submissions share it."""
+    metrics.reset()
+    jobs = ConversionJobs(settings)
+    instrument_id = uuid4()
+
+    job = jobs.submit(instrument_id, "2.0.0")
+    assert job.to_dict()["status"] == "queued"
+    await asyncio.sleep(0)
+    assert job.status == "running"
+    assert jobs.submit(instrument_id, "2.0.0") is job
+    assert metrics.snapshot()["gauges"]["conversion_jobs_running"] == 1
+
+    conversions["release"].set()
+    await wait_until_finished(job)
+
+    ((converted_id, version, time_left),) = conversions["calls"]
+    assert (converted_id, version) == (instrument_id, "2.0.0")
+    assert settings.conversion_job_timeout_seconds - 1 < time_left <= settings.conversion_job_timeout_seconds
+    assert jobs.get(job.job_id) is job
+    assert job.to_dict() == {
+        "job_id": job.job_id,
+        "instrument_id": str(instrument_id),
+        "version": "2.0.0",
+        "status": "succeeded",
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "result_url": f"/instrument/{instrument_id}?version=2.0.0",
+    }
+    assert metrics.snapshot()["counters"]['conversion_jobs_total{status="succeeded"}'] == 1
+
+    assert jobs.submit(instrument_id, "2.0.0") is not job
+    await jobs.aclose()
+
+
+def test_result_url_encodes_version():
+    """Test that a version with build metadata survives the round trip through the result URL's query string."""
+    job = ConversionJob(job_id="job", instrument_id=uuid4(), version="1.0.0+build.1", status="succeeded")
+
+    assert job.to_dict()["result_url"] == f"/instrument/{job.instrument_id}?version=1.0.0%2Bbuild.1"
+
+
+@pytest.mark.asyncio
+async def test_job_waits_for_slow_converter_until_job_deadline(monkeypatch, settings, mock_api_client, slow_api_client):
+    """Test that a job's upstream calls wait as long as the job deadline allows, not for the client's timeout."""
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(200, json={"validator_version": "1.0.0"})),
+    )
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.conversion.get_api_client",
+        await slow_api_client(b'{"validator_version": "2.0.0"}', delay=0.3),
+    )
+    jobs = ConversionJobs(settings)
+
+    job = jobs.submit(uuid4(), "2.0.0")
+    async with asyncio.timeout(5):
+        while not job.finished:
+            await asyncio.sleep(0.01)
+
+    assert job.status == "succeeded", job.error
+    await jobs.aclose()
+
+
+@pytest.mark.parametrize(
+    "error, status_code, message",
+    [
+        (
+            HTTPException(404, {"status": "error", "message": exception_messages.EXCEPTION_404_INSTRUMENT_NOT_FOUND}),
+            404,
+            exception_messages.EXCEPTION_404_INSTRUMENT_NOT_FOUND,
+        ),
+        (
+            ConcurrencyLimitExceededError("converter_service", "queue_timeout", 1),
+            503,
+            exception_messages.EXCEPTION_503_SERVICE_OVERLOADED,
+        ),
+        (DeadlineExceededError("conversion"), 504, exception_messages.EXCEPTION_504_DEADLINE_EXCEEDED),
+        (RuntimeError("boom"), 500, exception_messages.EXCEPTION_500_INSTRUMENT_PROCESSING),
+    ],
+)
+@pytest.mark.asyncio
+async def test_failed_job(settings, conversions, error, status_code, message):
+    """Test that a failed job records the error a request for the instrument would have received."""
+    jobs = ConversionJobs(settings)
+    conversions["release"].set()
+    conversions["errors"].append(error)
+
+    job = jobs.submit(uuid4(), "2.0.0")
+    await wait_until_finished(job)
+
+    assert job.status == "failed"
+    assert "result_url" not in job.to_dict()
+    assert job.to_dict()["error"] == {"status_code": status_code, "detail": {"status": "error", "message": message}}
+    await jobs.aclose()
+
+
+@pytest.mark.asyncio
+async def test_job_queue_bounded(settings, conversions):
+    """Test that jobs beyond the workers and the queue are rejected until the queue drains."""
+    jobs = ConversionJobs(replace(settings, conversion_job_workers=1, conversion_job_max_queued=1))
+    running = jobs.submit(uuid4(), "2.0.0")
+    await asyncio.sleep(0)
+    queued = jobs.submit(uuid4(), "2.0.0")
+
+    with pytest.raises(ConcurrencyLimitExceededError) as exc_info:
+        jobs.submit(uuid4(), "2.0.0")
+    assert exc_info.value.retry_after == settings.retry_after_seconds
+    assert jobs.submit(queued.instrument_id, "2.0.0") is queued
+
+    conversions["release"].set()
+    await wait_until_finished(running, queued)
+    await jobs.aclose()
+
+
+@pytest.mark.asyncio
+async def test_only_recent_finished_jobs_kept(settings, conversions):
+    """Test that the oldest finished jobs are forgotten beyond the maximum kept."""
+    jobs = ConversionJobs(replace(settings, conversion_job_max_kept=1))
+    conversions["release"].set()
+
+    first = jobs.submit(uuid4(), "2.0.0")
+    await wait_until_finished(first)
+    second = jobs.submit(uuid4(), "2.0.0")
+    await wait_until_finished(second)
+
+    assert jobs.get(first.job_id) is None
+    assert jobs.get(second.job_id) is second
+    await jobs.aclose()
+
+
+@pytest.mark.asyncio
+async def test_running_job_abandoned_on_close(settings, conversions):
+    """Test that closing the pool fails the jobs it was running."""
+    jobs = ConversionJobs(settings)
+    job = jobs.submit(uuid4(), "2.0.0")
+    await asyncio.sleep(0)
+
+    await jobs.aclose()
+
+    assert conversions["calls"]
+    assert job.status == "failed"
+    assert job.finished_at is not None
+
+
+@pytest.mark.asyncio
+async def test_job_runs_outside_submitting_request_context(settings, conversions):
+    """Test that a job logs under its own ID, not the request ID of the request that started the workers."""
+    jobs = ConversionJobs(settings)
+    conversions["release"].set()
+
+    with bound_contextvars(request_id="submitting-request"):
+        job = jobs.submit(uuid4(), "2.0.0")
+    await wait_until_finished(job)
+
+    assert conversions["contexts"] == [{"job_id": job.job_id}]
+    await jobs.aclose()
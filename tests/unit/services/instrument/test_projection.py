@@ -0,0 +1,18 @@
+"""Unit tests for projecting instruments to the requested fields."""
+
+from eq_cir_proxy_service.services.instrument.projection import project_fields
+
+INSTRUMENT = {"validator_version": "1.0.0", "title": "Title", "sections": [{"id": "section-1"}]}
+
+
+def test_project_fields_all():
+    """Should return the instrument itself when no fields are requested."""
+    assert project_fields(INSTRUMENT, None) is INSTRUMENT
+
+
+def test_project_fields_selected():
+    """Should return only the requested fields, in the requested order, skipping unknown ones."""
+    projected = project_fields(INSTRUMENT, ["title", "missing", "validator_version"])
+
+    assert projected == {"title": "Title", "validator_version": "1.0.0"}
+    assert list(projected) == ["title", "validator_version"]
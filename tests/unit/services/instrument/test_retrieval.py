@@ -1,59 +1,47 @@
 """Unit tests for the instrument retrieval service."""
 
-import os
-from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
+from dataclasses import replace
 from uuid import uuid4
 
 import httpx
 import pytest
 from fastapi import HTTPException
 
+from eq_cir_proxy_service.exceptions.exception_messages import (
+    EXCEPTION_500_INSTRUMENT_TOO_LARGE,
+    EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT,
+)
 from eq_cir_proxy_service.services.instrument import retrieval
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
 from eq_cir_proxy_service.services.instrument.retrieval import (
     retrieve_instrument,
 )
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.deadline import DeadlineExceededError, request_deadline
 
 
 @pytest.mark.asyncio
-async def test_retrieve_instrument_success(mocker):
+async def test_retrieve_instrument_success(mocker, mock_api_client, settings):
     """Test the retrieve_instrument function with a successful response."""
     instrument_id = uuid4()
+    settings = replace(settings, cir=replace(settings.cir, endpoint="fake-endpoint"))
 
-    # Set up mocked environment variables
-    base_url = "http://fake-base-url/"
-    endpoint = "fake-endpoint"
-    mocker.patch.dict(os.environ, {"CIR_API_BASE_URL": base_url, "CIR_RETRIEVE_CI_ENDPOINT": endpoint})
-
-    # Create a mocked response
-    mock_response = mocker.Mock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {"id": "123"}
-
-    async def mock_get(*_args, **_kwargs):
-        return mock_response
-
-    class FakeClient:
-        """Fake client for testing."""
-
-        async def get(self, *args, **kwargs):
-            """Simulate an async GET request."""
-            return await mock_get(*args, **kwargs)
-
-        async def aclose(self):
-            """Simulate closing the client."""
-
-    @asynccontextmanager
-    async def fake_api_client(**_kwargs):
-        yield FakeClient()
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/fake-endpoint"
+        assert request.url.params["guid"] == str(instrument_id)
+        return httpx.Response(200, json={"id": "123", "validator_version": "1.0.0"})
 
     # Patch the iap.get_api_client used inside the service
     mocker.patch(
         "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
-        fake_api_client,
+        mock_api_client(handler),
     )
 
-    result = await retrieve_instrument(instrument_id)
-    assert result == {"id": "123"}
+    result = await retrieve_instrument(instrument_id, settings)
+    assert result == {"id": "123", "validator_version": "1.0.0"}
 
 
 @pytest.mark.asyncio
@@ -73,63 +61,236 @@ async def test_retrieve_instrument_exception(
     text_data,
     side_effect,
     mocker,
+    mock_api_client,
+    settings,
 ):
     """Test the retrieve_instrument function with various exception scenarios."""
     instrument_id = uuid4()
 
-    # Set up mocked environment variables
-    base_url = "http://fake-base-url/"
-    endpoint = "fake-endpoint"
-    mocker.patch.dict(
-        os.environ,
-        {"CIR_API_BASE_URL": base_url, "CIR_RETRIEVE_CI_ENDPOINT": endpoint},
-    )
-
-    async def mock_get(*_args, **_kwargs):
-        """Simulate an async GET request."""
+    def handler(_request: httpx.Request) -> httpx.Response:
+        """Simulate the CIR response."""
         if side_effect:
             raise side_effect
-        mock_response = mocker.Mock()
-        mock_response.status_code = status_code
-        mock_response.text = text_data
-        return mock_response
+        return httpx.Response(status_code, text=text_data)
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(handler),
+    )
 
-    class FakeClient:
-        """Fake client for testing."""
+    with pytest.raises(HTTPException) as exc_info:
+        await retrieve_instrument(instrument_id, settings)
 
-        async def get(self, *args, **kwargs):
-            """Simulate an async GET request."""
-            return await mock_get(*args, **kwargs)
+    # Expect 500 for request errors, or pass through status otherwise
+    expected_status = status_code if status_code is not None else 500
+    assert exc_info.value.status_code == expected_status
 
-        async def aclose(self):  # needed for cleanup
-            """Simulate closing the client."""
 
-    @asynccontextmanager
-    async def fake_api_client(**_kwargs):
-        """Provide a fake API client."""
-        yield FakeClient()
+@pytest.mark.asyncio
+@pytest.mark.parametrize("declare_length", [True, False])
+async def test_retrieve_instrument_too_large(declare_length, mocker, mock_api_client, settings):
+    """Test that an instrument over MAX_INSTRUMENT_SIZE_BYTES is rejected, with or without a Content-Length."""
+    instrument_id = uuid4()
+    settings = replace(settings, max_instrument_size_bytes=64)
+    body = json.dumps({"sections": ["x" * 100]}).encode()
+
+    async def stream_body():
+        yield body[:32]
+        yield body[32:]
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        if declare_length:
+            return httpx.Response(200, content=body)
+        return httpx.Response(200, content=stream_body())
 
     mocker.patch(
         "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
-        fake_api_client,
+        mock_api_client(handler),
     )
 
     with pytest.raises(HTTPException) as exc_info:
-        await retrieve_instrument(instrument_id)
+        await retrieve_instrument(instrument_id, settings)
 
-    # Expect 500 for request errors, or pass through status otherwise
-    expected_status = status_code if status_code is not None else 500
+    assert exc_info.value.status_code == 500
+    assert exc_info.value.detail["message"] == EXCEPTION_500_INSTRUMENT_TOO_LARGE
+
+
+@pytest.mark.asyncio
+async def test_retrieve_instrument_deadline_exceeded(mocker, mock_api_client, settings):
+    """Test that a CIR timeout after the request deadline has passed raises DeadlineExceededError."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        time.sleep(0.05)
+        error_message = "timed out"
+        raise httpx.ReadTimeout(error_message, request=request)
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(handler),
+    )
+
+    with request_deadline(0.05), pytest.raises(DeadlineExceededError) as exc_info:
+        await retrieve_instrument(uuid4(), settings)
+
+    assert exc_info.value.stage == "retrieval"
+
+
+@pytest.mark.asyncio
+async def test_retrieve_instrument_abandoned_at_deadline(mocker, mock_api_client, settings):
+    """Test that a CIR call still in progress when the request deadline passes is abandoned."""
+
+    async def handler(_request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(handler),
+    )
+
+    started = time.monotonic()
+    with request_deadline(0.05), pytest.raises(DeadlineExceededError) as exc_info:
+        await retrieve_instrument(uuid4(), settings)
+
+    assert exc_info.value.stage == "retrieval"
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_retrieve_instrument_waits_for_slow_cir_until_deadline(mocker, slow_api_client, settings):
+    """Test that a CIR call slower than the client's default timeout succeeds while the deadline allows it."""
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        await slow_api_client(b'{"validator_version": "1.0.0"}', delay=0.3),
+    )
+
+    with request_deadline(5):
+        instrument = await retrieve_instrument(uuid4(), settings)
+
+    assert instrument == {"validator_version": "1.0.0"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("validate, expected_status", [(True, 500), (False, None)])
+async def test_retrieve_instrument_invalid_structure(validate, expected_status, mocker, mock_api_client, settings):
+    """Test that a malformed instrument from CIR is rejected, unless validation is turned off."""
+    settings = replace(settings, validate_upstream_instruments=validate)
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(200, json={"validator_version": "1.0.0", "sections": {}})),
+    )
+
+    if expected_status is None:
+        assert (await retrieve_instrument(uuid4(), settings))["sections"] == {}
+        return
+    with pytest.raises(HTTPException) as exc_info:
+        await retrieve_instrument(uuid4(), settings)
     assert exc_info.value.status_code == expected_status
+    assert exc_info.value.detail["message"] == EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT
+
+
+@pytest.mark.asyncio
+async def test_retrieve_instrument_served_from_cache(mocker, mock_api_client, settings):
+    """Test that a retrieved instrument is cached, so CIR is only called once."""
+    instrument_id = uuid4()
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"validator_version": "1.0.0"})
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(handler),
+    )
+
+    first = await retrieve_instrument(instrument_id, settings)
+    second = await retrieve_instrument(instrument_id, settings)
+
+    assert first == second == {"validator_version": "1.0.0"}
+    assert first is not second
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_instrument_metadata(mocker, mock_api_client, settings):
+    """Test that metadata is fetched from CIR on a miss, then served from the index without contacting CIR."""
+    instrument_id = uuid4()
+    body = json.dumps({"validator_version": "1.0.0", "title": "Title"}).encode()
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(200, content=body)),
+    )
+
+    assert await retrieval.cached_metadata(instrument_id, settings) is None
+    metadata = await retrieval.retrieve_instrument_metadata(instrument_id, settings)
+
+    assert (metadata.validator_version, metadata.size_bytes) == ("1.0.0", len(body))
+    assert metadata.fields == {"title": "Title"}
+    assert await retrieval.cached_metadata(instrument_id, settings) is metadata
 
 
 @pytest.mark.asyncio
-async def test_retrieve_instrument_missing_cir_endpoint(mocker):
-    """Test retrieve_instrument raises HTTPException if CIR_RETRIEVE_CI_ENDPOINT exists but has no value."""
+async def test_cached_metadata_rebuilt_from_cached_body(settings):
+    """Test that evicted metadata is rebuilt from the cached body."""
     instrument_id = uuid4()
-    # Patch environment to include CIR_API_BASE_URL but not CIR_RETRIEVE_CI_ENDPOINT
-    mocker.patch.dict(os.environ, {"CIR_API_BASE_URL": "http://fake-url", "CIR_RETRIEVE_CI_ENDPOINT": ""}, clear=True)
+    body = json.dumps({"validator_version": "2.0.0"}).encode()
+    get_instrument_cache(settings).bodies.set(str(instrument_id), body)
+
+    metadata = await retrieval.cached_metadata(instrument_id, settings)
+
+    assert metadata is not None
+    assert metadata.validator_version == "2.0.0"
+
+
+@pytest.mark.asyncio
+async def test_not_found_instrument_rejected_without_contacting_cir(mocker, mock_api_client, settings, clock):
+    """Test that an ID CIR did not find is rejected without contacting CIR until the negative cache entry expires."""
+    instrument_id = uuid4()
+    requests = []
+    metrics.reset()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(404, text="Not Found")
+
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(handler),
+    )
+
     with pytest.raises(HTTPException) as exc_info:
-        await retrieval.retrieve_instrument(instrument_id)
-    exc = exc_info.value
-    assert exc.status_code == 500
-    assert exc.detail["message"] == "CIR_RETRIEVE_CI_ENDPOINT configuration is missing."
+        await retrieve_instrument(instrument_id, settings)
+    assert exc_info.value.status_code == 404
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            retrieval.reject_if_not_found(instrument_id, settings)
+        assert exc_info.value.status_code == 404
+    assert len(requests) == 1
+    assert metrics.snapshot()["counters"]['cache_hits_total{cache="instrument_not_found"}'] == 2
+
+    clock.advance(settings.negative_cache_ttl_seconds)
+    retrieval.reject_if_not_found(instrument_id, settings)
+    with pytest.raises(HTTPException):
+        await retrieval.retrieve_instrument_metadata(instrument_id, settings)
+    assert len(requests) == 2
+
+    assert await get_instrument_cache(settings).invalidate(str(instrument_id)) == 1
+    retrieval.reject_if_not_found(instrument_id, settings)
+
+
+@pytest.mark.asyncio
+async def test_failed_retrieval_not_negatively_cached(mocker, mock_api_client, settings):
+    """Test that only a 404 from CIR is remembered, so other failures are retried."""
+    instrument_id = uuid4()
+    mocker.patch(
+        "eq_cir_proxy_service.services.instrument.retrieval.get_api_client",
+        mock_api_client(lambda _request: httpx.Response(500, text="Internal Server Error")),
+    )
+
+    with pytest.raises(HTTPException):
+        await retrieve_instrument(instrument_id, settings)
+
+    assert not get_instrument_cache(settings).is_not_found(str(instrument_id))
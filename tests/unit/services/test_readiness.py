@@ -0,0 +1,93 @@
+"""Tests for the background readiness checker."""
+
+import asyncio
+from dataclasses import replace
+
+import pytest
+
+from eq_cir_proxy_service.services import readiness
+from eq_cir_proxy_service.services.instrument.cache import get_instrument_cache
+from eq_cir_proxy_service.services.readiness import ReadinessChecker, check_readiness
+from eq_cir_proxy_service.utils import iap
+from eq_cir_proxy_service.utils.concurrency import get_request_limiter
+
+
+@pytest.fixture(autouse=True)
+def no_cached_tokens(monkeypatch):
+    """Start every test without cached IAP tokens."""
+    monkeypatch.setattr(iap, "_iap_tokens", {})
+
+
+@pytest.mark.asyncio
+async def test_check_readiness_idle(settings):
+    """Test that an idle service is ready, with its pools, tokens and caches reported."""
+    settings = replace(settings, cir=replace(settings.cir, iap_client_id="cir-audience"))
+    get_instrument_cache(settings).store("id", {"validator_version": "1.0.0"}, b"{}")
+
+    report = check_readiness(settings)
+
+    assert report["status"] == "ready"
+    assert report["admission"] == {
+        "in_flight": 0,
+        "max_in_flight": settings.max_in_flight_requests,
+        "queued": 0,
+        "max_queued": settings.max_queued_requests,
+        "saturated": False,
+    }
+    token_states = {name: upstream["iap_token"] for name, upstream in report["upstreams"].items()}
+    assert token_states == {"cir": "not_fetched", "converter_service": "not_required"}
+    endpoints = report["upstreams"]["cir"]["endpoints"]
+    assert [endpoint["base_url"] for endpoint in endpoints] == list(settings.cir.base_urls)
+    assert report["cache"] == {
+        "instrument_entries": 1,
+        "conversion_entries": 0,
+        "metadata_entries": 1,
+        "disk_bytes": None,
+        "warm": True,
+    }
+
+
+@pytest.mark.parametrize("age, expected", [(0, "fresh"), (iap.IAP_TOKEN_TTL_SECONDS + 1, "stale")])
+def test_check_readiness_token_freshness(settings, monkeypatch, age, expected):
+    """Test that a cached IAP token is reported fresh until it is due to be refreshed."""
+    settings = replace(settings, cir=replace(settings.cir, iap_client_id="cir-audience"))
+    monkeypatch.setattr(readiness, "iap_token_age", lambda _audience: age)
+
+    assert check_readiness(settings)["upstreams"]["cir"]["iap_token"] == expected
+
+
+@pytest.mark.asyncio
+async def test_check_readiness_saturated(settings):
+    """Test that the service is unavailable while its admission limiter would reject new requests."""
+    settings = replace(settings, max_in_flight_requests=1, max_queued_requests=1)
+    limiter = get_request_limiter(settings)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    report = check_readiness(settings)
+
+    assert report["status"] == "unavailable"
+    assert report["admission"]["saturated"] is True
+    limiter.release()
+    await waiter
+    limiter.release()
+
+
+@pytest.mark.asyncio
+async def test_readiness_checker_refreshes_in_background(settings, monkeypatch):
+    """Test that the checker reports at once on start, then recomputes its report until it is closed."""
+    statuses = iter(["ready", "unavailable", "ready"])
+    monkeypatch.setattr(readiness, "check_readiness", lambda _settings: {"status": next(statuses, "ready")})
+    checker = ReadinessChecker(replace(settings, readiness_check_interval_seconds=0.01))
+    assert not checker.ready
+
+    checker.start()
+    assert checker.ready
+    await asyncio.sleep(0.015)
+    assert not checker.ready
+    await asyncio.sleep(0.01)
+    assert checker.ready
+
+    await checker.aclose()
+    await checker.aclose()
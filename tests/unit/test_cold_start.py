@@ -0,0 +1,32 @@
+"""Cold-start tests: the application must import quickly and without optional heavy dependencies."""
+
+import os
+import subprocess
+import sys
+
+# Generous enough for a slow CI runner; the import normally takes well under a second.
+COLD_START_IMPORT_BUDGET_SECONDS = 2.5
+
+IMPORT_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import eq_cir_proxy_service.main
+print(time.perf_counter() - started)
+print(",".join(sorted(name for name in sys.modules if name.startswith(("google", "requests")))))
+"""
+
+
+def test_cold_start_import_time_and_lazy_dependencies():
+    """Importing the application stays within budget and does not import google-auth or requests."""
+    env = {key: value for key, value in os.environ.items() if not key.endswith("_IAP_CLIENT_ID")}
+    result = subprocess.run(  # noqa: S603 - fixed command built from sys.executable
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    import_seconds, heavy_modules = result.stdout.splitlines()[-2:]
+
+    assert float(import_seconds) < COLD_START_IMPORT_BUDGET_SECONDS
+    assert heavy_modules == ""
@@ -3,7 +3,10 @@
 import pytest
 from fastapi.testclient import TestClient
 
+from eq_cir_proxy_service.config.settings import SettingsError
 from eq_cir_proxy_service.main import app
+from eq_cir_proxy_service.utils.concurrency import ConcurrencyLimitExceededError
+from eq_cir_proxy_service.utils.traffic_recording import read_recording
 
 
 def test_root():
@@ -15,14 +18,32 @@ def test_root():
     assert response.json() == {"message": "Hello World"}
 
 
-def test_status_endpoint_with_logs(caplog, client=None):
-    """Test the GET /status endpoint and log output."""
+def test_status_endpoint_without_logs(caplog, client=None):
+    """Test the GET /status endpoint, which does not log as it is probed frequently."""
     client = client or TestClient(app)
     with caplog.at_level("INFO"):
         response = client.get("/status")
     assert response.status_code == 200
     assert response.json() == {"status": "OK"}
-    assert "Health check endpoint." in caplog.text
+    assert [record.name for record in caplog.records] == ["httpx"]
+
+
+def test_readiness_endpoint():
+    """Test that GET /status/ready returns the checker's report once the application has started."""
+    with TestClient(app) as client:
+        response = client.get("/status/ready")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert set(response.json()["upstreams"]) == {"cir", "converter_service"}
+
+
+def test_readiness_endpoint_before_startup(client=None):
+    """Test that GET /status/ready returns a 503 until the readiness checker has produced a report."""
+    client = client or TestClient(app)
+    response = client.get("/status/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "starting"}
 
 
 @pytest.mark.parametrize("method", ["post", "put", "patch", "delete"])
@@ -46,3 +67,69 @@ def test_empty_instrument_id_exception_handler(client=None):
     client = client or TestClient(app)
     response = client.get("/instrument")
     assert response.status_code == 404
+
+
+def test_metrics_endpoint(client=None):
+    """Test that the /metrics endpoint returns counters and gauges."""
+    client = client or TestClient(app)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert set(response.json()) == {"counters", "gauges"}
+
+
+def test_http_exception_handler_keeps_headers(monkeypatch, client=None):
+    """Test that headers set on an HTTPException, such as Retry-After, reach the client."""
+    client = client or TestClient(app)
+
+    async def mock_retrieve_instrument(_instrument_id, _settings):
+        limiter_name = "instrument"
+        raise ConcurrencyLimitExceededError(limiter_name, "queue_timeout", retry_after=2)
+
+    monkeypatch.setattr(
+        "eq_cir_proxy_service.services.instrument.retrieval.retrieve_instrument",
+        mock_retrieve_instrument,
+    )
+    response = client.get("/instrument/1f8f9f26-90a6-4765-be9e-b6a8631c56e1?version=1.0.0")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_lifespan_closes_api_clients(monkeypatch):
+    """Test that application shutdown closes the pooled upstream clients."""
+    closed = []
+
+    async def fake_close_api_clients():
+        closed.append(True)
+
+    monkeypatch.setattr("eq_cir_proxy_service.main.close_api_clients", fake_close_api_clients)
+
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
+        assert not closed
+
+    assert closed == [True]
+
+
+def test_lifespan_writes_traffic_recording(monkeypatch, tmp_path):
+    """Test that requests recorded while the application runs are written to the recording on shutdown."""
+    monkeypatch.setenv("TRAFFIC_RECORDING_DIR", str(tmp_path))
+
+    with TestClient(app) as client:
+        assert client.get("/instrument/not-a-uuid?version=1.0.0").status_code == 422
+
+    (recording,) = tmp_path.glob("traffic-*.jsonl")
+    (request,) = read_recording(recording)
+    assert (request.route, request.instrument_id, request.version, request.status) == (
+        "/instrument/{instrument_id}",
+        None,
+        "1.0.0",
+        422,
+    )
+
+
+def test_lifespan_fails_on_invalid_settings(monkeypatch):
+    """Test that the application refuses to start when the configuration is invalid."""
+    monkeypatch.delenv("CIR_API_BASE_URL")
+
+    with pytest.raises(SettingsError, match="CIR_API_BASE_URL must be set"), TestClient(app):
+        pass
@@ -0,0 +1,120 @@
+"""Tests for the production server entry point."""
+
+import pytest
+
+from eq_cir_proxy_service import server
+from eq_cir_proxy_service.utils.startup import ImportTiming
+
+
+def test_parse_args_defaults(monkeypatch):
+    """Test the default server options when no flags or environment variables are set."""
+    for env in ["HOST", "PORT", "WEB_CONCURRENCY", "SERVER_LOOP", "SERVER_HTTP", "SERVER_BACKLOG"]:
+        monkeypatch.delenv(env, raising=False)
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 4)
+
+    args = server.parse_args([])
+
+    assert (args.host, args.port, args.workers) == (server.DEFAULT_HOST, server.DEFAULT_PORT, 1)
+    assert (args.loop, args.http, args.backlog) == ("auto", "auto", server.DEFAULT_BACKLOG)
+    assert args.timeout_keep_alive == server.DEFAULT_KEEP_ALIVE_SECONDS
+    assert args.timeout_graceful_shutdown == server.DEFAULT_GRACEFUL_SHUTDOWN_SECONDS
+
+
+def test_parse_args_from_environment(monkeypatch):
+    """Test that options are read from the environment, as set on Cloud Run."""
+    monkeypatch.setenv("PORT", "8080")
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("CONVERSION_JOBS_ENABLED", "false")
+    monkeypatch.setenv("SERVER_KEEP_ALIVE_SECONDS", "620")
+
+    args = server.parse_args([])
+
+    assert (args.port, args.workers, args.timeout_keep_alive) == (8080, 3, 620)
+
+
+def test_several_workers_need_conversion_jobs_disabled(capsys):
+    """Test that more than one worker is refused while conversion jobs, which are kept per process, are enabled."""
+    with pytest.raises(SystemExit):
+        server.parse_args(["--workers", "2"])
+
+    assert "CONVERSION_JOBS_ENABLED=false" in capsys.readouterr().err
+
+
+def test_default_workers_ignores_cpu_count(monkeypatch):
+    """Test that a single worker is used unless WEB_CONCURRENCY asks for more, whatever the host's CPU count."""
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 64)
+    assert server.default_workers() == 1
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert server.default_workers() == 4
+
+
+@pytest.mark.parametrize(
+    "installed, expected_loop, expected_http",
+    [
+        (True, "uvloop", "httptools"),
+        (False, "asyncio", "h11"),
+    ],
+)
+def test_auto_loop_and_http(installed, expected_loop, expected_http, monkeypatch):
+    """Test that auto picks uvloop and httptools only when they are installed."""
+    monkeypatch.setattr(server, "_is_installed", lambda _module: installed)
+
+    assert server.resolve_loop("auto") == expected_loop
+    assert server.resolve_http("auto") == expected_http
+
+
+def test_explicit_loop_and_http_are_kept(monkeypatch):
+    """Test that an explicit loop or HTTP implementation is used as given."""
+    monkeypatch.setattr(server, "_is_installed", lambda _module: True)
+
+    assert server.resolve_loop("asyncio") == "asyncio"
+    assert server.resolve_http("h11") == "h11"
+
+
+def test_main_runs_uvicorn(monkeypatch):
+    """Test that main starts uvicorn with the resolved options."""
+    calls = []
+    monkeypatch.setattr(server.uvicorn, "run", lambda app, **options: calls.append((app, options)))
+    monkeypatch.setattr(server, "_is_installed", lambda _module: False)
+    monkeypatch.setenv("CONVERSION_JOBS_ENABLED", "false")
+
+    server.main(["--workers", "2", "--backlog", "512", "--timeout-graceful-shutdown", "5"])
+
+    app, options = calls[0]
+    assert app == "eq_cir_proxy_service.main:app"
+    assert options["workers"] == 2
+    assert options["backlog"] == 512
+    assert options["timeout_graceful_shutdown"] == 5
+    assert (options["loop"], options["http"]) == ("asyncio", "h11")
+    assert options["access_log"] is False
+
+
+def test_main_reads_settings_from_dotenv(monkeypatch, tmp_path):
+    """Test that the settings checked before starting uvicorn include those in .env, which the application loads."""
+    calls = []
+    monkeypatch.setattr(server.uvicorn, "run", lambda app, **options: calls.append((app, options)))
+    monkeypatch.delenv("CONVERSION_JOBS_ENABLED", raising=False)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("CONVERSION_JOBS_ENABLED=false\n")
+
+    server.main(["--workers", "2"])
+
+    assert calls[0][1]["workers"] == 2
+
+
+def test_is_installed():
+    """Test optional module detection."""
+    assert server._is_installed("json")  # pylint: disable=protected-access # noqa: SLF001
+    assert not server._is_installed("not_a_real_module")  # pylint: disable=protected-access # noqa: SLF001
+
+
+def test_startup_report_exits_without_starting(monkeypatch, capsys):
+    """Test that --startup-report prints the import-time breakdown instead of starting the server."""
+    monkeypatch.setattr(server, "measure_import_times", lambda: [ImportTiming("fastapi", 0.2)])
+    monkeypatch.setattr(server.uvicorn, "run", lambda *_args, **_kwargs: pytest.fail("The server should not start"))
+
+    server.main(["--startup-report"])
+
+    assert "fastapi" in capsys.readouterr().out
@@ -0,0 +1,151 @@
+"""Tests for the access log middleware and request IDs."""
+
+import asyncio
+import logging
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from structlog.contextvars import get_contextvars
+
+from eq_cir_proxy_service.utils import access_log
+from eq_cir_proxy_service.utils.access_log import AccessLogMiddleware
+
+app = FastAPI()
+app.add_middleware(AccessLogMiddleware)
+
+
+@app.get("/work")
+async def work() -> dict:
+    """Route that adds to its access log record, and returns the context variables bound while serving it."""
+    access_log.annotate(instrument_id="abc", cache="hit")
+    access_log.record_upstream_status("cir", 200)
+    access_log.record_upstream_status("cir", 503)
+    with access_log.stage("retrieval"):
+        await asyncio.sleep(0)
+    access_log.record_stage("retrieval", 0.001)
+    return get_contextvars()
+
+
+@app.get("/slow")
+async def slow() -> dict:
+    """Route slower than the slow request threshold set by the tests."""
+    await asyncio.sleep(0.02)
+    return {}
+
+
+@app.get("/fail")
+async def fail() -> dict:
+    """Route that fails with a server error."""
+    raise HTTPException(status_code=502, detail="Bad gateway")
+
+
+@app.get("/crash")
+async def crash() -> dict:
+    """Route that raises an unhandled exception."""
+    error_message = "boom"
+    raise RuntimeError(error_message)
+
+
+@app.get("/status")
+async def status() -> dict:
+    """Probe route, which is not logged when it succeeds."""
+    return {"status": "OK"}
+
+
+client = TestClient(app, raise_server_exceptions=False)
+
+
+class FakeLogger:  # pylint: disable=too-few-public-methods
+    """Records the access log records logged."""
+
+    def __init__(self):
+        """Initialise the logger without records."""
+        self.records = []
+
+    def log(self, level, event, **fields):
+        """Record a log call."""
+        self.records.append((level, event, fields))
+
+
+@pytest.fixture(name="access_logger")
+def fixture_access_logger(monkeypatch):
+    """Capture the access log records, logging every successful request unless a test changes the rate."""
+    monkeypatch.setenv("ACCESS_LOG_SAMPLE_RATE", "1")
+    fake_logger = FakeLogger()
+    monkeypatch.setattr(access_log, "logger", fake_logger)
+    return fake_logger
+
+
+def test_access_log_record(access_logger):
+    """Test that one record is logged per request, with its ID, annotations, stages and upstream statuses."""
+    response = client.get("/work")
+
+    request_id = response.headers["X-Request-Id"]
+    assert response.json() == {"request_id": request_id}
+    ((level, event, fields),) = access_logger.records
+    assert (level, event) == (logging.INFO, "Request completed.")
+    assert fields["request_id"] == request_id
+    assert (fields["method"], fields["path"], fields["status"]) == ("GET", "/work", 200)
+    assert fields["bytes"] == len(response.content)
+    assert (fields["instrument_id"], fields["cache"]) == ("abc", "hit")
+    assert fields["upstreams"] == {"cir": [200, 503]}
+    assert fields["stages_ms"]["retrieval"] >= 1
+    assert fields["duration_ms"] >= fields["stages_ms"]["retrieval"] - 1
+    assert not get_contextvars()
+
+
+@pytest.mark.parametrize(
+    "sent, reused",
+    [("trace-1234.abc:1", True), ("has spaces", False), ("x" * 65, False), ("", False)],
+)
+def test_request_id_from_client(sent, reused, access_logger):
+    """Test that a valid request ID sent by the client is used, and any other is replaced."""
+    response = client.get("/work", headers={"X-Request-Id": sent})
+
+    request_id = response.headers["X-Request-Id"]
+    assert (request_id == sent) is reused
+    assert access_logger.records[0][2]["request_id"] == request_id
+
+
+@pytest.mark.parametrize(
+    "path, environment, expected",
+    [
+        ("/work", {"ACCESS_LOG_SAMPLE_RATE": "0"}, []),
+        ("/status", {}, []),
+        ("/missing", {"ACCESS_LOG_SAMPLE_RATE": "0"}, [(logging.WARNING, 404)]),
+        ("/fail", {"ACCESS_LOG_SAMPLE_RATE": "0"}, [(logging.ERROR, 502)]),
+        ("/crash", {"ACCESS_LOG_SAMPLE_RATE": "0"}, [(logging.ERROR, 500)]),
+        ("/slow", {"ACCESS_LOG_SAMPLE_RATE": "0", "ACCESS_LOG_SLOW_REQUEST_SECONDS": "0.01"}, [(logging.WARNING, 200)]),
+    ],
+)
+def test_access_log_sampling(path, environment, expected, access_logger, monkeypatch):
+    """Test that errors and slow requests are always logged, and other requests only when sampled."""
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+
+    client.get(path)
+
+    assert [(level, fields["status"]) for level, _event, fields in access_logger.records] == expected
+
+
+def test_sampling_decided_by_request_id(access_logger, monkeypatch):
+    """Test that a request is logged or not consistently by its ID, at the configured rate."""
+    monkeypatch.setenv("ACCESS_LOG_SAMPLE_RATE", "0.5")
+    request_ids = [f"request-{index}" for index in range(200)]
+
+    for _ in range(2):
+        for request_id in request_ids:
+            client.get("/work", headers={"X-Request-Id": request_id})
+
+    logged = [fields["request_id"] for _level, _event, fields in access_logger.records]
+    assert logged[: len(logged) // 2] == logged[len(logged) // 2 :]
+    assert 60 < len(logged) // 2 < 140
+
+
+def test_annotations_outside_request_ignored():
+    """Test that annotating outside a request does nothing."""
+    access_log.annotate(instrument_id="abc")
+    access_log.record_upstream_status("cir", 200)
+    with access_log.stage("retrieval"):
+        pass
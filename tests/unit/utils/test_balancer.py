@@ -0,0 +1,172 @@
+"""Tests for balancing calls across the replicas of an upstream service."""
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from eq_cir_proxy_service.config.settings import EjectionSettings, UpstreamSettings
+from eq_cir_proxy_service.utils import balancer, iap, metrics
+from eq_cir_proxy_service.utils.balancer import EndpointBalancer
+
+FAST, SLOW = "http://fast", "http://slow"
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def close_pooled_clients():
+    """Start and finish every test without pooled clients or observed replicas."""
+    await iap.close_api_clients()
+    yield
+    await iap.close_api_clients()
+
+
+def make_balancer(*base_urls: str, failures: int = 2, seconds: float = 30.0) -> EndpointBalancer:
+    """Build a balancer over replicas that are ejected after the given number of failures."""
+    upstream = UpstreamSettings(
+        name="test",
+        base_urls=base_urls,
+        endpoint="/",
+        ejection=EjectionSettings(consecutive_failures=failures, seconds=seconds),
+    )
+    return EndpointBalancer(upstream)
+
+
+def test_unmeasured_replicas_share_calls_by_outstanding():
+    """Test that concurrent calls are spread across replicas before any latency is known."""
+    replicas = make_balancer(FAST, SLOW)
+
+    with replicas.call() as first, replicas.call() as second:
+        assert {first.base_url, second.base_url} == {FAST, SLOW}
+        assert first.outstanding == second.outstanding == 1
+
+    assert [endpoint.outstanding for endpoint in replicas.endpoints] == [0, 0]
+
+
+@pytest.mark.usefixtures("clock")
+def test_fastest_replica_preferred_until_its_queue_builds():
+    """Test that calls go to the faster replica, until its outstanding calls make the slower one cheaper."""
+    replicas = make_balancer(SLOW, FAST)
+    fast, slow = replicas.endpoints[1], replicas.endpoints[0]
+    replicas.observe(slow, 0.3, ok=True)
+    replicas.observe(fast, 0.1, ok=True)
+
+    with replicas.call() as first, replicas.call() as second, replicas.call() as third:
+        assert (first, second, third) == (fast, fast, slow)
+
+    replicas.observe(fast, 0.2, ok=True)
+    gauges = metrics.snapshot()["gauges"]
+    assert fast.latency == gauges['upstream_endpoint_latency_seconds{endpoint="http://fast",upstream="test"}']
+    assert fast.latency == pytest.approx(0.13)
+
+
+def test_slow_replica_retried_after_its_estimate_fades(clock):
+    """Test that a replica avoided for being slow is tried again once it has not been called for a while."""
+    replicas = make_balancer(SLOW, FAST)
+    slow, fast = replicas.endpoints
+    replicas.observe(slow, 1.0, ok=True)
+    clock.advance(0.1)
+    replicas.observe(fast, 0.1, ok=True)
+    assert replicas.pick() is fast
+
+    clock.advance(3 * balancer.LATENCY_DECAY_SECONDS)
+    replicas.observe(fast, 0.1, ok=True)
+
+    assert slow.latency_estimate(clock.now) < fast.latency_estimate(clock.now)
+    assert replicas.pick() is slow
+
+
+def test_failing_replica_ejected_and_returned(clock):
+    """Test that a replica failing calls in a row is ejected for a while, then ejected again by its next failure."""
+    metrics.reset()
+    replicas = make_balancer(FAST, SLOW, failures=2, seconds=30.0)
+    failing, healthy = replicas.endpoints
+    replicas.observe(failing, 0.01, ok=False)
+    replicas.observe(failing, 0.01, ok=True)
+    replicas.observe(failing, 0.01, ok=False)
+    assert replicas.report()[0]["healthy"] is True
+
+    replicas.observe(failing, 0.01, ok=False)
+
+    assert replicas.pick() is healthy
+    assert [endpoint["healthy"] for endpoint in replicas.report()] == [False, True]
+    counters = metrics.snapshot()["counters"]
+    assert counters['upstream_endpoint_failures_total{endpoint="http://fast",upstream="test"}'] == 3
+    assert counters['upstream_endpoint_ejections_total{endpoint="http://fast",upstream="test"}'] == 1
+
+    clock.advance(30)
+    assert replicas.report()[0]["healthy"] is True
+    replicas.observe(failing, 0.01, ok=False)
+    assert replicas.report()[0]["healthy"] is False
+
+
+def test_all_replicas_ejected(clock):
+    """Test that calls go to the replica due back soonest when every replica is ejected."""
+    replicas = make_balancer(FAST, SLOW, failures=1)
+    first, second = replicas.endpoints
+    replicas.observe(second, 0.01, ok=False)
+    clock.advance(1)
+    replicas.observe(first, 0.01, ok=False)
+
+    assert replicas.pick() is second
+
+
+def test_only_replica_never_ejected():
+    """Test that an upstream with one replica keeps using it however often it fails."""
+    replicas = make_balancer(FAST, failures=1)
+    (only,) = replicas.endpoints
+
+    replicas.observe(only, 0.01, ok=False)
+    replicas.observe(only, 0.01, ok=False)
+
+    assert replicas.report() == [
+        {
+            "base_url": FAST,
+            "healthy": True,
+            "outstanding": 0,
+            "latency_seconds": None,
+            "consecutive_failures": 2,
+        },
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status_code, healthy", [(200, True), (503, False)])
+async def test_api_client_observes_responses(status_code, healthy, monkeypatch):
+    """Test that calls made with a pooled client are observed by the replica's balancer, by status code."""
+
+    async def respond(_transport, request):
+        return httpx.Response(status_code, request=request)
+
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", respond)
+    upstream = UpstreamSettings(
+        name="test",
+        base_urls=(FAST, SLOW),
+        endpoint="/",
+        ejection=EjectionSettings(consecutive_failures=1),
+    )
+
+    async with iap.get_api_client(upstream) as client:
+        assert balancer.get_balancer(upstream).endpoints[0].outstanding == 1
+        await client.get("/")
+
+    first, _second = balancer.get_balancer(upstream).report()
+    assert first["base_url"] == FAST
+    assert first["healthy"] is healthy
+    assert (first["latency_seconds"] is not None) is healthy
+
+
+@pytest.mark.asyncio
+async def test_api_client_observes_connection_errors(monkeypatch):
+    """Test that calls that fail to connect count as failures of the replica, and reach the caller."""
+
+    async def refuse(_transport, request):
+        error_message = "Connection refused"
+        raise httpx.ConnectError(error_message, request=request)
+
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", refuse)
+    upstream = UpstreamSettings(name="test", base_urls=(FAST,), endpoint="/")
+
+    async with iap.get_api_client(upstream) as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get("/")
+
+    assert balancer.get_balancer(upstream).report()[0]["consecutive_failures"] == 1
@@ -0,0 +1,111 @@
+"""Tests for the deduplicating, compressing in-process cache."""
+
+import json
+import os
+
+import pytest
+
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.blob_cache import MIN_COMPRESSED_BYTES, Blob, BlobCache
+
+LARGE = json.dumps({"sections": [{"id": f"section-{index}", "title": "Title"} for index in range(500)]}).encode()
+OTHER = LARGE.replace(b"Title", b"Other")
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Start every test with empty metrics."""
+    metrics.reset()
+
+
+def test_blob_compressed_when_worth_it():
+    """Test that large values are compressed, and small or incompressible ones stored as they are without copying."""
+    small = bytearray(b"x" * (MIN_COMPRESSED_BYTES - 1))
+    incompressible = os.urandom(MIN_COMPRESSED_BYTES)
+
+    large = Blob.encode(LARGE, compress=True)
+
+    assert large.compressed
+    assert len(large.data) < len(LARGE) // 4
+    assert (large.size, large.decode()) == (len(LARGE), LARGE)
+    assert Blob.encode(small, compress=True).data is small
+    assert Blob.encode(incompressible, compress=True).data is incompressible
+    assert Blob.encode(LARGE, compress=False).decode() is LARGE
+
+
+def test_identical_values_share_one_blob():
+    """Test that identical values cached under several keys are stored and counted once, until the last is removed."""
+    cache = BlobCache("test", max_bytes=10_000, ttl_seconds=60.0)
+    cache.set("a/2.0.0", LARGE)
+    stored_size = cache.size
+
+    cache.set("a/2.1.0", LARGE)
+    cache.set("b/2.0.0", bytearray(LARGE))
+
+    assert (len(cache), cache.size, cache.uncompressed_size) == (3, stored_size, len(LARGE))
+    assert cache.get("b/2.0.0") == LARGE
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]['cache_deduplicated_total{cache="test"}'] == 2
+    assert snapshot["gauges"]['cache_blobs{cache="test"}'] == 1
+    assert snapshot["gauges"]['cache_uncompressed_size{cache="test"}'] == len(LARGE)
+
+    assert cache.delete_prefix("a/") == 2
+    assert cache.size == stored_size
+    assert cache.delete("b/2.0.0") is True
+    assert (cache.size, cache.uncompressed_size) == (0, 0)
+
+
+def test_value_cached_again_under_its_key():
+    """Test that caching the same value under a key again keeps its blob, without counting it as shared."""
+    cache = BlobCache("test", max_bytes=10_000, ttl_seconds=60.0)
+    cache.set("a", LARGE)
+    cache.set("a", LARGE)
+    cache.set("a", OTHER)
+
+    assert cache.get("a") == OTHER
+    assert cache.uncompressed_size == len(OTHER)
+    assert 'cache_deduplicated_total{cache="test"}' not in metrics.snapshot()["counters"]
+
+
+def test_budget_counts_compressed_bytes():
+    """Test that the budget counts stored bytes, evicting least recently used keys, and skipping oversized values."""
+    third = LARGE.replace(b"Title", b"Third")
+    largest = max(len(Blob.encode(value, compress=True).data) for value in (LARGE, OTHER, third))
+    cache = BlobCache("test", max_bytes=largest * 2, ttl_seconds=60.0)
+    cache.set("large", LARGE)
+    cache.set("other", OTHER)
+    assert len(cache) == 2
+
+    cache.set("third", third)
+
+    assert cache.get("large") is None
+    assert cache.get("other") == OTHER
+    assert metrics.snapshot()["counters"]['cache_evictions_total{cache="test"}'] == 1
+
+    uncompressed = BlobCache("test", max_bytes=len(LARGE) - 1, ttl_seconds=60.0, compress=False)
+    uncompressed.set("large", LARGE)
+    assert (len(uncompressed), uncompressed.size) == (0, 0)
+
+
+def test_expired_entries_absent(clock):
+    """Test that entries expire after the time-to-live, freeing their blobs."""
+    cache = BlobCache("test", max_bytes=10_000, ttl_seconds=60.0)
+    cache.set("a", LARGE, digest="known-digest")
+    assert cache.get("a") == LARGE
+
+    clock.advance(60.0)
+
+    assert cache.get("a") is None
+    assert (len(cache), cache.size) == (0, 0)
+    assert metrics.snapshot()["counters"]['cache_misses_total{cache="test"}'] == 1
+
+
+def test_clear():
+    """Test that clearing removes every entry and blob."""
+    cache = BlobCache("test", max_bytes=10_000, ttl_seconds=60.0)
+    cache.set("a", LARGE)
+    cache.set("b", OTHER)
+
+    assert cache.clear() == 2
+    assert (len(cache), cache.size, cache.uncompressed_size) == (0, 0, 0)
+    assert cache.keys_with_prefix("") == []
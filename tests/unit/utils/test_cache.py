@@ -0,0 +1,84 @@
+"""Tests for the in-process LRU cache."""
+
+import pytest
+
+from eq_cir_proxy_service.utils import metrics
+from eq_cir_proxy_service.utils.cache import LRUCache
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Start every test with empty metrics."""
+    metrics.reset()
+
+
+def make_cache(**overrides) -> LRUCache[str]:
+    """Build a small cache for tests."""
+    options = {"max_entries": 2, "ttl_seconds": 60.0} | overrides
+    return LRUCache("test", **options)
+
+
+def test_get_and_set():
+    """Test that stored values are returned and counted as hits, and absent keys as misses."""
+    lru = make_cache()
+    lru.set("a", "A")
+
+    assert lru.get("a") == "A"
+    assert lru.get("b") is None
+    assert len(lru) == 1
+    counters = metrics.snapshot()["counters"]
+    assert counters['cache_hits_total{cache="test"}'] == 1
+    assert counters['cache_misses_total{cache="test"}'] == 1
+
+
+def test_evicts_least_recently_used():
+    """Test that the least recently used entries are evicted to stay within the number of entries."""
+    lru = make_cache()
+    lru.set("a", "A")
+    lru.set("b", "B")
+    lru.get("a")
+    lru.set("c", "C")
+
+    assert lru.get("b") is None
+    assert lru.get("a") == "A"
+    assert lru.get("c") == "C"
+    assert len(lru) == 2
+    assert metrics.snapshot()["counters"]['cache_evictions_total{cache="test"}'] == 1
+
+
+def test_replacing_an_entry_evicts_nothing():
+    """Test that storing a key again replaces its value without evicting other entries."""
+    lru = make_cache()
+    lru.set("a", "A")
+    lru.set("b", "B")
+    lru.set("a", "A2")
+
+    assert lru.get("a") == "A2"
+    assert lru.get("b") == "B"
+    assert len(lru) == 2
+
+
+def test_entries_expire(clock):
+    """Test that entries are treated as absent once their time-to-live has passed."""
+    lru = make_cache(ttl_seconds=5.0)
+    lru.set("a", "A")
+
+    clock.advance(4.9)
+    assert lru.get("a") == "A"
+    clock.advance(0.1)
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_delete_and_clear():
+    """Test that entries can be removed individually or all at once, reporting how many were cleared."""
+    lru = make_cache()
+    lru.set("a", "A")
+    lru.set("b", "B")
+
+    assert lru.delete("a") is True
+    assert lru.delete("a") is False
+    assert lru.clear() == 1
+
+    assert len(lru) == 0
+    assert metrics.snapshot()["gauges"]['cache_entries{cache="test"}'] == 0
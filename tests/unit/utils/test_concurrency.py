@@ -0,0 +1,214 @@
+"""Tests for the admission control and upstream concurrency limiters."""
+
+import asyncio
+from dataclasses import replace
+
+import pytest
+
+from eq_cir_proxy_service.config.settings import DEFAULT_UPSTREAM_MAX_CONCURRENCY
+from eq_cir_proxy_service.utils import concurrency, metrics
+from eq_cir_proxy_service.utils.concurrency import (
+    ConcurrencyLimiter,
+    ConcurrencyLimitExceededError,
+)
+from eq_cir_proxy_service.utils.deadline import DeadlineExceededError, request_deadline
+
+
+@pytest.fixture(autouse=True)
+def reset_limiters():
+    """Rebuild the configured limiters and metrics for every test."""
+    metrics.reset()
+    concurrency.get_request_limiter.cache_clear()
+    concurrency.get_upstream_limiter.cache_clear()
+    yield
+    concurrency.get_request_limiter.cache_clear()
+    concurrency.get_upstream_limiter.cache_clear()
+
+
+def make_limiter(**overrides) -> ConcurrencyLimiter:
+    """Build a small limiter for tests."""
+    options = {"max_in_flight": 1, "max_queued": 1, "queue_timeout": 1.0, "retry_after": 3} | overrides
+    return ConcurrencyLimiter("test", **options)
+
+
+@pytest.mark.asyncio
+async def test_slot_tracks_in_flight():
+    """Test that holding a slot is reflected in the in-flight count and gauge."""
+    limiter = make_limiter()
+
+    async with limiter.slot():
+        assert limiter.in_flight == 1
+        assert metrics.snapshot()["gauges"]['concurrency_in_flight{limiter="test"}'] == 1
+
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_waiter_is_handed_released_slot():
+    """Test that a queued caller gets the slot as soon as the holder releases it."""
+    limiter = make_limiter()
+    await limiter.acquire()
+
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queued == 1
+    assert metrics.snapshot()["gauges"]['concurrency_queue_depth{limiter="test"}'] == 1
+
+    limiter.release()
+    await waiter
+
+    assert limiter.in_flight == 1
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full():
+    """Test that callers are rejected immediately once the queue is full."""
+    limiter = make_limiter()
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(ConcurrencyLimitExceededError) as exc_info:
+        await limiter.acquire()
+
+    assert exc_info.value.reason == "queue_full"
+    assert exc_info.value.retry_after == 3
+    assert metrics.snapshot()["counters"]['concurrency_rejected_total{limiter="test",reason="queue_full"}'] == 1
+    waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_rejects_after_queue_timeout():
+    """Test that a queued caller is rejected once it has waited longer than the queue timeout."""
+    limiter = make_limiter(queue_timeout=0.01)
+    await limiter.acquire()
+
+    with pytest.raises(ConcurrencyLimitExceededError) as exc_info:
+        await limiter.acquire()
+
+    assert exc_info.value.reason == "queue_timeout"
+    assert limiter.queued == 0
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_bounded_by_request_deadline():
+    """Test that a queued caller gives up when its request deadline passes before the queue timeout."""
+    limiter = make_limiter(queue_timeout=10)
+    await limiter.acquire()
+
+    with request_deadline(0.01), pytest.raises(DeadlineExceededError) as exc_info:
+        await limiter.acquire()
+
+    assert exc_info.value.stage == "test queue"
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """Test that a cancelled waiter is removed from the queue without taking a slot."""
+    limiter = make_limiter()
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert limiter.queued == 0
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_handed_to_abandoning_waiter_is_passed_on():
+    """Test that a slot handed to a waiter that is cancelled at the same moment is not leaked."""
+    limiter = make_limiter(max_queued=2)
+    await limiter.acquire()
+    first = asyncio.create_task(limiter.acquire())
+    second = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    limiter.release()
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    await second
+
+    assert limiter.in_flight == 1
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_release_skips_cancelled_waiters():
+    """Test that release does not hand a slot to a waiter cancelled before it could resume."""
+    limiter = make_limiter()
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    await asyncio.sleep(0)
+    limiter.release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert limiter.in_flight == 0
+    assert limiter.queued == 0
+
+
+def test_get_request_limiter_uses_settings(settings):
+    """Test that the request limiter is configured from the settings and reused."""
+    settings = replace(
+        settings,
+        max_in_flight_requests=4,
+        max_queued_requests=8,
+        request_queue_timeout_seconds=0.5,
+        retry_after_seconds=2,
+    )
+
+    limiter = concurrency.get_request_limiter(settings)
+
+    assert (limiter.max_in_flight, limiter.max_queued, limiter.queue_timeout, limiter.retry_after) == (4, 8, 0.5, 2)
+    assert concurrency.get_request_limiter(settings) is limiter
+
+
+def test_get_upstream_limiter_per_upstream(settings):
+    """Test that upstream limiters take their cap from the upstream's settings and are kept per upstream."""
+    settings = replace(settings, converter_service=replace(settings.converter_service, max_concurrency=2))
+
+    cir_limiter = concurrency.get_upstream_limiter(settings, settings.cir)
+    converter_limiter = concurrency.get_upstream_limiter(settings, settings.converter_service)
+
+    assert cir_limiter.name == "cir"
+    assert cir_limiter.max_in_flight == DEFAULT_UPSTREAM_MAX_CONCURRENCY
+    assert converter_limiter.max_in_flight == 2
+    assert concurrency.get_upstream_limiter(settings, settings.cir) is cir_limiter
+
+
+@pytest.mark.asyncio
+async def test_slots_shared_fairly_between_clients():
+    """Test that freed slots go to each client's queue in turn, in FIFO order within a client."""
+    limiter = make_limiter(max_queued=10)
+    await limiter.acquire()
+    served = []
+
+    async def wait_for_slot(client, name):
+        await limiter.acquire(client)
+        served.append(name)
+
+    waiters = [
+        asyncio.create_task(wait_for_slot(client, name))
+        for client, name in [("greedy", "g1"), ("greedy", "g2"), ("greedy", "g3"), ("polite", "p1")]
+    ]
+    await asyncio.sleep(0)
+    assert limiter.queued == 4
+
+    for _ in waiters:
+        limiter.release()
+        await asyncio.sleep(0)
+
+    assert served == ["g1", "p1", "g2", "g3"]
+    assert limiter.queued == 0
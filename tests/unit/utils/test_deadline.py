@@ -0,0 +1,109 @@
+"""Tests for request deadline propagation."""
+
+import asyncio
+from dataclasses import replace
+
+import httpx
+import pytest
+
+from eq_cir_proxy_service.config.settings import (
+    DEFAULT_MAX_REQUEST_DEADLINE_SECONDS,
+    DEFAULT_REQUEST_DEADLINE_SECONDS,
+)
+from eq_cir_proxy_service.utils.deadline import (
+    DeadlineExceededError,
+    check_deadline,
+    remaining,
+    request_deadline,
+    resolve_deadline_seconds,
+    upstream_deadline,
+    upstream_timeout,
+)
+from eq_cir_proxy_service.utils.streaming import read_body
+
+
+class SlowStream(httpx.AsyncByteStream):
+    """Response body that arrives in chunks a while apart, each well within the client's read timeout."""
+
+    async def __aiter__(self):
+        """Yield the chunks one at a time."""
+        for _ in range(6):
+            await asyncio.sleep(0.05)
+            yield b"chunk"
+
+
+def test_resolve_deadline_seconds_defaults(settings):
+    """Test that requests without a client deadline get the configured default."""
+    assert resolve_deadline_seconds(None, settings) == DEFAULT_REQUEST_DEADLINE_SECONDS
+    assert resolve_deadline_seconds(None, replace(settings, request_deadline_seconds=12.5)) == 12.5
+
+
+def test_resolve_deadline_seconds_caps_client_deadline(settings):
+    """Test that a client deadline is honoured up to the configured maximum."""
+    assert resolve_deadline_seconds(5, settings) == 5
+    assert resolve_deadline_seconds(1000, settings) == DEFAULT_MAX_REQUEST_DEADLINE_SECONDS
+    assert resolve_deadline_seconds(1000, replace(settings, max_request_deadline_seconds=10)) == 10
+
+
+@pytest.mark.asyncio
+async def test_no_deadline_outside_a_request():
+    """Test that work outside a request is not limited."""
+    assert remaining() is None
+    check_deadline("retrieval")
+    async with upstream_deadline("retrieval"):
+        await asyncio.sleep(0)
+
+
+def test_request_deadline_sets_and_resets(clock):
+    """Test that the deadline is visible inside the context and cleared after it."""
+    with request_deadline(10):
+        clock.advance(4)
+        assert remaining() == 6
+
+    assert remaining() is None
+
+
+def test_upstream_timeout_is_time_left_before_deadline(clock):
+    """Test that upstream calls wait for the time left in a request, and for the client's timeout outside one."""
+    client = httpx.AsyncClient(timeout=5.0)
+
+    assert upstream_timeout(client) == httpx.Timeout(5.0)
+    with request_deadline(30):
+        clock.advance(10)
+        assert upstream_timeout(client) == httpx.Timeout(20.0)
+        clock.advance(25)
+        assert upstream_timeout(client) == httpx.Timeout(0.0)
+
+
+def test_check_deadline_raises_once_passed(clock):
+    """Test that a stage is aborted once the deadline has passed."""
+    with request_deadline(1):
+        clock.advance(1)
+        with pytest.raises(DeadlineExceededError) as exc_info:
+            check_deadline("conversion")
+
+    assert exc_info.value.stage == "conversion"
+
+
+@pytest.mark.asyncio
+async def test_upstream_call_not_started_once_deadline_passed():
+    """Test that an upstream call is not started once the deadline has passed."""
+    with request_deadline(0), pytest.raises(DeadlineExceededError) as exc_info:
+        async with upstream_deadline("conversion"):
+            pytest.fail("The upstream call should not be started")
+
+    assert exc_info.value.stage == "conversion"
+
+
+@pytest.mark.asyncio
+async def test_upstream_deadline_bounds_reading_a_slow_body():
+    """Test that a body still arriving when the deadline passes is abandoned, however promptly each chunk arrives."""
+    transport = httpx.MockTransport(lambda _request: httpx.Response(200, stream=SlowStream()))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://upstream") as client:
+        with request_deadline(0.1), pytest.raises(DeadlineExceededError) as exc_info:
+            async with upstream_deadline("retrieval"), client.stream("GET", "/") as response:
+                await read_body(response, 1024)
+
+    assert exc_info.value.stage == "retrieval"
+    assert remaining() is None
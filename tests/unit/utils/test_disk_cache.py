@@ -0,0 +1,279 @@
+"""Tests for the persistent disk cache."""
+
+import fcntl
+import os
+import zlib
+
+import pytest
+
+from eq_cir_proxy_service.utils import disk_cache, metrics
+from eq_cir_proxy_service.utils.disk_cache import LOCK_FILE_NAME, DiskCache
+
+VALUE = b'{"sections": []}' * 100
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Start every test with empty metrics."""
+    metrics.reset()
+
+
+def make_cache(directory, **overrides) -> DiskCache:
+    """Build a disk cache in the directory for tests."""
+    options = {"max_bytes": 10_000, "ttl_seconds": 60.0, "mmap_threshold": 1024 * 1024} | overrides
+    return DiskCache(directory, **options)
+
+
+def blob_files(directory):
+    """Returns the compressed files in the cache directory."""
+    return sorted(directory.glob(f"*/*{disk_cache.BLOB_SUFFIX}"))
+
+
+def test_get_and_set(tmp_path):
+    """Test that values are stored compressed and returned, with hits and misses counted."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+
+    assert cache.get("a") == VALUE
+    assert cache.get("b") is None
+    (blob,) = blob_files(tmp_path)
+    assert cache.size == blob.stat().st_size < len(VALUE)
+    counters = metrics.snapshot()["counters"]
+    assert counters['cache_hits_total{cache="disk"}'] == 1
+    assert counters['cache_misses_total{cache="disk"}'] == 1
+
+
+def test_memory_mapped_read(tmp_path):
+    """Test that files at least the threshold long are read through a memory map."""
+    cache = make_cache(tmp_path, mmap_threshold=1)
+    cache.set("a", VALUE)
+
+    assert cache.get("a") == VALUE
+
+
+def test_survives_restart(tmp_path):
+    """Test that a new cache on the same directory loads the entries of the previous one."""
+    make_cache(tmp_path).set("a", VALUE)
+
+    restarted = make_cache(tmp_path)
+
+    assert restarted.get("a") == VALUE
+    assert restarted.size == blob_files(tmp_path)[0].stat().st_size
+
+
+def test_identical_values_share_a_file(tmp_path):
+    """Test that identical values are stored once, and the file is kept until no key refers to it."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    cache.set("b", VALUE)
+    size = cache.size
+
+    assert len(blob_files(tmp_path)) == 1
+    assert cache.delete("a") is True
+    assert cache.size == size
+    assert cache.get("b") == VALUE
+    assert cache.delete("b") is True
+    assert cache.delete("b") is False
+    assert cache.size == 0
+    assert blob_files(tmp_path) == []
+
+
+def test_replacing_a_value(tmp_path):
+    """Test that storing a new value under a key leaves the old file to be deleted by the next sweep."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    cache.set("a", VALUE)
+    assert len(blob_files(tmp_path)) == 1
+
+    cache.set("a", b"other")
+    assert cache.get("a") == b"other"
+    cache.sweep()
+
+    assert len(blob_files(tmp_path)) == 1
+    assert cache.size == len(zlib.compress(b"other", disk_cache.COMPRESSION_LEVEL))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """Test that the least recently used entries are evicted to stay within the size cap."""
+    values = {key: bytes(range(256)) * 4 + key.encode() for key in "abc"}
+    entry_size = len(zlib.compress(values["a"], disk_cache.COMPRESSION_LEVEL))
+    cache = make_cache(tmp_path, max_bytes=2 * entry_size)
+    cache.set("a", values["a"])
+    cache.set("b", values["b"])
+    cache.get("a")
+
+    cache.set("c", values["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == values["a"]
+    assert cache.get("c") == values["c"]
+    assert metrics.snapshot()["counters"]['cache_evictions_total{cache="disk"}'] == 1
+
+
+def test_skips_values_larger_than_the_cap(tmp_path):
+    """Test that a value whose compressed size exceeds the whole cap is not stored."""
+    cache = make_cache(tmp_path, max_bytes=10)
+    cache.set("a", bytes(range(256)))
+
+    assert cache.get("a") is None
+    assert blob_files(tmp_path) == []
+
+
+def test_expired_entries(tmp_path, clock):
+    """Test that entries expire after the time-to-live, including across restarts."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    cache.set("b", b"other")
+    clock.advance(30)
+    cache.set("c", b"newer")
+    clock.advance(40)
+
+    assert cache.get("a") is None
+    assert blob_files(tmp_path)
+    restarted = make_cache(tmp_path)
+    assert restarted.get("b") is None
+    assert restarted.get("c") == b"newer"
+    assert len(blob_files(tmp_path)) == 1
+
+
+def test_restart_with_smaller_cap(tmp_path):
+    """Test that entries beyond a reduced cap are evicted by the first sweep."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    cache.set("b", b"other")
+
+    restarted = make_cache(tmp_path, max_bytes=cache.size - 1)
+
+    assert restarted.get("a") is None
+    assert restarted.get("b") == b"other"
+
+
+def test_missing_file_skipped_on_sweep(tmp_path):
+    """Test that entries whose file has gone are removed when the directory is swept."""
+    make_cache(tmp_path).set("a", VALUE)
+    blob_files(tmp_path)[0].unlink()
+
+    restarted = make_cache(tmp_path)
+
+    assert restarted.keys_with_prefix("") == []
+    assert restarted.get("a") is None
+    assert restarted.size == 0
+
+
+def test_corrupt_file_discarded(tmp_path):
+    """Test that an entry whose file cannot be decompressed is discarded as a miss."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    blob_files(tmp_path)[0].write_bytes(b"not compressed")
+
+    assert cache.get("a") is None
+    assert cache.keys_with_prefix("") == []
+    cache.sweep()
+    assert cache.size == 0
+
+
+@pytest.mark.parametrize("entry", ["not json", '["digest"]', "[]"])
+def test_corrupt_entry_discarded(tmp_path, entry):
+    """Test that an unreadable entry is a miss, and is removed rather than failing."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    cache.set("b", VALUE)
+    (entry_path,) = tmp_path.rglob(f"a{disk_cache.ENTRY_SUFFIX}")
+    entry_path.write_text(entry)
+
+    assert cache.get("a") is None
+    assert cache.keys_with_prefix("") == ["b"]
+    entry_path.write_text(entry)
+    assert make_cache(tmp_path).keys_with_prefix("") == ["b"]
+
+
+def test_shared_by_processes(tmp_path):
+    """Test that caches on the same directory share their entries, and the size cap applies to them together."""
+    values = {key: bytes(range(256)) * 4 + key.encode() for key in "abcd"}
+    entry_size = len(zlib.compress(values["a"], disk_cache.COMPRESSION_LEVEL))
+    first, second = (make_cache(tmp_path, max_bytes=3 * entry_size) for _ in range(2))
+
+    first.set("a", values["a"])
+    assert second.get("a") == values["a"]
+    assert second.delete("a") is True
+    assert first.get("a") is None
+
+    first.set("b", values["b"])
+    second.set("c", values["c"])
+    first.set("d", values["d"])
+    second.set("a", values["a"])
+
+    assert first.keys_with_prefix("") == second.keys_with_prefix("") != []
+    assert sum(path.stat().st_size for path in blob_files(tmp_path)) <= 3 * entry_size
+    assert second.get("b") is None
+
+
+def test_value_stored_again_after_another_process_deleted_its_file(tmp_path):
+    """Test that a value whose file another process deleted in a sweep is written again."""
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.set("a", VALUE)
+    second.delete("a")
+    assert blob_files(tmp_path) == []
+
+    first.set("b", VALUE)
+
+    assert second.get("b") == VALUE
+
+
+def test_sweep_skipped_while_another_process_holds_the_lock(tmp_path, clock):
+    """Test that a sweep is left to the process already sweeping, or to a later write, rather than waited for."""
+    cache = make_cache(tmp_path)
+    cache.set("a", VALUE)
+    clock.advance(60)
+    file_descriptor = os.open(tmp_path / LOCK_FILE_NAME, os.O_RDWR)
+    try:
+        fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+        cache.sweep()
+    finally:
+        os.close(file_descriptor)
+
+    assert cache.keys_with_prefix("") == ["a"]
+    cache.sweep()
+    assert cache.keys_with_prefix("") == []
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    """Test that a failed write removes its temporary file and raises."""
+    cache = make_cache(tmp_path)
+
+    def fail_replace(*_args):
+        raise OSError
+
+    monkeypatch.setattr(disk_cache.Path, "replace", fail_replace)
+
+    with pytest.raises(OSError):
+        cache.set("a", VALUE)
+    assert [path for path in tmp_path.rglob("*") if path.is_file() and path.name != LOCK_FILE_NAME] == []
+
+
+def test_delete_prefix(tmp_path):
+    """Test that entries are removed by key prefix, with an empty prefix removing every entry."""
+    cache = make_cache(tmp_path)
+    for key in ("a/1", "a/2", "b/1", "b/2/1"):
+        cache.set(key, key.encode())
+
+    assert sorted(cache.keys_with_prefix("b/")) == ["b/1", "b/2/1"]
+    assert cache.delete_prefix("a/") == 2
+    assert cache.delete_prefix("a/") == 0
+    assert make_cache(tmp_path).get("b/1") == b"b/1"
+    assert cache.delete_prefix("") == 2
+    assert blob_files(tmp_path) == []
+    assert not list(cache.entries_directory.iterdir())
+
+
+def test_keys_stay_in_the_entries_directory(tmp_path):
+    """Test that keys are quoted, so none can name a file outside the cache's entries directory."""
+    cache = make_cache(tmp_path / "cache")
+    keys = ["../outside", "a/../../outside", "conversion/id/sha256:1.0.0+build.1", "a/", ""]
+    for key in keys:
+        cache.set(key, key.encode())
+
+    assert sorted(cache.keys_with_prefix("")) == sorted(keys)
+    assert all(cache.get(key) == key.encode() for key in keys)
+    assert [path.name for path in tmp_path.iterdir()] == ["cache"]
+    assert all(path.is_relative_to(cache.entries_directory) for path in tmp_path.rglob(f"*{disk_cache.ENTRY_SUFFIX}"))
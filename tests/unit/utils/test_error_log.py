@@ -0,0 +1,69 @@
+"""Tests for rate-limited error event logging."""
+
+import logging
+
+import pytest
+
+from eq_cir_proxy_service.utils import error_log, metrics
+from eq_cir_proxy_service.utils.error_log import log_error_event
+
+
+class RecordingLogger:
+    """Logger double recording the events logged through it."""
+
+    def __init__(self):
+        """Initialise the logger without any records."""
+        self.records = []
+
+    def log(self, level, event, **fields):
+        """Record an event logged at a level."""
+        self.records.append((level, event, fields))
+
+    def warning(self, event, **fields):
+        """Record a warning."""
+        self.log(logging.WARNING, event, **fields)
+
+
+@pytest.fixture(name="logger", autouse=True)
+def fixture_logger(monkeypatch):
+    """Capture what is logged, with empty metrics and a small number of events per window."""
+    metrics.reset()
+    monkeypatch.setattr(error_log, "MAX_EVENTS_PER_WINDOW", 2)
+    recording_logger = RecordingLogger()
+    monkeypatch.setattr(error_log, "logger", recording_logger)
+    return recording_logger
+
+
+def test_events_beyond_the_limit_are_suppressed_and_summarised(logger, clock):
+    """Test that only the first events of a kind in a window are logged, and the rest are summarised afterwards."""
+    for version in ("a", "b", "c", "d"):
+        log_error_event("invalid_version", "Invalid version.", version=version)
+    log_error_event("invalid_fields", "Invalid fields parameter.", level=logging.WARNING, fields="")
+    clock.advance(error_log.WINDOW_SECONDS)
+    log_error_event("invalid_version", "Invalid version.", version="e")
+
+    assert logger.records == [
+        (logging.ERROR, "Invalid version.", {"kind": "invalid_version", "version": "a"}),
+        (logging.ERROR, "Invalid version.", {"kind": "invalid_version", "version": "b"}),
+        (logging.WARNING, "Invalid fields parameter.", {"kind": "invalid_fields", "fields": ""}),
+        (
+            logging.WARNING,
+            "Suppressed repeated error events.",
+            {"kind": "invalid_version", "suppressed": 2, "window_seconds": error_log.WINDOW_SECONDS},
+        ),
+        (logging.ERROR, "Invalid version.", {"kind": "invalid_version", "version": "e"}),
+    ]
+    counters = metrics.snapshot()["counters"]
+    assert counters['error_events_total{kind="invalid_version"}'] == 5
+    assert counters['error_events_total{kind="invalid_fields"}'] == 1
+
+
+@pytest.mark.usefixtures("clock")
+def test_reset(logger):
+    """Test that resetting forgets the windows, so the next event is logged."""
+    for _ in range(3):
+        log_error_event("invalid_version", "Invalid version.")
+    error_log.reset()
+    log_error_event("invalid_version", "Invalid version.")
+
+    assert len(logger.records) == 3
@@ -1,72 +1,105 @@
 """Tests for the IAP utility functions."""
 
+import google.oauth2.id_token
 import pytest
+import pytest_asyncio
+from google.auth import exceptions
 
+from eq_cir_proxy_service.config.settings import PoolSettings, Settings, UpstreamSettings
 from eq_cir_proxy_service.utils import iap
 
 
+@pytest_asyncio.fixture(autouse=True)
+async def close_pooled_clients():
+    """Start and finish every test without pooled clients or cached tokens."""
+    await iap.close_api_clients()
+    yield
+    await iap.close_api_clients()
+
+
+def make_upstream(**overrides) -> UpstreamSettings:
+    """Build upstream settings for a local service without IAP."""
+    options = {"name": "test", "base_urls": ("https://localhost:1234",), "endpoint": "/"} | overrides
+    return UpstreamSettings(**options)
+
+
 def test_get_iap_token_success(monkeypatch):
     """Test that get_iap_token successfully fetches a token."""
-    monkeypatch.setattr(iap.google.oauth2.id_token, "fetch_id_token", lambda *_: "fake-token")
+    monkeypatch.setattr(google.oauth2.id_token, "fetch_id_token", lambda *_: "fake-token")
     assert iap.get_iap_token("fake-audience") == "fake-token"
 
 
 def test_get_iap_token_failure(monkeypatch):
     """Test that get_iap_token raises RuntimeError when token fetch fails."""
-    monkeypatch.setattr(iap.google.oauth2.id_token, "fetch_id_token", lambda *_: None)
+    monkeypatch.setattr(google.oauth2.id_token, "fetch_id_token", lambda *_: None)
     with pytest.raises(RuntimeError, match="Failed to fetch IAP token"):
         iap.get_iap_token("fake-audience")
 
 
-@pytest.mark.asyncio
-async def test_get_api_client_missing_iap_env(monkeypatch):
-    """Test that get_api_client sets up the client with correct parameters for local with no iap_env."""
-    monkeypatch.setenv("URL_ENV", "https://localhost:1234")
-    monkeypatch.delenv("IAP_ENV", raising=False)  # Ensure IAP_ENV is not set
-    async with iap.get_api_client(url_env="URL_ENV", iap_env="IAP_ENV") as client:
-        assert client.base_url.host == "localhost"
+def test_verify_id_token(monkeypatch):
+    """Test that verify_id_token returns the claims of a token verified for the audience."""
+    calls = []
+    monkeypatch.setattr(
+        google.oauth2.id_token,
+        "verify_oauth2_token",
+        lambda token, _, audience: calls.append((token, audience)) or {"email": "push@example.com"},
+    )
+
+    assert iap.verify_id_token("token", "fake-audience") == {"email": "push@example.com"}
+    assert calls == [("token", "fake-audience")]
+
+
+def test_verify_id_token_wrong_issuer(monkeypatch):
+    """Test that verify_id_token raises ValueError for a token from another issuer."""
+
+    def verify_oauth2_token(*_):
+        error_message = "Wrong issuer."
+        raise exceptions.GoogleAuthError(error_message)
+
+    monkeypatch.setattr(google.oauth2.id_token, "verify_oauth2_token", verify_oauth2_token)
+    with pytest.raises(ValueError, match="Wrong issuer"):
+        iap.verify_id_token("token", "fake-audience")
+
+
+def test_verify_id_token_transport_error(monkeypatch):
+    """Test that verify_id_token lets failures to fetch Google's signing keys propagate."""
+
+    def verify_oauth2_token(*_):
+        error_message = "Could not fetch certificates."
+        raise exceptions.TransportError(error_message)
+
+    monkeypatch.setattr(google.oauth2.id_token, "verify_oauth2_token", verify_oauth2_token)
+    with pytest.raises(exceptions.TransportError):
+        iap.verify_id_token("token", "fake-audience")
 
 
 @pytest.mark.asyncio
-async def test_get_api_client_empty_iap_env(monkeypatch):
-    """Test that get_api_client sets up the client with correct parameters for local with empty iap_env."""
-    monkeypatch.setenv("URL_ENV", "https://localhost:1234")
-    monkeypatch.setenv("IAP_ENV", "")
-    async with iap.get_api_client(url_env="URL_ENV", iap_env="IAP_ENV") as client:
+async def test_get_api_client_without_iap():
+    """Test that get_api_client sets up a local client with no Authorization header when there is no IAP client ID."""
+    async with iap.get_api_client(make_upstream()) as client:
         assert client.base_url.host == "localhost"
+        assert "Authorization" not in client.headers
 
 
 @pytest.mark.asyncio
 async def test_get_api_client_gcp(monkeypatch):
     """Test that get_api_client sets up the client with correct parameters for GCP."""
-    monkeypatch.setenv("URL_ENV", "https://example.com")
-    monkeypatch.setenv("IAP_ENV", "fake-audience")
-
     monkeypatch.setattr(iap, "get_iap_token", lambda _: "fake-token")
 
-    async with iap.get_api_client(url_env="URL_ENV", iap_env="IAP_ENV") as client:
+    upstream = make_upstream(base_urls=("https://example.com",), iap_client_id="fake-audience")
+
+    async with iap.get_api_client(upstream) as client:
         assert client.base_url.host == "example.com"
         assert client.headers["Authorization"] == "Bearer fake-token"
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize(
-    "url_env, iap_env",
-    [
-        # get_cir_client
-        ("CIR_API_BASE_URL", "CIR_IAP_CLIENT_ID"),
-        # get_converter_service_client
-        (
-            "CONVERTER_SERVICE_API_BASE_URL",
-            "CONVERTER_SERVICE_IAP_CLIENT_ID",
-        ),
-    ],
-)
-async def test_get_client(url_env, iap_env, monkeypatch):
-    """Test the get_converter_service_client function."""
+@pytest.mark.parametrize("upstream_name", ["cir", "converter_service"])
+async def test_get_client(upstream_name, settings, monkeypatch):
+    """Test that get_api_client is called with the upstream's settings."""
     called_args = {}
 
-    def fake_api_client(url_env, iap_env):  # pylint: disable=unused-argument
+    def fake_api_client(upstream):  # pylint: disable=unused-argument
         called_args.update(locals())
 
         class FakeClient:
@@ -81,29 +114,90 @@ async def test_get_client(url_env, iap_env, monkeypatch):
         return FakeClient()
 
     monkeypatch.setattr(iap, "get_api_client", fake_api_client)
+    upstream = getattr(settings, upstream_name)
 
-    async with iap.get_api_client(url_env=url_env, iap_env=iap_env) as client:
+    async with iap.get_api_client(upstream) as client:
         assert client == "fake-client"
 
-    assert called_args["url_env"] == url_env
-    assert called_args["iap_env"] == iap_env
+    assert called_args["upstream"] is upstream
 
 
 @pytest.mark.asyncio
-async def test_get_api_client_gcp_missing_url_env(monkeypatch):
-    """Test that get_api_client raises RuntimeError if url_env is missing or empty."""
-    monkeypatch.delenv("URL_ENV", raising=False)  # Ensure URL_ENV is not set
-    monkeypatch.setenv("IAP_ENV", "fake-audience")
-    with pytest.raises(RuntimeError, match="Missing or empty environment variable: URL_ENV"):
-        async with iap.get_api_client(url_env="URL_ENV", iap_env="IAP_ENV"):
-            pass
+async def test_get_api_client_reuses_pooled_client():
+    """Test that the same pooled client is returned for repeated requests to the same upstream."""
+    async with iap.get_api_client(make_upstream()) as first:
+        pass
+    async with iap.get_api_client(make_upstream()) as second:
+        pass
+
+    assert first is second
+    assert not first.is_closed
+
+
+@pytest.mark.asyncio
+async def test_get_api_client_pool_limits():
+    """Test that pooled clients are created with the configured connection pool limits."""
+    upstream = make_upstream(pool=PoolSettings(max_connections=7, max_keepalive_connections=3))
+
+    async with iap.get_api_client(upstream) as client:
+        pool = client._transport._pool  # pylint: disable=protected-access # noqa: SLF001
+
+    assert pool._max_connections == 7  # pylint: disable=protected-access # noqa: SLF001
+    assert pool._max_keepalive_connections == 3  # pylint: disable=protected-access # noqa: SLF001
+
+
+@pytest.mark.asyncio
+async def test_iap_token_is_cached_until_stale(monkeypatch):
+    """Test that IAP tokens are fetched once and refreshed only after the TTL."""
+    upstream = make_upstream(base_urls=("https://example.com",), iap_client_id="fake-audience")
+    fetched = []
+
+    def fake_get_iap_token(audience):
+        fetched.append(audience)
+        return f"token-{len(fetched)}"
+
+    clock = {"now": 0.0}
+    monkeypatch.setattr(iap, "get_iap_token", fake_get_iap_token)
+    monkeypatch.setattr(iap.time, "monotonic", lambda: clock["now"])
+
+    async with iap.get_api_client(upstream) as client:
+        assert client.headers["Authorization"] == "Bearer token-1"
+    async with iap.get_api_client(upstream) as client:
+        assert client.headers["Authorization"] == "Bearer token-1"
+
+    assert iap.iap_token_age("fake-audience") == 0.0
+    assert iap.iap_token_age("other-audience") is None
+    clock["now"] += iap.IAP_TOKEN_TTL_SECONDS
+    async with iap.get_api_client(upstream) as client:
+        assert client.headers["Authorization"] == "Bearer token-2"
+
+    assert fetched == ["fake-audience", "fake-audience"]
+
+
+@pytest.mark.asyncio
+async def test_close_api_clients():
+    """Test that close_api_clients closes pooled clients so the next request gets a new one."""
+    async with iap.get_api_client(make_upstream()) as first:
+        pass
+    await iap.close_api_clients()
+    async with iap.get_api_client(make_upstream()) as second:
+        pass
+
+    assert first.is_closed
+    assert second is not first
 
 
 @pytest.mark.asyncio
-async def test_get_api_client_gcp_empty_url_env(monkeypatch):
-    """Test that get_api_client raises RuntimeError if url_env is set but empty."""
-    monkeypatch.setenv("URL_ENV", "")
-    monkeypatch.setenv("IAP_ENV", "fake-audience")
-    with pytest.raises(RuntimeError, match="Missing or empty environment variable: URL_ENV"):
-        async with iap.get_api_client(url_env="URL_ENV", iap_env="IAP_ENV"):
-            pass
+@pytest.mark.parametrize("iap_client_id, expected_imports", [("fake-audience", 1), (None, 0)])
+async def test_preload_iap_dependencies(iap_client_id, expected_imports, monkeypatch):
+    """Test that google-auth is imported at startup only when an IAP client ID is configured."""
+    imported = []
+    settings = Settings(
+        cir=make_upstream(),
+        converter_service=make_upstream(iap_client_id=iap_client_id),
+    )
+    monkeypatch.setattr(iap.importlib, "import_module", imported.append)
+
+    await iap.preload_iap_dependencies(settings)
+
+    assert len(imported) == expected_imports
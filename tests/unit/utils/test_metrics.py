@@ -0,0 +1,45 @@
+"""Tests for the in-process metrics registry."""
+
+import pytest
+
+from eq_cir_proxy_service.utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Start every test with an empty registry."""
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_increment_counter():
+    """Test that counters accumulate increments."""
+    metrics.increment("requests_total")
+    metrics.increment("requests_total", 2)
+
+    assert metrics.snapshot()["counters"] == {"requests_total": 3}
+
+
+def test_labels_are_rendered_in_sorted_order():
+    """Test that labelled metrics get a stable Prometheus-style key."""
+    metrics.increment("rejected_total", labels={"reason": "queue_full", "limiter": "instrument"})
+
+    assert metrics.snapshot()["counters"] == {'rejected_total{limiter="instrument",reason="queue_full"}': 1}
+
+
+def test_set_gauge_overwrites():
+    """Test that gauges hold the last value set."""
+    metrics.set_gauge("queue_depth", 5)
+    metrics.set_gauge("queue_depth", 2)
+
+    assert metrics.snapshot()["gauges"] == {"queue_depth": 2}
+
+
+def test_snapshot_is_a_copy():
+    """Test that mutating a snapshot does not affect the registry."""
+    metrics.increment("requests_total")
+    snapshot = metrics.snapshot()
+    snapshot["counters"]["requests_total"] = 100
+
+    assert metrics.snapshot()["counters"]["requests_total"] == 1
@@ -0,0 +1,146 @@
+"""Tests for the sampling profiler and per-request profiles."""
+
+import asyncio
+import pstats
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from eq_cir_proxy_service.utils import profiling
+from eq_cir_proxy_service.utils.profiling import ProfilerBusyError, ProfilingMiddleware
+
+ADMIN_TOKEN = "test-admin-token"  # noqa: S105
+PROFILE_HEADERS = {"X-Profile": "true", "X-Admin-Token": ADMIN_TOKEN}
+
+app = FastAPI()
+app.add_middleware(ProfilingMiddleware)
+
+
+@app.get("/work")
+async def work() -> dict:
+    """Route whose function should appear in request profiles."""
+    return {"total": sum(range(1000))}
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(name="request_profiles", autouse=True)
+def fixture_request_profiles(monkeypatch):
+    """Enable profiling with an admin token, starting every test without request profiles."""
+    monkeypatch.setenv("PROFILING_ENABLED", "true")
+    monkeypatch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+    profiles = OrderedDict()
+    monkeypatch.setattr(profiling, "_request_profiles", profiles)
+    return profiles
+
+
+def busy_loop(stop: threading.Event) -> None:
+    """Keeps a thread busy until told to stop."""
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+def test_sample_stacks():
+    """Test that the stacks of other threads are sampled, and exported as speedscope and collapsed stacks."""
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    thread.start()
+    try:
+        profile = profiling.sample_stacks(duration=0.05, interval=0.005)
+    finally:
+        stop.set()
+        thread.join()
+
+    busy_stacks = [stack for (name, stack), _count in profile.stacks.items() if name == "busy"]
+    assert any("busy_loop" in [frame[0] for frame in stack] for stack in busy_stacks)
+    assert 0.04 <= profile.duration < 1
+
+    speedscope = profile.to_speedscope()
+    frames = speedscope["shared"]["frames"]
+    (busy_profile,) = [thread for thread in speedscope["profiles"] if thread["name"] == "busy"]
+    assert busy_profile["type"] == "sampled"
+    assert len(busy_profile["samples"]) == len(busy_profile["weights"])
+    assert "busy_loop" in {frames[index]["name"] for sample in busy_profile["samples"] for index in sample}
+
+    collapsed = profile.to_collapsed().splitlines()
+    assert any(line.startswith("busy;") and "busy_loop" in line for line in collapsed)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed)
+
+
+@pytest.mark.asyncio
+async def test_capture_sampled_profile_one_at_a_time():
+    """Test that a second sampling profile cannot be captured while one is in progress."""
+    first, second = await asyncio.gather(
+        profiling.capture_sampled_profile(0.05, 0.01),
+        profiling.capture_sampled_profile(0.05, 0.01),
+        return_exceptions=True,
+    )
+
+    assert isinstance(first, profiling.SampledProfile)
+    assert isinstance(second, ProfilerBusyError)
+    assert isinstance(await profiling.capture_sampled_profile(0.01, 0.01), profiling.SampledProfile)
+
+
+def test_request_profile(tmp_path):
+    """Test that a request sending the profile header with the admin token is profiled and can be downloaded."""
+    response = client.get("/work", headers=PROFILE_HEADERS)
+
+    assert response.status_code == 200
+    profile = profiling.get_request_profile(response.headers["X-Profile-Id"])
+    assert profile is not None
+    assert "work" in profiling.format_request_profile(profile)
+    (tmp_path / "request.pstats").write_bytes(profiling.dump_request_profile(profile))
+    assert any(function[2] == "work" for function in pstats.Stats(str(tmp_path / "request.pstats")).stats)
+
+
+@pytest.mark.parametrize(
+    "headers, environment",
+    [
+        ({"X-Profile": "true"}, {}),
+        ({"X-Profile": "true", "X-Admin-Token": "wrong"}, {}),
+        ({"X-Admin-Token": ADMIN_TOKEN}, {}),
+        (PROFILE_HEADERS, {"PROFILING_ENABLED": "false"}),
+    ],
+)
+def test_request_not_profiled(headers, environment, monkeypatch, request_profiles):
+    """Test that requests are only profiled with the header, a valid admin token and profiling enabled."""
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+
+    response = client.get("/work", headers=headers)
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert not request_profiles
+
+
+def test_request_not_profiled_when_another_profiler_is_active(monkeypatch):
+    """Test that a request is still served, without a profile, when a profiler cannot be started."""
+
+    def enable():
+        error_message = "Another profiling tool is already active"
+        raise ValueError(error_message)
+
+    monkeypatch.setattr(profiling, "cProfile", SimpleNamespace(Profile=lambda: SimpleNamespace(enable=enable)))
+
+    response = client.get("/work", headers=PROFILE_HEADERS)
+
+    assert response.json() == {"total": 499500}
+    assert "X-Profile-Id" not in response.headers
+    assert client.get("/work", headers=PROFILE_HEADERS).status_code == 200
+
+
+def test_only_recent_request_profiles_kept(monkeypatch):
+    """Test that only the most recent request profiles are kept."""
+    monkeypatch.setattr(profiling, "MAX_REQUEST_PROFILES", 1)
+
+    first = client.get("/work", headers=PROFILE_HEADERS).headers["X-Profile-Id"]
+    second = client.get("/work", headers=PROFILE_HEADERS).headers["X-Profile-Id"]
+
+    assert profiling.get_request_profile(first) is None
+    assert profiling.get_request_profile(second) is not None
@@ -0,0 +1,183 @@
+"""Tests for per-client token bucket rate limiting."""
+
+from dataclasses import replace
+from types import SimpleNamespace
+
+import pytest
+
+from eq_cir_proxy_service.config.settings import RateLimitQuota
+from eq_cir_proxy_service.utils import metrics, rate_limit
+from eq_cir_proxy_service.utils.rate_limit import (
+    InProcessBuckets,
+    RateLimiter,
+    RateLimitExceededError,
+    RedisBuckets,
+    client_identity,
+    get_rate_limiter,
+)
+
+QUOTA = RateLimitQuota(requests_per_second=2.0, burst=2)
+
+
+class FakeRedisError(Exception):
+    """Error raised by the fake Redis client."""
+
+
+class FakeRedis:
+    """Redis client double that records script calls and returns a fixed wait."""
+
+    def __init__(self, reply=b"0"):
+        """Initialise the client with the reply to every script call, or an exception to raise."""
+        self.reply = reply
+        self.calls = []
+        self.closed = False
+
+    async def eval(self, *args):
+        """Record the call and return the reply."""
+        self.calls.append(args)
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+    async def aclose(self):
+        """Record that the client was closed."""
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Start every test with empty metrics."""
+    metrics.reset()
+
+
+@pytest.mark.asyncio
+async def test_in_process_bucket_allows_burst_then_refills(clock):
+    """Test that a client can use its burst at once, then gets tokens back at its rate."""
+    buckets = InProcessBuckets(max_clients=10)
+
+    assert [await buckets.take("a", QUOTA) for _ in range(3)] == [0.0, 0.0, 0.5]
+    clock.advance(0.5)
+    assert await buckets.take("a", QUOTA) == 0.0
+    assert await buckets.take("b", QUOTA) == 0.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("clock")
+async def test_in_process_buckets_forget_least_recent_clients():
+    """Test that only the most recently seen clients' buckets are kept, a forgotten client starting afresh."""
+    buckets = InProcessBuckets(max_clients=1)
+    await buckets.take("a", QUOTA)
+    await buckets.take("a", QUOTA)
+    await buckets.take("b", QUOTA)
+
+    assert await buckets.take("a", QUOTA) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_quotas_and_metrics():
+    """Test that clients get their own quota, else the default, and are counted per client and result."""
+    limiter = RateLimiter(
+        InProcessBuckets(max_clients=10),
+        default_quota=RateLimitQuota(requests_per_second=0.5, burst=1),
+        client_quotas={"runner": QUOTA},
+    )
+
+    await limiter.check("runner")
+    await limiter.check("runner")
+    await limiter.check("anonymous")
+    with pytest.raises(RateLimitExceededError) as exc_info:
+        await limiter.check("anonymous")
+
+    assert exc_info.value.retry_after == 2
+    counters = metrics.snapshot()["counters"]
+    assert counters['rate_limit_requests_total{client="runner",result="allowed"}'] == 2
+    assert counters['rate_limit_requests_total{client="anonymous",result="allowed"}'] == 1
+    assert counters['rate_limit_requests_total{client="anonymous",result="limited"}'] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_without_quota_counts_clients(monkeypatch):
+    """Test that clients without a quota are not limited, and share a label beyond the label limit."""
+    monkeypatch.setattr(rate_limit, "MAX_CLIENT_LABELS", 1)
+    limiter = RateLimiter(InProcessBuckets(max_clients=10), default_quota=None, client_quotas={})
+
+    for client in ("a", "a", "b", "c"):
+        await limiter.check(client)
+
+    counters = metrics.snapshot()["counters"]
+    assert counters['rate_limit_requests_total{client="a",result="allowed"}'] == 2
+    assert counters['rate_limit_requests_total{client="other",result="allowed"}'] == 2
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"X-Client-Id": "runner-v5", "X-Goog-Authenticated-User-Email": "accounts.google.com:a@b"}, "a@b"),
+        ({"X-Goog-Authenticated-User-Email": "accounts.google.com:runner@example.com"}, "runner@example.com"),
+        ({"X-Client-Id": "runner-v5", "X-Goog-Authenticated-User-Email": "accounts.google.com:gw@b"}, "runner-v5"),
+        ({"X-Goog-Authenticated-User-Email": "accounts.google.com:gw@b"}, "gw@b"),
+        ({"X-Client-Id": "runner-v5"}, "runner-v5"),
+        ({"X-Client-Id": " "}, "anonymous"),
+        ({}, "anonymous"),
+        ({"X-Client-Id": "x" * 500}, "x" * rate_limit.MAX_CLIENT_ID_LENGTH),
+    ],
+)
+def test_client_identity(headers, expected, settings):
+    """Test that the client is identified by its IAP principal, else its header, else as anonymous.
+
+    The header is only trusted from callers without a principal, or from trusted principals.
+    """
+    settings = replace(settings, client_id_trusted_principals=("gw@b",))
+    assert client_identity(headers, settings) == expected
+
+
+@pytest.mark.asyncio
+async def test_redis_buckets():
+    """Test that tokens are taken by a script in Redis, keyed by client."""
+    redis = FakeRedis(reply=b"0.25")
+    buckets = RedisBuckets(redis, fallback=InProcessBuckets(max_clients=10), errors=(FakeRedisError,))
+
+    assert await buckets.take("runner", QUOTA) == 0.25
+    assert redis.calls == [(rate_limit.REFILL_AND_TAKE_SCRIPT, 1, "eq-cir-proxy:rate-limit:runner", 2, 2.0)]
+    await buckets.aclose()
+    assert redis.closed
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("clock")
+async def test_redis_buckets_fall_back_when_unavailable():
+    """Test that the fallback buckets are used while Redis cannot be reached."""
+    fallback = InProcessBuckets(max_clients=10)
+    buckets = RedisBuckets(FakeRedis(reply=FakeRedisError("down")), fallback=fallback, errors=(FakeRedisError,))
+
+    assert [await buckets.take("runner", QUOTA) for _ in range(3)] == [0.0, 0.0, 0.5]
+    assert metrics.snapshot()["counters"]["rate_limit_backend_errors_total"] == 3
+
+
+def test_redis_buckets_require_redis_package(monkeypatch):
+    """Test that a Redis URL without the redis package installed is a clear error."""
+
+    def missing_module(_name):
+        raise ImportError
+
+    monkeypatch.setattr(rate_limit.importlib, "import_module", missing_module)
+
+    with pytest.raises(RuntimeError, match="redis package is not installed"):
+        RedisBuckets.from_url("redis://localhost", fallback=InProcessBuckets(max_clients=10))
+
+
+def test_get_rate_limiter_uses_settings(settings, monkeypatch):
+    """Test that the limiter takes its quotas from the settings and its buckets from Redis when configured."""
+    redis = FakeRedis()
+    fake_module = SimpleNamespace(from_url=lambda url: redis if url == "redis://cache" else None, RedisError=Exception)
+    monkeypatch.setattr(rate_limit.importlib, "import_module", lambda _name: fake_module)
+    settings = replace(settings, rate_limit=QUOTA, client_rate_limits=(("runner", QUOTA),))
+
+    limiter = get_rate_limiter(settings)
+    shared_limiter = get_rate_limiter(replace(settings, rate_limit_redis_url="redis://cache"))
+
+    assert limiter is get_rate_limiter(settings)
+    assert isinstance(limiter.buckets, InProcessBuckets)
+    assert (limiter.default_quota, limiter.client_quotas) == (QUOTA, {"runner": QUOTA})
+    assert isinstance(shared_limiter.buckets, RedisBuckets)
+    assert shared_limiter.buckets.client is redis
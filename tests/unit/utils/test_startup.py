@@ -0,0 +1,54 @@
+"""Tests for the cold-start import-time report."""
+
+import subprocess
+
+from eq_cir_proxy_service.utils import startup
+from eq_cir_proxy_service.utils.startup import (
+    ImportTiming,
+    format_startup_report,
+    parse_import_times,
+)
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:      2000 |       2000 |     fastapi.params
+import time:      3000 |       5000 |   fastapi
+import time:       500 |        500 | semver
+something unrelated
+"""
+
+
+def test_parse_import_times_groups_by_package():
+    """Test that module self times are summed per top-level package, slowest first."""
+    assert parse_import_times(IMPORTTIME_OUTPUT) == [
+        ImportTiming("fastapi", 0.005),
+        ImportTiming("semver", 0.0005),
+        ImportTiming("_io", 0.0001),
+    ]
+
+
+def test_format_startup_report():
+    """Test that the report shows the total and each package's share."""
+    report = format_startup_report([ImportTiming("fastapi", 0.075), ImportTiming("semver", 0.025)], limit=1)
+
+    assert report.splitlines()[0] == "Total import time: 100.0 ms"
+    assert "fastapi" in report
+    assert "75.0%" in report
+    assert "semver" not in report
+
+
+def test_measure_import_times_runs_fresh_interpreter(monkeypatch):
+    """Test that import times are measured in a separate interpreter with -X importtime."""
+    commands = []
+
+    def fake_run(command, **_kwargs):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, stdout="", stderr=IMPORTTIME_OUTPUT)
+
+    monkeypatch.setattr(startup.subprocess, "run", fake_run)
+
+    timings = startup.measure_import_times()
+
+    assert commands[0][1:] == ["-X", "importtime", "-c", "import eq_cir_proxy_service.main"]
+    assert timings[0].package == "fastapi"
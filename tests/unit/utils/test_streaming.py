@@ -0,0 +1,58 @@
+"""Tests for the bounded response body reader."""
+
+import httpx
+import pytest
+
+from eq_cir_proxy_service.utils.streaming import (
+    PayloadTooLargeError,
+    read_body,
+)
+
+
+async def chunked(*chunks: bytes):
+    """Yield the given chunks as a streamed body without a Content-Length."""
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_read_body_within_limit():
+    """Test that a body within the limit is returned in full."""
+    response = httpx.Response(200, content=chunked(b"abc", b"def"))
+
+    assert await read_body(response, 6) == b"abcdef"
+
+
+@pytest.mark.asyncio
+async def test_read_body_rejects_declared_length_without_reading():
+    """Test that an oversized Content-Length is rejected before the body is streamed."""
+
+    async def unreadable():
+        pytest.fail("The body should not be read")
+        yield b""  # pragma: no cover
+
+    response = httpx.Response(200, headers={"Content-Length": "100"}, content=unreadable())
+
+    with pytest.raises(PayloadTooLargeError) as exc_info:
+        await read_body(response, 10)
+
+    assert (exc_info.value.size, exc_info.value.max_bytes) == (100, 10)
+
+
+@pytest.mark.asyncio
+async def test_read_body_rejects_while_streaming():
+    """Test that a body without a Content-Length is rejected once it crosses the limit."""
+    response = httpx.Response(200, content=chunked(b"12345", b"67890", b"never-read"))
+
+    with pytest.raises(PayloadTooLargeError) as exc_info:
+        await read_body(response, 8)
+
+    assert exc_info.value.size == 10
+
+
+@pytest.mark.asyncio
+async def test_read_body_truncates():
+    """Test that truncate returns the start of an oversized body instead of raising."""
+    response = httpx.Response(500, content=b"x" * 100)
+
+    assert await read_body(response, 10, truncate=True) == b"x" * 10
@@ -0,0 +1,139 @@
+"""Tests for recording anonymised traffic."""
+
+from uuid import UUID, uuid4
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from eq_cir_proxy_service.config.settings import get_settings
+from eq_cir_proxy_service.utils import traffic_recording
+from eq_cir_proxy_service.utils.traffic_recording import (
+    RecordedRequest,
+    TrafficRecorder,
+    TrafficRecordingMiddleware,
+    get_traffic_recorder,
+    read_recording,
+)
+
+app = FastAPI()
+app.add_middleware(TrafficRecordingMiddleware)
+
+
+@app.get("/instrument/{instrument_id}")
+async def instrument(instrument_id: str) -> dict:
+    """Instrument route."""
+    return {"instrument_id": instrument_id}
+
+
+@app.get("/instrument/{instrument_id}/metadata")
+async def metadata(instrument_id: str) -> dict:
+    """Instrument metadata route."""
+    return {"instrument_id": instrument_id}
+
+
+@app.get("/instrument/jobs/{job_id}")
+async def job(job_id: str) -> dict:
+    """Job status route, which is not recorded."""
+    return {"job_id": job_id}
+
+
+@app.get("/status")
+async def probe() -> dict:
+    """Probe route, which is not recorded."""
+    return {"status": "OK"}
+
+
+def make_request(instrument_id: str | None = None, status: int = 200) -> RecordedRequest:
+    """Builds a recorded request."""
+    return RecordedRequest(1.0, "GET", "/instrument/{instrument_id}", instrument_id, "2.0.0", status, 5.0)
+
+
+@pytest.mark.asyncio
+async def test_instrument_requests_recorded_anonymously(monkeypatch, tmp_path):
+    """Test that requests to instrument routes are recorded in arrival order, with anonymous instrument IDs."""
+    monkeypatch.setenv("TRAFFIC_RECORDING_DIR", str(tmp_path))
+    instrument_id, other_id = uuid4(), uuid4()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await client.get(f"/instrument/{instrument_id}", params={"version": "2.0.0"})
+        await client.get(f"/instrument/{str(instrument_id).upper()}/metadata")
+        await client.get(f"/instrument/{other_id}", params={"version": "3.0.0"})
+        await client.get("/instrument/not-a-uuid", params={"version": "2.0.0"})
+        await client.get("/instrument/jobs/job-id")
+        await client.get("/status")
+        await client.get("/not-a-route")
+    recorder = get_traffic_recorder(get_settings())
+    assert recorder is not None
+    await recorder.aclose()
+
+    requests = read_recording(recorder.path)
+    assert [(request.route, request.version, request.status) for request in requests] == [
+        ("/instrument/{instrument_id}", "2.0.0", 200),
+        ("/instrument/{instrument_id}/metadata", None, 200),
+        ("/instrument/{instrument_id}", "3.0.0", 200),
+        ("/instrument/{instrument_id}", "2.0.0", 200),
+    ]
+    anonymous_ids = [request.instrument_id for request in requests]
+    assert anonymous_ids[0] == anonymous_ids[1] != anonymous_ids[2]
+    assert UUID(anonymous_ids[0]) not in {instrument_id, other_id}
+    assert anonymous_ids[3] is None
+    assert str(instrument_id) not in recorder.path.read_text(encoding="utf-8")
+    assert all(request.duration_ms >= 0 for request in requests)
+    assert [request.offset_ms for request in requests] == sorted(request.offset_ms for request in requests)
+
+
+def test_not_recorded_by_default(settings):
+    """Test that traffic is only recorded when a recording directory is configured."""
+    assert get_traffic_recorder(settings) is None
+
+
+def test_anonymisation_key_not_stored(tmp_path):
+    """Test that each recorder keeps its key to itself, writing nothing but its recording to the directory."""
+    instrument_id = str(uuid4())
+
+    first = TrafficRecorder(tmp_path, max_requests=10)
+    second = TrafficRecorder(tmp_path, max_requests=10)
+
+    assert first.anonymise(instrument_id) == first.anonymise(instrument_id) != second.anonymise(instrument_id)
+    assert sorted(tmp_path.iterdir()) == sorted([first.path, second.path])
+
+
+@pytest.mark.asyncio
+async def test_recording_written_in_batches_until_maximum(monkeypatch, tmp_path):
+    """Test that requests are written a batch at a time, and recording stops at the maximum number of requests."""
+    monkeypatch.setattr(traffic_recording, "BATCH_SIZE", 2)
+    recorder = TrafficRecorder(tmp_path, max_requests=3)
+
+    recorder.record(make_request(status=200))
+    recorder.record(make_request(status=201))
+    await recorder.aclose()
+    assert len(read_recording(recorder.path)) == 2
+
+    recorder.record(make_request(status=202))
+    recorder.record(make_request(status=203))
+    await recorder.aclose()
+
+    assert [request.status for request in read_recording(recorder.path)] == [200, 201, 202]
+    assert recorder.recorded == 3
+
+
+@pytest.mark.asyncio
+async def test_recording_write_failure(tmp_path):
+    """Test that a failure to write the recording is logged rather than raised."""
+    recorder = TrafficRecorder(tmp_path, max_requests=3)
+    recorder.path = tmp_path / "missing" / "traffic.jsonl"
+
+    recorder.record(make_request())
+    await recorder.aclose()
+
+    assert not recorder.path.exists()
+
+
+def test_read_recording_rejects_other_files(tmp_path):
+    """Test that files that are not traffic recordings are rejected."""
+    path = tmp_path / "other.jsonl"
+    path.write_text('{"format": "other"}\n', encoding="utf-8")
+
+    with pytest.raises(ValueError, match="is not a traffic recording"):
+        read_recording(path)
@@ -0,0 +1,83 @@
+"""Tests for the memoized version parsing utilities."""
+
+import pytest
+from semver import Version
+
+from eq_cir_proxy_service.utils import version as version_utils
+from eq_cir_proxy_service.utils.version import (
+    VERSION_CACHE_SIZE,
+    is_valid_version,
+    parse_version,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_version_cache():
+    """Start every test with an empty version cache."""
+    parse_version.cache_clear()
+    yield
+    parse_version.cache_clear()
+
+
+def test_parse_version_returns_version():
+    """Test that parse_version returns the parsed semver Version."""
+    assert parse_version("1.2.3") == Version(1, 2, 3)
+
+
+def test_parse_version_is_memoized(monkeypatch):
+    """Test that repeated parses of the same string only hit the semver parser once."""
+    calls = []
+    real_parse = Version.parse
+
+    def counting_parse(version):
+        calls.append(version)
+        return real_parse(version)
+
+    monkeypatch.setattr(version_utils.Version, "parse", counting_parse)
+
+    first = parse_version("2.0.0")
+    second = parse_version("2.0.0")
+
+    assert first is second
+    assert calls == ["2.0.0"]
+    assert parse_version.cache_info().hits == 1
+
+
+def test_parse_version_invalid_is_not_cached():
+    """Test that invalid versions raise and are not stored in the cache."""
+    with pytest.raises(ValueError, match="not valid SemVer string"):
+        parse_version("a.b.c")
+
+    assert parse_version.cache_info().currsize == 0
+
+
+def test_parse_version_cache_is_bounded():
+    """Test that the cache never grows beyond its configured size."""
+    for patch in range(VERSION_CACHE_SIZE * 2):
+        parse_version(f"1.0.{patch}")
+
+    assert parse_version.cache_info().currsize == VERSION_CACHE_SIZE
+
+
+@pytest.mark.parametrize(
+    "version, expected",
+    [
+        ("1.0.0", True),
+        ("10.20.30", True),
+        ("1.0", False),
+        ("01.0.0", False),
+        ("", False),
+    ],
+)
+def test_is_valid_version(version, expected):
+    """Test that is_valid_version matches semver validity."""
+    assert is_valid_version(version) is expected
+
+
+def test_is_valid_version_warms_cache():
+    """Test that a successful validation leaves the version cached for the conversion service."""
+    is_valid_version("3.1.4")
+
+    parse_version("3.1.4")
+
+    assert parse_version.cache_info().hits == 1
@@ -0,0 +1,39 @@
+"""Unit tests for the structural validation of upstream instruments."""
+
+import pytest
+from fastapi import HTTPException
+
+from eq_cir_proxy_service.exceptions.exception_messages import EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT
+from eq_cir_proxy_service.services.validators.instrument import validate_instrument
+
+
+@pytest.mark.parametrize(
+    "instrument",
+    [
+        {"validator_version": "1.0.0", "title": "Title", "sections": [], "navigation": {}},
+        {"validator_version": "1.0.0", "unknown_field": 1},
+    ],
+)
+def test_validate_instrument_valid(instrument):
+    """Test that instruments with the required fields and correctly typed known fields are returned unchanged."""
+    assert validate_instrument(instrument, source="cir") is instrument
+
+
+@pytest.mark.parametrize(
+    "instrument",
+    [
+        [],
+        "instrument",
+        None,
+        {},
+        {"sections": []},
+        {"validator_version": 1},
+        {"validator_version": "1.0.0", "sections": {}},
+    ],
+)
+def test_validate_instrument_invalid(instrument):
+    """Test that non-objects, missing required fields and wrongly typed known fields are rejected with a 500."""
+    with pytest.raises(HTTPException) as exc_info:
+        validate_instrument(instrument, source="cir")
+    assert exc_info.value.status_code == 500
+    assert exc_info.value.detail["message"] == EXCEPTION_500_INVALID_UPSTREAM_INSTRUMENT
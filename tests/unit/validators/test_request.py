@@ -3,7 +3,7 @@
 import pytest
 from fastapi import HTTPException
 
-from eq_cir_proxy_service.services.validators.request import validate_version
+from eq_cir_proxy_service.services.validators.request import parse_fields, validate_version
 
 
 @pytest.mark.parametrize(
@@ -46,3 +46,24 @@ def test_validate_version_invalid(version):
         with pytest.raises(HTTPException) as exc_info:
             validate_version(version)
         assert exc_info.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "fields, expected",
+    [
+        (None, None),
+        ("title", ["title"]),
+        ("title, metadata,,title", ["title", "metadata"]),
+    ],
+)
+def test_parse_fields_valid(fields, expected):
+    """Test that parse_fields splits, trims and de-duplicates the requested fields."""
+    assert parse_fields(fields) == expected
+
+
+@pytest.mark.parametrize("fields", ["", " , "])
+def test_parse_fields_invalid(fields):
+    """Test that parse_fields raises HTTPException when no fields are named."""
+    with pytest.raises(HTTPException) as exc_info:
+        parse_fields(fields)
+    assert exc_info.value.status_code == 400